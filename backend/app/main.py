@@ -1,15 +1,75 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from app.services.parser import parse_file
-from app.services.embedder import generate_embeddings
-from app.services.vectorstore import store_in_chroma, get_chroma_collection
-from app.services.llm import run_llm_with_priority
+from typing import Callable, Dict, List, Optional, Tuple
+from app.services.parser import detect_file_type
+from app.services.embedder import encode_async, warm_up as warm_up_embedder
+from app.services.vectorstore import load_vector_store
+from app.services.retriever import retrieve_async, retrieve_batch_async
+from app.services.query_pipeline import extract_query_fields, structure_query, structured_queries, run_stages
+from app.services.llm import run_llm_with_priority_async, build_reasoning_prompt
+from app.services.response_parser import ResponseParser, parse_or_repair, repair_meter
+from app.services.providers import Prompt, ProviderError, get_router, is_rate_limit_error
+from app.services.context_packer import count_tokens
 from app.services.model_router import choose_model
+from app.services.executor import PoolSaturated, RateLimiter, shutdown_pools, embed_pool, io_pool
+from app.services.jobs import ingestion_queue
+from app.services.embedding_cache import get_embedding_cache
+from app.services.answer_cache import answer_key, get_answer_cache
+from app.services.metrics import MetricsMiddleware, observe_stage, render as render_metrics, start_profile
 import json
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") != "0"
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+# LLM calls made by /query/batch: in flight at once, started per minute (0 = unlimited), and seconds to
+# hold back new calls after a provider reports a rate limit
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+BATCH_LLM_PER_MINUTE = int(os.getenv("BATCH_LLM_PER_MINUTE", "0"))
+BATCH_RATE_LIMIT_BACKOFF = float(os.getenv("BATCH_RATE_LIMIT_BACKOFF", "10"))
+BATCH_LLM_RETRIES = 2
+
+logger = logging.getLogger("app")
+
+
+async def warm_up() -> dict:
+    # Model and index load in parallel on their own pools
+    async def timed(pool, fn):
+        start = time.perf_counter()
+        try:
+            result = await pool.run(fn)
+        except Exception as e:
+            logger.warning(f"Warm-up step {fn.__name__} failed: {e}")
+            return None, None
+        return result, round(time.perf_counter() - start, 3)
+
+    (_, model_seconds), (count, index_seconds) = await asyncio.gather(
+        timed(embed_pool, warm_up_embedder),
+        timed(io_pool, load_vector_store),
+    )
+    return {"model_load_seconds": model_seconds, "index_load_seconds": index_seconds, "indexed_chunks": count}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start = time.perf_counter()
+    app.state.startup_metrics = await warm_up() if WARMUP_ON_STARTUP else {}
+    await ingestion_queue.start()
+    app.state.startup_metrics["startup_seconds"] = round(time.perf_counter() - start, 3)
+    app.state.first_query_seconds = None
+    logger.info(f"Startup complete: {app.state.startup_metrics}")
+    yield
+    await ingestion_queue.stop()
+    shutdown_pools()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware for frontend integration
 app.add_middleware(
@@ -19,90 +79,348 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"]
 )
+app.add_middleware(MetricsMiddleware)
 
-# Placeholder for /upload route
-@app.post("/upload")
+# /upload queues an ingestion job and returns immediately; poll /jobs/{job_id} for progress
+@app.post("/upload", status_code=202)
 async def upload_file(file: UploadFile = File(...)):
-    file_bytes = await file.read()
     try:
-        chunks = parse_file(file_bytes, file.filename)
-        texts = [chunk["text"] for chunk in chunks]
-        embeddings = generate_embeddings(texts)
-        chunks_with_embeddings = []
-        for chunk, embedding in zip(chunks, embeddings):
-            chunk_with_embedding = chunk.copy()
-            chunk_with_embedding["embedding"] = embedding
-            chunks_with_embeddings.append(chunk_with_embedding)
-        store_in_chroma(chunks_with_embeddings)
-        return {"message": "File processed, embedded, and stored.", "num_chunks": len(chunks)}
+        detect_file_type(file.filename)
+        job_id = await ingestion_queue.submit(file.file, file.filename)
+        return {"message": "File queued for ingestion.", "job_id": job_id, "status": "queued"}
+    except PoolSaturated as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
     except Exception as e:
         return JSONResponse(status_code=400, content={"error": str(e)})
 
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = ingestion_queue.store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job id: {job_id}"})
+    return job
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "startup": app.state.startup_metrics,
+        "first_query_seconds": app.state.first_query_seconds,
+        "llm": get_router().stats(),
+        "llm_repair": repair_meter.stats(),
+    }
+
+
+# Prometheus scrape endpoint: stage latency histograms, LLM provider outcomes and tokens, cache and chunk counters
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    embedding_cache = get_embedding_cache()
+    answer_cache = get_answer_cache()
+    return {
+        "embedding": embedding_cache.stats() if embedding_cache else None,
+        "answer": answer_cache.stats() if answer_cache else None,
+    }
+
 # Request model for /query
 class QueryRequest(BaseModel):
     query: str
+    # Restrict retrieval to these uploaded files; by default the policy named in the query picks them
+    filenames: Optional[List[str]] = None
+    # Return a per-stage timing breakdown ({stage: {"calls", "ms"}}) under "profile"
+    profile: bool = False
 
-# Add a helper to safely parse and validate the LLM response
 
-def safe_parse_llm_response(response):
-    try:
-        data = json.loads(response)
-        # Ensure all required fields are present
-        for field in ["decision", "amount", "justification", "summary", "clauses_used", "confidence"]:
-            if field not in data:
-                raise ValueError("Missing field")
-        return data
-    except Exception:
-        # Fallback/default response
-        return {
-            "decision": "needs more info",
-            "amount": 0,
-            "justification": "The LLM response was incomplete or invalid. Manual review required.",
-            "clauses_used": [],
-            "summary": "Unable to determine decision automatically.",
-            "confidence": 0.0
-        }
+def retrieval_stages(request: QueryRequest) -> dict:
+    # Structuring (rule-based fast path, LLM fallback) and embedding run concurrently; retrieval waits
+    # for the policy filter unless filenames were given. Shared by /query and /query/stream.
+    async def structure(results):
+        return await structure_query(request.query)
+
+    async def embed(results):
+        return await encode_async([request.query])
+
+    async def retrieve(results):
+        structured_query = results["structure"][0] if "structure" in results else None
+        return await retrieve_async(request.query, results["embed"], n_results=5, structured_query=structured_query, filenames=request.filenames)
+
+    return {
+        "structure": ((), structure),
+        "embed": ((), embed),
+        "retrieve": (("embed",) if request.filenames else ("structure", "embed"), retrieve),
+    }
+
+
+def cached_answer(results: dict):
+    # Repeated claims with the same retrieved clauses reuse a cached decision (see answer_cache.py)
+    answer_cache = get_answer_cache()
+    if not answer_cache:
+        return None, None
+    return answer_cache.lookup(results["structure"][0], [hit["id"] for hit in results["retrieve"]], results["embed"])
+
+
+def remember_answer(results: dict, llm_response: dict):
+    answer_cache = get_answer_cache()
+    if answer_cache:
+        hits = results["retrieve"]
+        filenames = {hit["metadata"]["filename"] for hit in hits}
+        answer_cache.store(results["structure"][0], [hit["id"] for hit in hits], filenames, llm_response, results["embed"])
+
+
+def reasoning_prompt(query: str, results: dict) -> Tuple[Callable[[str], str], Dict[str, int]]:
+    # Prompt factory for the router: the clauses are packed to the budget of the provider each prompt is
+    # sent to. The dict fills with the token count of every prompt built, by provider.
+    retrieved_chunks = [{"text": hit["text"], "metadata": hit["metadata"]} for hit in results["retrieve"]]
+    prompt_tokens: Dict[str, int] = {}
+
+    def build(provider: str) -> str:
+        prompt = build_reasoning_prompt(results["structure"][0], retrieved_chunks, query=query, provider=provider)
+        prompt_tokens[provider] = count_tokens(prompt)
+        return prompt
+    return build, prompt_tokens
+
+
+def sent_prompt_tokens(prompt_tokens: Dict[str, int]) -> Optional[int]:
+    # A hedged or failed-over call sends more than one prompt; the largest is reported
+    return max(prompt_tokens.values(), default=None)
+
+
+def record_first_query(started: float):
+    if app.state.first_query_seconds is None:
+        app.state.first_query_seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"First query served in {app.state.first_query_seconds}s")
+
 
 # Placeholder for /query route
 @app.post("/query")
 async def process_query(request: QueryRequest):
+    started = time.perf_counter()
+    profile = start_profile() if request.profile else None
     try:
-        # 1. Parse/structure the query using LLM priority (OpenAI > Gemini > Ollama)
-        parsing_prompt = (
-            "Extract the following fields from the query and return as JSON: age, gender, procedure, location, policy_duration_months, policy_name, policy_id. "
-            "If a field is missing, use null. Query: " + request.query + "\nRespond in JSON only."
-        )
-        parsing_response = run_llm_with_priority(parsing_prompt)
-        try:
-            structured_query = json.loads(parsing_response)
-        except Exception:
-            structured_query = {"raw_query": request.query, "llm_parse": parsing_response}
-
-        # 2. Embed the query
-        query_embedding = generate_embeddings([request.query])[0]
-
-        # 3. Retrieve relevant chunks from ChromaDB
-        collection = get_chroma_collection()
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=5,
-            include=["documents", "metadatas"]
-        )
-        retrieved_chunks = [
-            {"text": doc, "metadata": meta}
-            for doc, meta in zip(results["documents"][0], results["metadatas"][0])
-        ]
-
-        # 4. Reasoning using LLM priority (OpenAI > Gemini > Ollama) with improved prompt
-        from app.services.llm import build_reasoning_prompt
-        reasoning_prompt = build_reasoning_prompt(structured_query, retrieved_chunks)
-        llm_response = run_llm_with_priority(reasoning_prompt)
-        llm_response = safe_parse_llm_response(llm_response)
-
-        return {
+        async def reason(results):
+            cached, tier = cached_answer(results)
+            if cached is not None:
+                return cached, tier, None
+            prompt, prompt_tokens = reasoning_prompt(request.query, results)
+            llm_response, valid = await parse_or_repair(await run_llm_with_priority_async(prompt))
+            if valid:
+                remember_answer(results, llm_response)
+            return llm_response, None, sent_prompt_tokens(prompt_tokens)
+
+        stages = retrieval_stages(request)
+        stages["reason"] = (("structure", "retrieve"), reason)
+        results, timings = await run_stages(stages)
+        structured_query, structure_source = results["structure"]
+        llm_response, answer_cache_hit, prompt_tokens = results["reason"]
+
+        record_first_query(started)
+        response = {
             "structured_query": structured_query,
-            "retrieved_chunks": retrieved_chunks,
-            "llm_response": llm_response
+            "structured_query_source": structure_source,
+            "retrieved_chunks": [{"text": hit["text"], "metadata": hit["metadata"]} for hit in results["retrieve"]],
+            "llm_response": llm_response,
+            "answer_cache": answer_cache_hit,
+            "prompt_tokens": prompt_tokens,
+            "timings": timings
         }
+        if profile is not None:
+            response["profile"] = profile
+        return response
+    except PoolSaturated as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
     except Exception as e:
-        return JSONResponse(status_code=400, content={"error": str(e)}) 
\ No newline at end of file
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Server-Sent Events variant of /query. Events, in order:
+#   retrieval  structured query, retrieved chunks and timings, as soon as retrieval finishes
+#   token      {"text": ...} LLM deltas from whichever provider answered first
+#   field      {"name": ..., "value": ...} each validated top-level field of the answer as it completes
+#   result     the final validated llm_response, answer_cache tier, prompt_tokens and timings (and profile if requested)
+#   error      {"error": ...} if the pipeline fails; the stream ends after it
+@app.post("/query/stream")
+async def process_query_stream(request: QueryRequest):
+    started = time.perf_counter()
+
+    async def events():
+        profile = start_profile() if request.profile else None
+        try:
+            results, timings = await run_stages(retrieval_stages(request))
+            structured_query, structure_source = results["structure"]
+            yield sse_event("retrieval", {
+                "structured_query": structured_query,
+                "structured_query_source": structure_source,
+                "retrieved_chunks": [{"text": hit["text"], "metadata": hit["metadata"]} for hit in results["retrieve"]],
+                "timings": timings,
+            })
+            reason_started = time.perf_counter()
+            llm_response, tier = cached_answer(results)
+            prompt_tokens = None
+            if llm_response is None:
+                prompt, sent = reasoning_prompt(request.query, results)
+                parser = ResponseParser()
+                raw = []
+                async for delta in get_router().stream(prompt):
+                    if "first_token_ms" not in timings:
+                        timings["first_token_ms"] = round((time.perf_counter() - reason_started) * 1000, 2)
+                    raw.append(delta)
+                    yield sse_event("token", {"text": delta})
+                    for name, value in parser.feed(delta):
+                        yield sse_event("field", {"name": name, "value": value})
+                llm_response = parser.finish()
+                prompt_tokens = sent_prompt_tokens(sent)
+                valid = parser.valid
+                if not valid:
+                    llm_response, valid = await parse_or_repair("".join(raw))
+                if valid:
+                    remember_answer(results, llm_response)
+            timings["reason_ms"] = round((time.perf_counter() - reason_started) * 1000, 2)
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            record_first_query(started)
+            observe_stage("reason", timings["reason_ms"] / 1000)
+            result = {"llm_response": llm_response, "answer_cache": tier, "prompt_tokens": prompt_tokens, "timings": timings}
+            if profile is not None:
+                result["profile"] = profile
+            yield sse_event("result", result)
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    filenames: Optional[List[str]] = None
+    # Add the stage timings of the whole batch to the final summary line
+    profile: bool = False
+
+
+batch_limiter = RateLimiter(BATCH_LLM_CONCURRENCY, BATCH_LLM_PER_MINUTE)
+
+
+async def batch_llm_call(prompt: Prompt) -> str:
+    # Rate-limited LLM call; a provider rate-limit error pauses every batch call and is retried
+    for attempt in range(BATCH_LLM_RETRIES + 1):
+        async with batch_limiter:
+            try:
+                return await get_router().complete(prompt)
+            except ProviderError as e:
+                if attempt == BATCH_LLM_RETRIES or not is_rate_limit_error(e):
+                    raise
+                logger.warning(f"LLM rate limited, backing off: {e}")
+                batch_limiter.backoff(BATCH_RATE_LIMIT_BACKOFF * (attempt + 1))
+
+
+async def batch_structure(query: str):
+    fields = extract_query_fields(query)
+    if fields is not None:
+        structured_queries.inc(source="rules")
+        return fields, "rules"
+    async with batch_limiter:
+        return await structure_query(query)
+
+
+# Bulk claim adjudication. Answers are streamed as NDJSON, one line per query in completion order:
+#   {"index": i, "query": ..., <the /query response fields>} or {"index": i, "query": ..., "error": ...}
+# followed by a final {"done": true, ...} summary line. Identical queries are answered once, all queries
+# are embedded in one encoder call and retrieved with one multi-vector search per document filter, and
+# queries that end up with the same structured query and clauses share one LLM call.
+@app.post("/query/batch")
+async def process_query_batch(request: BatchQueryRequest):
+    if not request.queries:
+        return JSONResponse(status_code=400, content={"error": "No queries given."})
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        return JSONResponse(status_code=400, content={"error": f"At most {BATCH_MAX_QUERIES} queries per batch."})
+    started = time.perf_counter()
+    normalized = [" ".join(query.split()) for query in request.queries]
+    unique = list(dict.fromkeys(normalized))
+    positions = {}
+    for index, query in enumerate(normalized):
+        positions.setdefault(query, []).append(index)
+
+    async def lines():
+        profile = start_profile() if request.profile else None
+        try:
+            embeddings, structured = await asyncio.gather(
+                encode_async(unique),
+                asyncio.gather(*(batch_structure(query) for query in unique)),
+            )
+            retrieved = await retrieve_batch_async(unique, embeddings, 5, [structured_query for structured_query, _ in structured], request.filenames)
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+            return
+        retrieval_ms = round((time.perf_counter() - started) * 1000, 2)
+        observe_stage("batch.retrieval", retrieval_ms / 1000)
+        shared: dict = {}
+        llm_calls = 0
+
+        async def answer(query: str, results: dict):
+            nonlocal llm_calls
+            llm_calls += 1
+            prompt, prompt_tokens = reasoning_prompt(query, results)
+            llm_response, valid = await parse_or_repair(await batch_llm_call(prompt))
+            if valid:
+                remember_answer(results, llm_response)
+            return llm_response, sent_prompt_tokens(prompt_tokens)
+
+        async def adjudicate(i: int):
+            reason_started = time.perf_counter()
+            results = {"structure": structured[i], "embed": embeddings[i:i + 1], "retrieve": retrieved[i]}
+            response = {
+                "structured_query": structured[i][0],
+                "structured_query_source": structured[i][1],
+                "retrieved_chunks": [{"text": hit["text"], "metadata": hit["metadata"]} for hit in retrieved[i]],
+            }
+            try:
+                llm_response, tier = cached_answer(results)
+                prompt_tokens = None
+                if llm_response is None:
+                    key = answer_key(structured[i][0], [hit["id"] for hit in retrieved[i]])
+                    if key in shared:
+                        tier = "batch"
+                    else:
+                        shared[key] = asyncio.ensure_future(answer(unique[i], results))
+                    llm_response, prompt_tokens = await asyncio.shield(shared[key])
+            except Exception as e:
+                return i, {"error": str(e)}
+            observe_stage("batch.reason", time.perf_counter() - reason_started)
+            response.update(
+                llm_response=llm_response,
+                answer_cache=tier,
+                prompt_tokens=prompt_tokens if tier is None else None,
+                timings={"retrieval_ms": retrieval_ms, "reason_ms": round((time.perf_counter() - reason_started) * 1000, 2)},
+            )
+            return i, response
+
+        tasks = [asyncio.ensure_future(adjudicate(i)) for i in range(len(unique))]
+        errors = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                i, response = await next_done
+                errors += "error" in response
+                for index in positions[unique[i]]:
+                    yield json.dumps({"index": index, "query": request.queries[index], **response}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+        yield json.dumps({
+            "done": True,
+            "queries": len(request.queries),
+            "unique_queries": len(unique),
+            "llm_calls": llm_calls,
+            "errors": errors,
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+            **({"profile": profile} if profile is not None else {}),
+        }) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.services.metrics import register_callback
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") != "0"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Cosine similarity a query embedding needs to reuse an answer cached for another wording
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+# Structured fields that must agree for a semantic hit: a 46M and a 64F asking about the same clauses
+# word their questions almost identically but can get different decisions
+STRICT_FIELDS = ("age", "gender", "policy_duration_months", "policy_id")
+
+
+def normalize_structured_query(structured_query: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {}
+    for field, value in structured_query.items():
+        if value is None or value == "":
+            continue
+        if isinstance(value, str):
+            value = " ".join(value.lower().split())
+        normalized[field] = value
+    return normalized
+
+
+def _chunk_key(chunk_ids: Iterable[str]) -> str:
+    return hashlib.sha256("\0".join(sorted(chunk_ids)).encode()).hexdigest()
+
+
+def answer_key(structured_query: Dict[str, Any], chunk_ids: Iterable[str]) -> str:
+    query = json.dumps(normalize_structured_query(structured_query), sort_keys=True, default=str)
+    return hashlib.sha256(query.encode()).hexdigest() + ":" + _chunk_key(chunk_ids)
+
+
+class AnswerCache:
+    # Reasoning results keyed by (normalized structured query, retrieved chunk ids). The semantic tier
+    # reuses an entry with the same chunk ids when the query embedding is within the similarity threshold.
+    # Entries expire after `ttl_seconds`, the least recently used are evicted past `max_entries`, and
+    # entries citing a file are dropped when that file is ingested again.
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL, similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._by_chunks: Dict[str, Set[str]] = {}
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        siblings = self._by_chunks.get(entry["chunk_key"])
+        if siblings is not None:
+            siblings.discard(key)
+            if not siblings:
+                del self._by_chunks[entry["chunk_key"]]
+
+    def _alive(self, key: str, now: float) -> bool:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if now - entry["created_at"] > self.ttl_seconds:
+            self._drop(key)
+            self.evictions += 1
+            return False
+        return True
+
+    def lookup(self, structured_query: Dict[str, Any], chunk_ids: List[str], query_embedding: Optional[np.ndarray] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        # (answer, "exact" | "semantic") or (None, None)
+        key = answer_key(structured_query, chunk_ids)
+        now = time.time()
+        with self._lock:
+            if self._alive(key, now):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return self._entries[key]["answer"], "exact"
+            if query_embedding is not None:
+                vector = _unit(query_embedding)
+                strict = _strict_fields(structured_query)
+                best_key, best_score = None, self.similarity
+                for candidate in list(self._by_chunks.get(_chunk_key(chunk_ids), ())):
+                    if not self._alive(candidate, now):
+                        continue
+                    entry = self._entries[candidate]
+                    if entry["strict"] != strict:
+                        continue
+                    score = float(vector @ entry["embedding"])
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key]["answer"], "semantic"
+            self.misses += 1
+        return None, None
+
+    def store(self, structured_query: Dict[str, Any], chunk_ids: List[str], filenames: Iterable[str], answer: Dict[str, Any], query_embedding: Optional[np.ndarray] = None):
+        key = answer_key(structured_query, chunk_ids)
+        chunk_key = _chunk_key(chunk_ids)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {
+                "answer": answer,
+                "chunk_key": chunk_key,
+                "filenames": set(filenames),
+                "strict": _strict_fields(structured_query),
+                "embedding": _unit(query_embedding) if query_embedding is not None else None,
+                "created_at": time.time(),
+            }
+            if query_embedding is not None:
+                self._by_chunks.setdefault(chunk_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_files(self, filenames: Iterable[str]) -> int:
+        filenames = set(filenames)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry["filenames"] & filenames]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _strict_fields(structured_query: Dict[str, Any]) -> Tuple:
+    normalized = normalize_structured_query(structured_query)
+    return tuple(normalized.get(field) for field in STRICT_FIELDS)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    global _cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+    return _cache
+
+
+def _stats() -> Dict[str, float]:
+    return _cache.stats() if _cache is not None else {}
+
+
+register_callback(
+    "counter", "answer_cache_lookups_total", "Answer cache lookups by result (exact_hit, semantic_hit, miss).", ("result",),
+    lambda: {(result,): _stats().get(key) for result, key in (("exact_hit", "exact_hits"), ("semantic_hit", "semantic_hits"), ("miss", "misses"))},
+)
+register_callback("gauge", "answer_cache_hit_ratio", "Share of answer cache lookups served from the cache.", (), lambda: {(): _stats().get("hit_rate")})
+register_callback("gauge", "answer_cache_entries", "Answers currently cached.", (), lambda: {(): _stats().get("entries")})
+
+
+def invalidate_answers(filenames: Iterable[str]) -> int:
+    cache = get_answer_cache()
+    return cache.invalidate_files(filenames) if cache else 0
@@ -0,0 +1,168 @@
+import logging
+import os
+import re
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from app.services import embedder
+
+# Leave room for the [CLS]/[SEP] tokens the encoder adds to every input
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", str(embedder.get_max_tokens() - 2)))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Heading remainders longer than this are clause text, not a section title
+MAX_SECTION_TITLE_CHARS = 80
+
+logger = logging.getLogger("chunker")
+
+# "Clause 4.2", "Section 3:", "Article IV -" style headings
+_KEYWORD_HEADING = re.compile(r'^\s*(?:clause|section|article|part)\s+([0-9]+(?:\.[0-9]+)*|[IVXLC]+|[A-Z])\b[.:)\-]?\s*(.*)$', re.IGNORECASE)
+# Bare numbered headings: "4.2 Knee Surgery", "4. Exclusions"
+_NUMBERED_HEADING = re.compile(r'^\s*([0-9]+(?:\.[0-9]+)+|[0-9]+(?=\.))\.?\s+([A-Z].*)$')
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?;])\s+')
+_SENTENCE_END = re.compile(r'[.!?;,]$')
+# "12.5 Lakhs is the sum insured" starts with an amount, not clause 12.5
+_AMOUNT_UNIT = re.compile(r'^(?:lakhs?|lacs?|crores?|thousand|million|percent|per|rupees|rs|inr|days?|weeks?|months?|years?|hours?|times|kg|km)\b', re.IGNORECASE)
+_APPROX_PIECE = re.compile(r"\w+|[^\w\s]")
+
+_tokenizer_lock = threading.Lock()
+_approximate = False
+
+
+def _approx_count(text: str) -> int:
+    # Rough word-piece estimate: long words split into several pieces
+    return sum(1 + len(piece) // 7 for piece in _APPROX_PIECE.findall(text))
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    global _approximate
+    if not texts:
+        return []
+    if not _approximate:
+        try:
+            tokenizer = embedder.get_tokenizer()
+        except Exception as e:
+            logger.warning(f"Tokenizer unavailable ({e}); falling back to approximate token counts.")
+            _approximate = True
+        else:
+            with _tokenizer_lock:
+                input_ids = tokenizer(texts, add_special_tokens=False)["input_ids"]
+            return [len(ids) for ids in input_ids]
+    return [_approx_count(text) for text in texts]
+
+
+def _is_title(text: str) -> bool:
+    # A short label ("Knee Surgery", "Waiting Periods") rather than clause text
+    return bool(text) and len(text) <= MAX_SECTION_TITLE_CHARS and not _SENTENCE_BOUNDARY.search(text) and not _SENTENCE_END.search(text)
+
+
+def _match_heading(line: str, current: Dict[str, str]) -> Tuple[Dict[str, str], bool]:
+    # (heading, has_body): has_body is set when the heading line also holds clause text, as in
+    # "4.1 Knee surgery is covered after 24 months."
+    match = _KEYWORD_HEADING.match(line)
+    if not match:
+        match = _NUMBERED_HEADING.match(line)
+        if not match:
+            return {}, False
+        number, title = match.group(1), match.group(2).strip()
+        if _AMOUNT_UNIT.match(title):
+            return {}, False
+        if '.' not in number:
+            # A bare "N." is a list item unless it is a short title; inside clause 4.2 it must also
+            # move on to a later top-level number ("5. Exclusions", not "1. The insured must ...")
+            major = current.get("clause_number", "").split('.')[0]
+            if not _is_title(title) or ('.' in current.get("clause_number", "") and major.isdigit() and int(number) <= int(major)):
+                return {}, False
+    heading = {"clause_number": match.group(1).rstrip('.')}
+    title = match.group(2).strip()
+    if _is_title(title):
+        heading["section"] = title
+    return heading, bool(title) and "section" not in heading
+
+
+def match_heading(line: str) -> Dict[str, str]:
+    return _match_heading(line, {})[0]
+
+
+def _split_blocks(text: str, heading: Dict[str, str]) -> List[Tuple[Dict[str, str], List[str]]]:
+    # Groups sentences into clause blocks; chunks never straddle a clause heading.
+    # A heading with no text of its own (e.g. "Section 4 Waiting Periods" followed by "4.1 ...")
+    # is folded into the next block instead of becoming a chunk by itself.
+    blocks = [[dict(heading), [], False]]
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        line_heading, has_body = _match_heading(line, heading)
+        if line_heading:
+            heading.clear()
+            heading.update(line_heading)
+            carried = blocks.pop()[1] if blocks[-1][1] and not blocks[-1][2] and len(blocks) > 1 else []
+            blocks.append([dict(heading), carried, has_body])
+            blocks[-1][1].extend(s for s in _SENTENCE_BOUNDARY.split(line) if s)
+            continue
+        blocks[-1][1].extend(s for s in _SENTENCE_BOUNDARY.split(line) if s)
+        blocks[-1][2] = True
+    return [(block_heading, units) for block_heading, units, _ in blocks if units]
+
+
+def _split_oversized(unit: str, max_tokens: int) -> List[Tuple[str, int]]:
+    words = unit.split()
+    pieces, current, total = [], [], 0
+    for word, n in zip(words, count_tokens(words)):
+        if current and total + n > max_tokens:
+            pieces.append((' '.join(current), total))
+            current, total = [], 0
+        current.append(word)
+        total += n
+    if current:
+        pieces.append((' '.join(current), total))
+    return pieces
+
+
+def _pack(units: List[Tuple[str, int]], max_tokens: int, overlap_tokens: int) -> Iterator[Tuple[str, int]]:
+    # Greedy packing; each new window starts with the trailing sentences of the previous one
+    window: deque = deque()
+    total = 0
+    for unit, n in units:
+        if window and total + n > max_tokens:
+            yield ' '.join(u for u, _ in window), total
+            carried: deque = deque()
+            carried_tokens = 0
+            while window and carried_tokens + window[-1][1] <= overlap_tokens:
+                u, c = window.pop()
+                carried.appendleft((u, c))
+                carried_tokens += c
+            window, total = carried, carried_tokens
+            while window and total + n > max_tokens:
+                total -= window.popleft()[1]
+        window.append((unit, n))
+        total += n
+    if window:
+        yield ' '.join(u for u, _ in window), total
+
+
+def chunk_pages(pages: Iterable[Tuple[int, str]], filename: str, max_tokens: int = None, overlap_tokens: int = None) -> Iterator[Dict[str, Any]]:
+    # Single pass over the document; the active clause heading carries over page breaks
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    heading: Dict[str, str] = {}
+    for page_num, text in pages:
+        blocks = _split_blocks(text, heading)
+        counts = iter(count_tokens([unit for _, units in blocks for unit in units]))
+        chunk_id = 0
+        for block_heading, units in blocks:
+            sized = []
+            for unit in units:
+                n = next(counts)
+                sized.extend(_split_oversized(unit, max_tokens) if n > max_tokens else [(unit, n)])
+            for chunk, n_tokens in _pack(sized, max_tokens, overlap_tokens):
+                yield {
+                    "text": chunk,
+                    "metadata": {"filename": filename, "page": page_num, "chunk_id": chunk_id, "token_count": n_tokens, **block_heading}
+                }
+                chunk_id += 1
+
+
+def chunk_document(text: str, filename: str, page: int = 1) -> List[Dict[str, Any]]:
+    return list(chunk_pages([(page, text)], filename))
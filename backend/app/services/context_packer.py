@@ -0,0 +1,97 @@
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.services.lexical_index import tokenize
+from app.services.metrics import counter
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Whole-prompt token budget per provider (PROMPT_TOKEN_BUDGET_OPENAI, ...); PROMPT_TOKEN_BUDGET for any other
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+PROMPT_TOKEN_BUDGETS = {
+    "openai": int(os.getenv("PROMPT_TOKEN_BUDGET_OPENAI", str(PROMPT_TOKEN_BUDGET))),
+    "gemini": int(os.getenv("PROMPT_TOKEN_BUDGET_GEMINI", str(PROMPT_TOKEN_BUDGET))),
+    "ollama": int(os.getenv("PROMPT_TOKEN_BUDGET_OLLAMA", "1200")),
+}
+# Tokens reserved per clause for its "Clause 4.2: " label and line break
+CLAUSE_OVERHEAD_TOKENS = 6
+
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?;])\s+')
+
+context_sentences = counter("context_sentences_total", "Retrieved sentences offered to the reasoning prompt, by outcome (kept, duplicate, trimmed).", ("outcome",))
+context_tokens = counter("context_tokens_total", "Clause tokens before and after packing.", ("stage",))
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    # tiktoken when installed, otherwise ~4 characters per token
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def prompt_token_budget(provider: Optional[str] = None) -> int:
+    return PROMPT_TOKEN_BUDGETS.get(provider, PROMPT_TOKEN_BUDGET)
+
+
+def query_terms(query: str, structured_query: Dict[str, Any]) -> set:
+    texts = [query] + [str(value) for value in structured_query.values() if value not in (None, "")]
+    return set(tokenize(" ".join(texts)))
+
+
+def pack_context(retrieved_chunks: List[Dict[str, Any]], terms: Iterable[str], token_budget: int) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    # Drops sentences repeated across chunks (the chunker's overlaps), then, if the rest does not fit in
+    # `token_budget`, keeps the sentences sharing the most terms with the query, preferring higher-ranked
+    # chunks and each chunk's opening sentence. Kept sentences stay in their original order.
+    terms = set(terms)
+    seen = set()
+    sentences = []
+    duplicates = 0
+    tokens_in = 0
+    for index, chunk in enumerate(retrieved_chunks):
+        for position, sentence in enumerate(s for s in _SENTENCE_BOUNDARY.split(chunk["text"].strip()) if s):
+            tokens = count_tokens(sentence) + 1
+            tokens_in += tokens
+            key = " ".join(sentence.lower().split())
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            relevance = len(terms.intersection(tokenize(sentence))) + (0.5 if position == 0 else 0)
+            sentences.append((index, position, sentence, tokens, relevance))
+
+    budget = token_budget - CLAUSE_OVERHEAD_TOKENS * len(retrieved_chunks)
+    kept = sentences
+    if sum(tokens for _, _, _, tokens, _ in sentences) > budget:
+        kept, used = [], 0
+        for sentence in sorted(sentences, key=lambda s: (-s[4], s[0], s[1])):
+            if used + sentence[3] <= budget:
+                kept.append(sentence)
+                used += sentence[3]
+        kept.sort(key=lambda s: (s[0], s[1]))
+
+    context_sentences.inc(len(kept), outcome="kept")
+    context_sentences.inc(duplicates, outcome="duplicate")
+    context_sentences.inc(len(sentences) - len(kept), outcome="trimmed")
+    tokens_out = sum(tokens for _, _, _, tokens, _ in kept)
+    context_tokens.inc(tokens_in, stage="retrieved")
+    context_tokens.inc(tokens_out, stage="packed")
+
+    by_chunk: Dict[int, List[str]] = {}
+    for index, _, sentence, _, _ in kept:
+        by_chunk.setdefault(index, []).append(sentence)
+    packed = [{**retrieved_chunks[index], "text": " ".join(texts)} for index, texts in sorted(by_chunk.items())]
+    return packed, {
+        "context_tokens_in": tokens_in,
+        "context_tokens_out": tokens_out,
+        "duplicate_sentences": duplicates,
+        "trimmed_sentences": len(sentences) - len(kept),
+    }
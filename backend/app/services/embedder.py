@@ -1,20 +1,219 @@
-from typing import List
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.executor import embed_pool
+from app.services.embedding_cache import cache_key, get_embedding_cache
+from app.services.metrics import counter, stage_timer
+
+# Encoder backend: "sentence-transformers" (PyTorch), "onnx" (ONNX Runtime, fp32) or "onnx-int8"
+# (ONNX Runtime, dynamically quantized weights)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Intra-op threads used by the encoder (0 = the runtime's default)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# Directory with model.onnx, model_int8.onnx and tokenizer.json; empty to fetch the published export from the hub
+EMBEDDING_ONNX_PATH = os.getenv("EMBEDDING_ONNX_PATH", "")
+
+SentenceTransformer = None
+AutoTokenizer = None
+if EMBEDDING_BACKEND == "sentence-transformers":
+    # Importing these pulls in PyTorch, which the ONNX backends exist to avoid
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        pass
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        pass
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
 
 try:
-    from sentence_transformers import SentenceTransformer
+    from huggingface_hub import hf_hub_download
 except ImportError:
-    SentenceTransformer = None
+    hf_hub_download = None
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+# all-MiniLM-L6-v2 truncates its input at 256 word-pieces
+MODEL_MAX_TOKENS = 256
+ONNX_BACKENDS = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+# Files of the published export (sentence-transformers/all-MiniLM-L6-v2 on the hub)
+_HUB_FILES = {"model.onnx": "onnx/model.onnx", "model_int8.onnx": "onnx/model_quint8_avx2.onnx", "tokenizer.json": "tokenizer.json"}
 
 _model = None
+_tokenizer = None
+
+encoded_texts = counter("encoded_texts_total", "Texts run through the embedding model (cache misses only).")
+
+
+def _onnx_file(name: str) -> str:
+    if EMBEDDING_ONNX_PATH:
+        path = os.path.join(EMBEDDING_ONNX_PATH, name)
+        if name == "model_int8.onnx" and not os.path.exists(path):
+            _quantize(os.path.join(EMBEDDING_ONNX_PATH, "model.onnx"), path)
+        return path
+    if not hf_hub_download:
+        raise ImportError("huggingface_hub is not installed; set EMBEDDING_ONNX_PATH to a local ONNX export.")
+    return hf_hub_download(f"sentence-transformers/{MODEL_NAME}", _HUB_FILES[name])
+
+
+def _quantize(source: str, target: str):
+    # Dynamic int8 quantization of the weights; activations are quantized on the fly at inference
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+
+
+class _FastTokenizer:
+    # Minimal stand-in for the transformers tokenizer call the chunker makes, backed by tokenizer.json
+    def __init__(self, path: str):
+        if not Tokenizer:
+            raise ImportError("tokenizers is not installed.")
+        self.backend = Tokenizer.from_file(path)
+        self.backend.no_truncation()
+        self.backend.no_padding()
+
+    def __call__(self, texts: List[str], add_special_tokens: bool = True) -> Dict[str, List[List[int]]]:
+        return {"input_ids": [encoding.ids for encoding in self.backend.encode_batch(texts, add_special_tokens=add_special_tokens)]}
+
+
+class OnnxEncoder:
+    # MODEL_NAME exported to ONNX and run on CPU with ONNX Runtime; mean pooling over the attention mask
+    # and L2 normalisation reproduce the sentence-transformers pipeline
+    def __init__(self, model_path: str, tokenizer_path: str, threads: int = EMBEDDING_THREADS):
+        if not ort:
+            raise ImportError("onnxruntime is not installed.")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = _FastTokenizer(tokenizer_path)
+        self.max_seq_length = MODEL_MAX_TOKENS
+
+    def _token_ids(self, texts: List[str]) -> List[List[int]]:
+        ids = self.tokenizer(texts)["input_ids"]
+        # Truncate like the reference model: keep the leading [CLS] and the trailing [SEP]
+        return [seq if len(seq) <= self.max_seq_length else seq[:self.max_seq_length - 1] + seq[-1:] for seq in ids]
+
+    def encode(self, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE, convert_to_numpy: bool = True) -> np.ndarray:
+        ids = self._token_ids(texts)
+        out = None
+        # Texts of similar length share a batch, so each batch is padded only to its own longest input
+        order = sorted(range(len(texts)), key=lambda i: len(ids[i]), reverse=True)
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            length = len(ids[rows[0]])
+            input_ids = np.zeros((len(rows), length), dtype=np.int64)
+            attention_mask = np.zeros((len(rows), length), dtype=np.int64)
+            for row, i in enumerate(rows):
+                input_ids[row, :len(ids[i])] = ids[i]
+                attention_mask[row, :len(ids[i])] = 1
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            hidden = self.session.run(None, feeds)[0]
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            if out is None:
+                out = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            out[rows] = pooled
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+
 
 def get_model():
     global _model
     if _model is None:
-        if not SentenceTransformer:
-            raise ImportError("sentence-transformers is not installed.")
-        _model = SentenceTransformer('all-MiniLM-L6-v2')
+        if EMBEDDING_BACKEND in ONNX_BACKENDS:
+            _model = OnnxEncoder(_onnx_file(ONNX_BACKENDS[EMBEDDING_BACKEND]), _onnx_file("tokenizer.json"))
+        elif EMBEDDING_BACKEND == "sentence-transformers":
+            if not SentenceTransformer:
+                raise ImportError("sentence-transformers is not installed.")
+            if EMBEDDING_THREADS:
+                import torch
+                torch.set_num_threads(EMBEDDING_THREADS)
+            _model = SentenceTransformer(MODEL_NAME, device="cpu")
+        else:
+            raise ValueError(f"Unknown EMBEDDING_BACKEND '{EMBEDDING_BACKEND}'.")
     return _model
 
+def embedding_model_id() -> str:
+    # Quantized vectors are close to, but not the same as, the fp32 ones, so they are cached separately
+    return f"{MODEL_NAME}:int8" if EMBEDDING_BACKEND == "onnx-int8" else MODEL_NAME
+
+def warm_up():
+    # Loads the encoder and runs one batch so lazy initialisation is not paid by the first request
+    get_model().encode(["warm up"], convert_to_numpy=True)
+
+def get_tokenizer():
+    # Chunking only needs the tokenizer, so avoid loading the full encoder just to count tokens
+    global _tokenizer
+    if _tokenizer is None:
+        if _model is not None:
+            _tokenizer = _model.tokenizer
+        elif EMBEDDING_BACKEND in ONNX_BACKENDS:
+            _tokenizer = _FastTokenizer(_onnx_file("tokenizer.json"))
+        elif AutoTokenizer:
+            _tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{MODEL_NAME}")
+        else:
+            raise ImportError("transformers is not installed.")
+    return _tokenizer
+
+def get_max_tokens() -> int:
+    if _model is not None:
+        return _model.max_seq_length
+    return MODEL_MAX_TOKENS
+
+def _encode(texts: List[str]) -> np.ndarray:
+    encoded_texts.inc(len(texts))
+    with stage_timer("embed.encode"):
+        return np.ascontiguousarray(get_model().encode(texts, batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True), dtype=np.float32)
+
+def encode(texts: List[str]) -> np.ndarray:
+    # Returns one contiguous (len(texts), dim) float32 matrix; no per-vector Python objects
+    cache = get_embedding_cache()
+    if cache is None:
+        return _encode(texts)
+    model_id = embedding_model_id()
+    keys = [cache_key(text, model_id) for text in texts]
+    vectors = cache.get_many(keys)
+    # Only cache misses reach the encoder, once per distinct text
+    missing: Dict[bytes, str] = {}
+    for key, text, vector in zip(keys, texts, vectors):
+        if vector is None:
+            missing.setdefault(key, text)
+    fresh: Dict[bytes, np.ndarray] = {}
+    if missing:
+        encoded = _encode(list(missing.values()))
+        fresh = dict(zip(missing, encoded))
+        cache.put_many(fresh)
+    dim = next(iter(fresh.values())).shape[0] if fresh else (vectors[0].shape[0] if vectors else 0)
+    out = np.empty((len(texts), dim), dtype=np.float32)
+    for i, (key, vector) in enumerate(zip(keys, vectors)):
+        out[i] = fresh[key] if vector is None else vector
+    return out
+
+
 def generate_embeddings(texts: List[str]) -> List[List[float]]:
-    model = get_model()
-    return model.encode(texts, convert_to_numpy=True).tolist()
+    return encode(texts).tolist()
+
+
+async def encode_async(texts: List[str]) -> np.ndarray:
+    return await embed_pool.run(encode, texts)
+
+
+async def generate_embeddings_async(texts: List[str]) -> List[List[float]]:
+    return await embed_pool.run(generate_embeddings, texts)
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.metrics import register_callback
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") != "0"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_LRU_SIZE = int(os.getenv("EMBEDDING_CACHE_LRU_SIZE", "20000"))
+
+
+def cache_key(text: str, model_name: str) -> bytes:
+    return hashlib.sha256(model_name.encode() + b"\0" + text.encode()).digest()
+
+
+class EmbeddingCache:
+    # In-process LRU in front of a SQLite table of float32 blobs keyed by sha256(model, text)
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, lru_size: int = EMBEDDING_CACHE_LRU_SIZE):
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lru_size = lru_size
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self._lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        found: List[Optional[np.ndarray]] = [None] * len(keys)
+        disk_lookups: Dict[bytes, List[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    found[i] = vector
+                    self.memory_hits += 1
+                else:
+                    disk_lookups.setdefault(key, []).append(i)
+            lookup_keys = list(disk_lookups)
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(lookup_keys), 500):
+                batch = lookup_keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(key, vector)
+                    for i in disk_lookups[key]:
+                        found[i] = vector
+                    self.disk_hits += len(disk_lookups[key])
+            self.misses += sum(1 for vector in found if vector is None)
+        return found
+
+    def put_many(self, items: Dict[bytes, np.ndarray]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.ascontiguousarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+            )
+            for key, vector in items.items():
+                self._remember(key, np.asarray(vector, dtype=np.float32))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "lru_entries": len(self._lru),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+    return _cache
+
+
+def _stats() -> Dict[str, float]:
+    # Scrapes must not open the cache just to report on it
+    return _cache.stats() if _cache is not None else {}
+
+
+register_callback(
+    "counter", "embedding_cache_lookups_total", "Embedding cache lookups by result (memory_hit, disk_hit, miss).", ("result",),
+    lambda: {(result,): _stats().get(key) for result, key in (("memory_hit", "memory_hits"), ("disk_hit", "disk_hits"), ("miss", "misses"))},
+)
+register_callback("gauge", "embedding_cache_hit_ratio", "Share of embedding cache lookups served from memory or disk.", (), lambda: {(): _stats().get("hit_rate")})
@@ -0,0 +1,181 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Iterable, Optional
+
+# Pool sizes and backpressure limits (override via environment)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "4"))
+# Extra calls allowed to wait for a free worker before new ones are rejected
+POOL_MAX_PENDING = int(os.getenv("POOL_MAX_PENDING", "32"))
+# Seconds a call may wait for a slot before PoolSaturated is raised
+POOL_QUEUE_TIMEOUT = float(os.getenv("POOL_QUEUE_TIMEOUT", "30"))
+
+
+class PoolSaturated(RuntimeError):
+    pass
+
+
+class BoundedPool:
+    def __init__(self, name: str, kind: str, max_workers: int, max_pending: int = POOL_MAX_PENDING):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_workers + self.max_pending)
+            self._loop = loop
+        return self._semaphore
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=POOL_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise PoolSaturated(f"The {self.name} pool is saturated, please retry later.")
+        try:
+            loop = asyncio.get_running_loop()
+            call = partial(fn, *args, **kwargs)
+            if self.kind == "thread":
+                # Threads see the caller's context variables (e.g. the request's metrics profile)
+                call = partial(contextvars.copy_context().run, call)
+            return await loop.run_in_executor(self.executor(), call)
+        finally:
+            semaphore.release()
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+        self._semaphore = None
+        self._loop = None
+
+
+# CPU-bound parsing runs in worker processes, embedding and blocking I/O (LLM, Chroma) in threads
+parse_pool = BoundedPool("parse", "process", PARSE_WORKERS)
+embed_pool = BoundedPool("embed", "thread", EMBED_WORKERS)
+io_pool = BoundedPool("io", "thread", IO_WORKERS)
+# Long-running producers that drive blocking generators (e.g. streaming document parsing)
+stream_pool = BoundedPool("stream", "thread", STREAM_WORKERS)
+
+
+def shutdown_pools(wait: bool = True):
+    for pool in (parse_pool, embed_pool, io_pool, stream_pool):
+        pool.shutdown(wait=wait)
+
+
+class RateLimiter:
+    # Async context manager limiting outbound calls to `max_concurrent` in flight and `per_minute` started
+    # per minute (0 = no rate limit); starts are spaced evenly rather than burst. backoff() holds back new
+    # calls for a while, e.g. after a provider answered with a rate-limit error.
+    def __init__(self, max_concurrent: int, per_minute: int = 0):
+        self.max_concurrent = max_concurrent
+        self.per_minute = per_minute
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._next_start = 0.0
+        self._paused_until = 0.0
+        self.backoffs = 0
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+        await self._semaphore.acquire()
+        now = time.monotonic()
+        start = max(now, self._next_start, self._paused_until)
+        if self.per_minute:
+            self._next_start = start + 60 / self.per_minute
+        try:
+            if start > now:
+                await asyncio.sleep(start - now)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+    def backoff(self, seconds: float):
+        self.backoffs += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class _ProducerError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+async def iterate_in_thread(make_iterable: Callable[[], Iterable[Any]], max_buffer: int = 64, pool: Optional[BoundedPool] = None) -> AsyncIterator[Any]:
+    # Runs a blocking generator on the stream pool (or `pool`) and yields its items on the event loop.
+    # The bounded buffer pauses the producer when the consumer falls behind.
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(max_buffer)
+    stop = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        iterator = iter(make_iterable())
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    return
+                put(item)
+        except BaseException as e:
+            put(_ProducerError(e))
+            return
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+        put(_END)
+
+    producer = asyncio.ensure_future((pool or stream_pool).run(produce))
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done() and producer.exception() is not None:
+                # The producer never started (e.g. saturated pool)
+                getter.cancel()
+                raise producer.exception()
+            item = await getter
+            if item is _END:
+                break
+            if isinstance(item, _ProducerError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        # Unblock a producer waiting on a full buffer so it can observe the stop flag
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.wait({producer}, timeout=0.05)
+        producer.result()
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from app.services.executor import io_pool, iterate_in_thread
+from app.services.parser import detect_file_type, iter_parse_file, pdf_page_fingerprints
+from app.services.embedder import encode_async
+from app.services.retriever import delete_chunks, delete_file, index_chunks_async, is_indexed, update_chunk_metadata
+from app.services.vectorstore import chunk_vector_id
+from app.services.registry import file_fingerprint, get_registry, metadata_fingerprint
+from app.services.answer_cache import invalidate_answers
+from app.services.metrics import counter, observe_stage
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "./jobs.db")
+JOBS_SPOOL_DIR = os.getenv("JOBS_SPOOL_DIR", "./job_spool")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Store batches allowed in flight while the next batch is embedded (0 = store each batch before embedding the next)
+INGEST_STORE_CONCURRENCY = int(os.getenv("INGEST_STORE_CONCURRENCY", "1"))
+
+STAGES = ("parse", "embed", "store")
+# Bytes copied at a time when an upload is written to the spool
+SPOOL_CHUNK_BYTES = 1 << 20
+
+logger = logging.getLogger("ingestion")
+
+ingest_jobs = counter("ingest_jobs_total", "Finished ingestion jobs by status (completed, unchanged, failed).", ("status",))
+ingest_chunks = counter("ingest_chunks_total", "Chunks of ingested files by change against the previous version (added, moved, unchanged, removed).", ("change",))
+ingest_pages_reused = counter("ingest_pages_reused_total", "PDF pages whose extracted text was reused from the previous version.")
+
+
+class JobStore:
+    def __init__(self, db_path: str = JOBS_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, filename TEXT NOT NULL, status TEXT NOT NULL, stage TEXT,"
+                " progress TEXT NOT NULL, num_chunks INTEGER, error TEXT,"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "changes" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN changes TEXT")
+
+    def create(self, filename: str) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        progress = {stage: {"done": 0, "total": None} for stage in STAGES}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, filename, status, stage, progress, created_at, updated_at) VALUES (?, ?, 'queued', NULL, ?, ?, ?)",
+                (job_id, filename, json.dumps(progress), now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def update(self, job_id: str, **fields):
+        for name in ("progress", "changes"):
+            if name in fields:
+                fields[name] = json.dumps(fields[name])
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["progress"] = json.loads(job["progress"])
+        job["changes"] = json.loads(job["changes"]) if job.get("changes") else None
+        return job
+
+
+class IngestionQueue:
+    def __init__(self, store: Optional[JobStore] = None, workers: int = INGEST_WORKERS, spool_dir: str = JOBS_SPOOL_DIR):
+        self._store = store
+        self.workers = workers
+        self.spool_dir = spool_dir
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Two uploads of the same file must not diff against the registry at the same time. Entries live
+        # only while a job for that file holds or waits for the lock.
+        self._file_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = JobStore()
+        return self._store
+
+    def _spool_path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, job_id)
+
+    async def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._queue = asyncio.Queue()
+        # Resume jobs interrupted by a restart; ingestion is restarted from the spooled upload
+        for job in self.store.unfinished():
+            if os.path.exists(self._spool_path(job["id"])):
+                logger.info(f"Resuming ingestion job {job['id']} ({job['filename']})")
+                self.store.update(job["id"], status="queued", stage=None)
+                self._queue.put_nowait(job["id"])
+            else:
+                self.store.update(job["id"], status="failed", error="Upload was lost before ingestion finished.")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, upload: BinaryIO, filename: str) -> str:
+        # `upload` is a readable binary file, e.g. UploadFile.file; it is never read into memory whole
+        if self._queue is None:
+            raise RuntimeError("Ingestion queue is not running.")
+        job_id = await io_pool.run(self._spool, upload, filename)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    def _spool(self, upload: BinaryIO, filename: str) -> str:
+        job_id = self.store.create(filename)
+        path = self._spool_path(job_id)
+        try:
+            # Written under a temporary name, so a restart mid-copy never resumes from a truncated upload
+            with open(path + ".part", "wb") as f:
+                shutil.copyfileobj(upload, f, SPOOL_CHUNK_BYTES)
+            os.replace(path + ".part", path)
+        except BaseException as e:
+            self.store.update(job_id, status="failed", error=f"Upload could not be spooled: {e}")
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+            raise
+        return job_id
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = self.store.get(job_id)
+        lock = self._file_locks.setdefault(job["filename"], asyncio.Lock())
+        async with lock:
+            started = time.perf_counter()
+            await self._ingest(job_id, job["filename"])
+            observe_stage("ingest.job", time.perf_counter() - started)
+
+    async def _ingest(self, job_id: str, filename: str):
+        progress = {stage: {"done": 0, "total": None} for stage in STAGES}
+        self.store.update(job_id, status="running", stage="parse", error=None, progress=progress)
+        spool_path = self._spool_path(job_id)
+        pending_stores: deque = deque()
+        registry = get_registry()
+        added: List[str] = []
+        try:
+            file_hash = await io_pool.run(file_fingerprint, spool_path)
+            known_hash = registry.file_hash(filename)
+            registered = known_hash is not None
+            previous = registry.chunks(filename) if registered else {}
+            if registered and not await io_pool.run(is_indexed, filename, list(previous)):
+                # The registry describes chunks the indexes no longer hold: ingest the file from scratch
+                logger.warning(f"{filename} is registered but not fully indexed; re-ingesting it in full")
+                known_hash, previous = None, {}
+            if file_hash == known_hash:
+                changes = {"file_unchanged": True, "added": 0, "moved": 0, "unchanged": len(previous), "removed": 0, "pages_reused": 0}
+                self.store.update(job_id, status="completed", stage="done", progress=progress, num_chunks=len(previous), changes=changes)
+                ingest_jobs.inc(status="unchanged")
+                os.remove(spool_path)
+                return
+            if known_hash is None:
+                # Not ingested through the registry yet: drop whatever is indexed under this name
+                await io_pool.run(delete_file, filename)
+            # Cached answers citing an earlier version of this file are dropped before and after it is rewritten
+            invalidate_answers([filename])
+
+            # PDF pages whose fingerprint matches a page of the previous version reuse its extracted text
+            fingerprints: List[str] = []
+            known_pages: Dict[int, str] = {}
+            page_texts: Dict[int, str] = {}
+            if detect_file_type(filename) == "pdf":
+                fingerprints = await io_pool.run(pdf_page_fingerprints, spool_path)
+                # Extracted page text does not depend on the indexes, so it is reused even after a full re-ingest
+                cached = registry.page_texts(filename) if registered else {}
+                known_pages = {page_num: cached[page_hash] for page_num, page_hash in enumerate(fingerprints, 1) if page_hash in cached}
+
+            # Chunks stream out of the parser while earlier batches are embedded and stored. Only chunks
+            # whose text is new are embedded; known text that moved just gets its metadata updated.
+            seen: Dict[str, str] = {}
+            batch, moved = [], []
+            async for chunk in iterate_in_thread(lambda: iter_parse_file(spool_path, filename, known_pages=known_pages, page_texts=page_texts), max_buffer=INGEST_BATCH_SIZE * 2):
+                progress["parse"]["done"] += 1
+                chunk_id = chunk_vector_id(chunk)
+                if chunk_id in seen:
+                    continue
+                seen[chunk_id] = metadata_fingerprint(chunk["metadata"])
+                if chunk_id not in previous:
+                    added.append(chunk_id)
+                    batch.append(chunk)
+                    if len(batch) == INGEST_BATCH_SIZE:
+                        await self._embed_and_store(job_id, batch, progress, pending_stores)
+                        batch = []
+                elif previous[chunk_id] != seen[chunk_id]:
+                    moved.append(chunk)
+            progress["parse"]["total"] = progress["parse"]["done"]
+            progress["embed"]["total"] = progress["store"]["total"] = len(added)
+            self.store.update(job_id, stage="embed", progress=progress, num_chunks=len(seen))
+            if batch:
+                await self._embed_and_store(job_id, batch, progress, pending_stores)
+            while pending_stores:
+                progress["store"]["done"] += await pending_stores.popleft()
+            if moved:
+                await io_pool.run(update_chunk_metadata, moved)
+            removed = [chunk_id for chunk_id in previous if chunk_id not in seen]
+            if removed:
+                await io_pool.run(delete_chunks, removed)
+            pages = {fingerprints[page_num - 1]: text for page_num, text in page_texts.items()}
+            registry.replace(filename, file_hash, seen, pages)
+            invalidate_answers([filename])
+            changes = {
+                "file_unchanged": False,
+                "added": len(added),
+                "moved": len(moved),
+                "unchanged": len(seen) - len(added) - len(moved),
+                "removed": len(removed),
+                "pages_reused": len(known_pages),
+            }
+            logger.info(f"Ingested {filename}: {changes}")
+            ingest_jobs.inc(status="completed")
+            for change in ("added", "moved", "unchanged", "removed"):
+                ingest_chunks.inc(changes[change], change=change)
+            ingest_pages_reused.inc(len(known_pages))
+            self.store.update(job_id, status="completed", stage="done", progress=progress, changes=changes)
+            os.remove(spool_path)
+        except asyncio.CancelledError:
+            # Left as 'running' so the next start() resumes it
+            raise
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}")
+            for pending in pending_stores:
+                pending.cancel()
+            # The registry still describes the previous version, which is left in place; chunks this run
+            # added are taken out again
+            if added:
+                try:
+                    await io_pool.run(delete_chunks, added)
+                except Exception as cleanup_error:
+                    logger.warning(f"Could not remove chunks of failed job {job_id}: {cleanup_error}")
+            invalidate_answers([filename])
+            ingest_jobs.inc(status="failed")
+            self.store.update(job_id, status="failed", error=str(e), progress=progress)
+            os.remove(spool_path)
+
+    async def _embed_and_store(self, job_id: str, batch: List[Dict[str, Any]], progress: Dict[str, Any], pending_stores: deque):
+        embeddings = await encode_async([chunk["text"] for chunk in batch])
+        progress["embed"]["done"] += len(batch)
+        pending_stores.append(asyncio.ensure_future(index_chunks_async(batch, embeddings)))
+        while len(pending_stores) > INGEST_STORE_CONCURRENCY:
+            progress["store"]["done"] += await pending_stores.popleft()
+        stage = "parse" if progress["parse"]["total"] is None else "store"
+        self.store.update(job_id, stage=stage, progress=progress)
+
+
+ingestion_queue = IngestionQueue()
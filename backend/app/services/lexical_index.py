@@ -0,0 +1,165 @@
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./lexical_index.db")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Characters of a document's first chunk kept as its title for policy-name matching
+TITLE_CHARS = 200
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be been by for from has have if in into is it its of on or such that the their "
+    "there these this to was were will with".split()
+)
+# "UIN: BAJHLIP23020V012223", "Policy No. 12/34-567", "Policy ID: HDF-001"
+_POLICY_ID_PATTERNS = [
+    re.compile(r"\bUIN\b[\s:.-]*([A-Z0-9]{8,})", re.IGNORECASE),
+    re.compile(r"\bpolicy\s*(?:no\.?|number|id)[\s:.#-]*([A-Z0-9][A-Z0-9/-]{3,})", re.IGNORECASE),
+]
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def extract_policy_ids(text: str) -> List[str]:
+    return [match.group(1) for pattern in _POLICY_ID_PATTERNS for match in pattern.finditer(text)]
+
+
+class LexicalIndex:
+    # BM25 inverted index in SQLite. Postings are clustered by (term, filename), so a query restricted
+    # to a few policies only reads those policies' postings, however many documents are indexed.
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, filename TEXT NOT NULL, length INTEGER NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, filename TEXT NOT NULL, id TEXT NOT NULL,"
+                " tf INTEGER NOT NULL, PRIMARY KEY (term, filename, id)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS postings_id ON postings (id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, chunks INTEGER NOT NULL,"
+                " total_length INTEGER NOT NULL, policy_ids TEXT NOT NULL DEFAULT '', title TEXT NOT NULL DEFAULT '')"
+            )
+        self._files: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def files(self) -> Dict[str, Dict[str, Any]]:
+        # Shared, read-only: every change to the index replaces this dict instead of modifying it, so callers
+        # can cache what they derive from it for as long as files() keeps returning the same object
+        with self._lock:
+            return self._load_files()
+
+    def _load_files(self) -> Dict[str, Dict[str, Any]]:
+        if self._files is None:
+            rows = self._conn.execute("SELECT filename, chunks, total_length, policy_ids, title FROM files").fetchall()
+            self._files = {
+                filename: {"chunks": chunks, "total_length": total_length, "policy_ids": policy_ids.split(), "title": title}
+                for filename, chunks, total_length, policy_ids, title in rows
+            }
+        return self._files
+
+    def _remove(self, ids: List[str]):
+        # Caller holds the lock and the transaction
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(f"SELECT id, filename, length FROM chunks WHERE id IN ({placeholders})", batch).fetchall()
+            self._conn.executemany(
+                "UPDATE files SET chunks = chunks - 1, total_length = total_length - ? WHERE filename = ?",
+                [(length, filename) for _, filename, length in rows],
+            )
+            self._conn.execute(f"DELETE FROM postings WHERE id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+        self._conn.execute("DELETE FROM files WHERE chunks <= 0")
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        with self._lock, self._conn:
+            self._remove(ids)
+            per_file: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+            policy_ids: Dict[str, set] = defaultdict(set)
+            titles: Dict[str, str] = {}
+            chunk_rows, posting_rows = [], []
+            for id_, text, meta in zip(ids, texts, metadatas):
+                filename = meta["filename"]
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                chunk_rows.append((id_, filename, length))
+                posting_rows.extend((term, filename, id_, tf) for term, tf in terms.items())
+                per_file[filename][0] += 1
+                per_file[filename][1] += length
+                policy_ids[filename].update(extract_policy_ids(text))
+                if meta.get("page") == 1 and meta.get("chunk_id") == 0:
+                    titles[filename] = text[:TITLE_CHARS]
+            self._conn.executemany("INSERT INTO chunks (id, filename, length) VALUES (?, ?, ?)", chunk_rows)
+            self._conn.executemany("INSERT OR REPLACE INTO postings (term, filename, id, tf) VALUES (?, ?, ?, ?)", posting_rows)
+            for filename, (count, total_length) in per_file.items():
+                row = self._conn.execute("SELECT policy_ids FROM files WHERE filename = ?", (filename,)).fetchone()
+                known = set(row[0].split()) if row else set()
+                self._conn.execute(
+                    "INSERT INTO files (filename, chunks, total_length, policy_ids, title) VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT(filename) DO UPDATE SET chunks = chunks + excluded.chunks,"
+                    " total_length = total_length + excluded.total_length, policy_ids = excluded.policy_ids,"
+                    " title = CASE WHEN excluded.title != '' THEN excluded.title ELSE title END",
+                    (filename, count, total_length, " ".join(sorted(known | policy_ids[filename])), titles.get(filename, "")),
+                )
+            self._files = None
+
+    def delete(self, ids: List[str]):
+        with self._lock, self._conn:
+            self._remove(ids)
+            self._files = None
+
+    def delete_file(self, filename: str):
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute("SELECT id FROM chunks WHERE filename = ?", (filename,))]
+            self._remove(ids)
+            self._files = None
+
+    def search(self, query: str, n_results: int = 20, filenames: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            files = self._load_files()
+            scope = [name for name in filenames if name in files] if filenames else list(files)
+            n_docs = sum(files[name]["chunks"] for name in scope)
+            if not n_docs:
+                return []
+            avg_length = sum(files[name]["total_length"] for name in scope) / n_docs
+            sql = (
+                "SELECT p.term, p.id, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.id"
+                f" WHERE p.term IN ({','.join('?' * len(terms))})"
+            )
+            params: List[Any] = list(terms)
+            if filenames:
+                sql += f" AND p.filename IN ({','.join('?' * len(scope))})"
+                params.extend(scope)
+            postings = self._conn.execute(sql, params).fetchall()
+        doc_freq = Counter(term for term, _, _, _ in postings)
+        scores: Dict[str, float] = defaultdict(float)
+        for term, id_, tf, length in postings:
+            idf = math.log(1 + (n_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            scores[id_] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LexicalIndex()
+    return _index
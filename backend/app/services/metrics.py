@@ -0,0 +1,229 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = "policylens_"
+
+logger = logging.getLogger("metrics")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Per label set: [per-bucket counts (last one is +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class CallbackMetric:
+    # Values read from another component's own counters when /metrics is scraped;
+    # `read` returns {label values: value}
+    def __init__(self, kind: str, name: str, documentation: str, labelnames: Sequence[str], read: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.kind = kind
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def lines(self) -> List[str]:
+        try:
+            values = self.read()
+        except Exception as e:
+            logger.warning(f"Could not collect {self.name}: {e}")
+            return []
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items()) if value is not None
+        ]
+
+
+_metrics: List[Any] = []
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    metric = Counter(name, documentation, labelnames)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, documentation, labelnames, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_callback(kind: str, name: str, documentation: str, labelnames: Sequence[str], read: Callable[[], Dict[Tuple[str, ...], float]]):
+    _metrics.append(CallbackMetric(kind, name, documentation, labelnames, read))
+
+
+def render() -> str:
+    # Prometheus text exposition format, version 0.0.4
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.lines())
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = histogram("stage_seconds", "Wall time of pipeline stages.", ("stage",))
+http_request_seconds = histogram("http_request_seconds", "HTTP request duration, until the response body is sent.", ("method", "route", "status"))
+
+# Stage timings of the current request when it asked for a profile; shared by the tasks it spawns and,
+# through BoundedPool.run, by the threads doing its work
+_profile: ContextVar[Optional[Dict[str, Dict[str, float]]]] = ContextVar("profile", default=None)
+_profile_lock = threading.Lock()
+# Every stage observation in the process while collect_stage_samples() is active, for exact percentiles in benchmarks
+_stage_samples: Optional[Dict[str, List[float]]] = None
+
+
+def start_profile() -> Dict[str, Dict[str, float]]:
+    profile: Dict[str, Dict[str, float]] = {}
+    _profile.set(profile)
+    return profile
+
+
+def observe_stage(stage: str, seconds: float):
+    stage_seconds.observe(seconds, stage=stage)
+    profile = _profile.get()
+    if profile is not None:
+        with _profile_lock:
+            entry = profile.setdefault(stage, {"calls": 0, "ms": 0.0})
+            entry["calls"] += 1
+            entry["ms"] = round(entry["ms"] + seconds * 1000, 2)
+    samples = _stage_samples
+    if samples is not None:
+        with _profile_lock:
+            samples.setdefault(stage, []).append(seconds)
+
+
+@contextmanager
+def collect_stage_samples() -> Iterator[Dict[str, List[float]]]:
+    # Yields {stage: [seconds, ...]}, filled until the block exits
+    global _stage_samples
+    samples: Dict[str, List[float]] = {}
+    _stage_samples = samples
+    try:
+        yield samples
+    finally:
+        _stage_samples = None
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware (no BaseHTTPMiddleware) so streamed responses pass through untouched;
+    # requests are labelled by route template rather than raw path to keep label cardinality bounded
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_seconds.observe(time.perf_counter() - started, method=scope["method"], route=route, status=status)
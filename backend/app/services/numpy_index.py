@@ -0,0 +1,338 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+from app.services.vectorstore import VectorStore
+
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "./vector_index")
+# Switch from brute force to an IVF (coarse-quantized) search once this many vectors are live; 0 disables IVF
+VECTOR_INDEX_IVF_MIN_ROWS = int(os.getenv("VECTOR_INDEX_IVF_MIN_ROWS", "50000"))
+# Number of IVF lists (0 = sqrt of the corpus size) and lists scanned per query
+VECTOR_INDEX_IVF_LISTS = int(os.getenv("VECTOR_INDEX_IVF_LISTS", "0"))
+VECTOR_INDEX_IVF_NPROBE = int(os.getenv("VECTOR_INDEX_IVF_NPROBE", "16"))
+
+_INITIAL_CAPACITY = 1024
+_KMEANS_SAMPLE = 20000
+_KMEANS_ITERATIONS = 10
+_ASSIGN_BLOCK = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # Indices of the k largest scores, best first; argpartition keeps this O(n) before the final small sort
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class NumpyVectorStore(VectorStore):
+    # Normalized float32 embeddings live in a memory-mapped (capacity, dim) matrix; ids, texts and metadata
+    # live in a SQLite side table keyed by matrix row. Scores are cosine similarities.
+    name = "numpy"
+
+    def __init__(self, path: str = VECTOR_INDEX_PATH, ivf_min_rows: int = VECTOR_INDEX_IVF_MIN_ROWS,
+                 ivf_lists: int = VECTOR_INDEX_IVF_LISTS, nprobe: int = VECTOR_INDEX_IVF_NPROBE):
+        self.path = path
+        self.ivf_min_rows = ivf_min_rows
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._vectors: Optional[np.memmap] = None
+        self._dim: Optional[int] = None
+        self._capacity = 0
+        self._size = 0
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._file_codes = np.zeros(0, dtype=np.int32)
+        self._file_ids: Dict[str, int] = {}
+        self._rows_by_file: Dict[int, Set[int]] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_rows = 0
+        self._lists: Optional[tuple] = None
+        self._loaded = False
+
+    # -- persistence --------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def load(self) -> int:
+        with self._lock:
+            if self._loaded:
+                return self.count()
+            os.makedirs(self.path, exist_ok=True)
+            self._conn = sqlite3.connect(self._file("metadata.db"), check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS chunks ("
+                    " row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, filename TEXT,"
+                    " document TEXT NOT NULL, metadata TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)"
+                )
+            if os.path.exists(self._file("index.json")):
+                with open(self._file("index.json")) as f:
+                    header = json.load(f)
+                self._dim, self._capacity = header["dim"], header["capacity"]
+                self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+", shape=(self._capacity, self._dim))
+            rows = self._conn.execute("SELECT row, id, filename, deleted FROM chunks ORDER BY row").fetchall()
+            self._size = rows[-1][0] + 1 if rows else 0
+            self._alive = np.zeros(self._size, dtype=bool)
+            self._file_codes = np.zeros(self._size, dtype=np.int32)
+            for row, id_, filename, deleted in rows:
+                self._row_of[id_] = row
+                self._alive[row] = not deleted
+                self._set_file(row, self._file_code(filename))
+            if os.path.exists(self._file("ivf.npz")):
+                ivf = np.load(self._file("ivf.npz"))
+                self._centroids, self._trained_rows = ivf["centroids"], int(ivf["trained_rows"])
+                self._assignments = np.zeros(0, dtype=np.int32)
+                self._assign_rows(0, self._size)
+            self._loaded = True
+            return self.count()
+
+    def _file_code(self, filename: Optional[str]) -> int:
+        return self._file_ids.setdefault(filename or "", len(self._file_ids))
+
+    def _set_file(self, row: int, code: int, previous: Optional[int] = None):
+        # Per-file row sets let filename filters skip the rest of the corpus
+        if previous is not None and previous != code:
+            self._rows_by_file[previous].discard(row)
+        self._file_codes[row] = code
+        self._rows_by_file.setdefault(code, set()).add(row)
+
+    def _ensure_capacity(self, rows: int, dim: int):
+        if self._vectors is None:
+            self._dim = dim
+            self._capacity = max(_INITIAL_CAPACITY, rows)
+        elif dim != self._dim:
+            raise ValueError(f"Embedding dimension {dim} does not match the index dimension {self._dim}.")
+        elif rows <= self._capacity:
+            return
+        else:
+            self._vectors.flush()
+            self._vectors = None
+            self._capacity = max(rows, self._capacity * 2)
+        with open(self._file("vectors.f32"), "ab") as f:
+            f.truncate(self._capacity * self._dim * 4)
+        self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+", shape=(self._capacity, self._dim))
+        with open(self._file("index.json"), "w") as f:
+            json.dump({"dim": self._dim, "capacity": self._capacity}, f)
+
+    # -- IVF ----------------------------------------------------------------
+
+    def _train_ivf(self):
+        live = np.flatnonzero(self._alive[:self._size])
+        nlist = self.ivf_lists or int(np.sqrt(len(live)))
+        rng = np.random.default_rng(0)
+        sample = self._vectors[np.sort(rng.choice(live, size=min(len(live), _KMEANS_SAMPLE), replace=False))]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(_KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~np.bincount(assignment, minlength=nlist).astype(bool)
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = _normalize(sums)
+        self._centroids = centroids
+        self._trained_rows = len(live)
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._assign_rows(0, self._size)
+        np.savez(self._file("ivf.npz"), centroids=centroids, trained_rows=self._trained_rows)
+
+    def _assign_rows(self, start: int, end: int):
+        if self._assignments.shape[0] < end:
+            self._assignments = np.concatenate([self._assignments, np.zeros(end - self._assignments.shape[0], dtype=np.int32)])
+        for block in range(start, end, _ASSIGN_BLOCK):
+            block_end = min(block + _ASSIGN_BLOCK, end)
+            self._assignments[block:block_end] = np.argmax(self._vectors[block:block_end] @ self._centroids.T, axis=1)
+        self._lists = None
+
+    def _maybe_retrain(self):
+        live = self.count()
+        if not self.ivf_min_rows or live < self.ivf_min_rows:
+            return
+        # Retrain when the corpus has doubled since the centroids were fitted
+        if self._centroids is None or live >= 2 * self._trained_rows:
+            self._train_ivf()
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            assignments = self._assignments[:self._size]
+            order = np.argsort(assignments, kind="stable")
+            offsets = np.searchsorted(assignments[order], np.arange(len(self._centroids) + 1))
+            self._lists = (order, offsets)
+        return self._lists
+
+    def _ivf_candidates(self, query: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        order, offsets = self._inverted_lists()
+        probes = _top_k(self._centroids @ query, self.nprobe)
+        rows = np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probes])
+        return rows[mask[rows]]
+
+    # -- VectorStore --------------------------------------------------------
+
+    def count(self) -> int:
+        return int(self._alive[:self._size].sum())
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]):
+        vectors = _normalize(embeddings)
+        with self._lock:
+            self.load()
+            rows = []
+            next_row = self._size
+            for id_ in ids:
+                row = self._row_of.get(id_)
+                if row is None:
+                    row = self._row_of[id_] = next_row
+                    next_row += 1
+                rows.append(row)
+            self._ensure_capacity(next_row, vectors.shape[1])
+            rows = np.asarray(rows, dtype=np.int64)
+            self._vectors[rows] = vectors
+            self._vectors.flush()
+            previous_size = self._size
+            if next_row > previous_size:
+                grow = next_row - previous_size
+                self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+                self._file_codes = np.concatenate([self._file_codes, np.zeros(grow, dtype=np.int32)])
+            for row, meta in zip(rows.tolist(), metadatas):
+                self._set_file(row, self._file_code(meta.get("filename")), self._file_codes[row] if row < previous_size else None)
+            self._alive[rows] = True
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO chunks (row, id, filename, document, metadata, deleted) VALUES (?, ?, ?, ?, ?, 0)"
+                    " ON CONFLICT(id) DO UPDATE SET filename = excluded.filename, document = excluded.document,"
+                    " metadata = excluded.metadata, deleted = 0",
+                    [
+                        (int(row), id_, meta.get("filename"), doc, json.dumps(meta))
+                        for row, id_, doc, meta in zip(rows, ids, documents, metadatas)
+                    ],
+                )
+            self._size = next_row
+            if self._centroids is not None:
+                self._assign_rows(int(rows.min()), self._size)
+            self._maybe_retrain()
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self.load()
+            rows = [self._row_of[id_] for id_ in ids if id_ in self._row_of]
+            if not rows:
+                return
+            self._alive[rows] = False
+            with self._conn:
+                self._conn.executemany("UPDATE chunks SET deleted = 1 WHERE row = ?", [(row,) for row in rows])
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        with self._lock:
+            self.load()
+            updates = [(id_, meta) for id_, meta in zip(ids, metadatas) if id_ in self._row_of]
+            for id_, meta in updates:
+                row = self._row_of[id_]
+                self._set_file(row, self._file_code(meta.get("filename")), self._file_codes[row])
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE chunks SET filename = ?, metadata = ? WHERE id = ?",
+                    [(meta.get("filename"), json.dumps(meta), id_) for id_, meta in updates],
+                )
+
+    def delete_file(self, filename: str):
+        with self._lock:
+            self.load()
+            rows = [row for row in self._rows_by_file.get(self._file_ids.get(filename), ()) if self._alive[row]]
+            if not rows:
+                return
+            self._alive[rows] = False
+            with self._conn:
+                self._conn.executemany("UPDATE chunks SET deleted = 1 WHERE row = ?", [(row,) for row in rows])
+
+    def get(self, ids: List[str]) -> List[Dict[str, Any]]:
+        with self._lock:
+            self.load()
+            rows = [self._row_of[id_] for id_ in ids if id_ in self._row_of and self._alive[self._row_of[id_]]]
+            records = self._records(rows)
+        return [{"id": records[row][0], "text": records[row][1], "metadata": records[row][2]} for row in rows]
+
+    def _records(self, rows: List[int]) -> Dict[int, tuple]:
+        records = {}
+        rows = sorted(set(rows))
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(rows), 500):
+            batch = rows[start:start + 500]
+            for row, id_, doc, meta in self._conn.execute(
+                f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(batch))})", batch
+            ):
+                records[row] = (id_, doc, json.loads(meta))
+        return records
+
+    def _filter_rows(self, where: Dict[str, Any]) -> np.ndarray:
+        # Only filename filters are indexed: {"filename": name}, {"filename": {"$eq": name}} or {"filename": {"$in": [...]}}
+        if set(where) != {"filename"}:
+            raise ValueError(f"Unsupported filter for the numpy vector store: {where}")
+        condition = where["filename"]
+        if isinstance(condition, dict):
+            names = condition.get("$in", [condition.get("$eq")])
+        else:
+            names = [condition]
+        rows = [row for name in names if name in self._file_ids for row in self._rows_by_file.get(self._file_ids[name], ())]
+        rows = np.asarray(sorted(rows), dtype=np.int64)
+        return rows[self._alive[rows]]
+
+    def query(self, query_embeddings: np.ndarray, n_results: int = 5, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        queries = _normalize(query_embeddings)
+        with self._lock:
+            self.load()
+            if self._size == 0:
+                return [[] for _ in queries]
+            if where:
+                candidates = self._filter_rows(where)
+                mask = None
+            else:
+                mask = self._alive[:self._size]
+                candidates = np.flatnonzero(mask)
+            use_ivf = self._centroids is not None and len(candidates) >= self.ivf_min_rows
+            selected = []
+            if use_ivf:
+                if mask is None:
+                    mask = np.zeros(self._size, dtype=bool)
+                    mask[candidates] = True
+                for query in queries:
+                    rows = self._ivf_candidates(query, mask)
+                    scores = self._vectors[rows] @ query
+                    best = _top_k(scores, n_results)
+                    selected.append((rows[best], scores[best]))
+            elif len(candidates) == self._size:
+                scores = self._vectors[:self._size] @ queries.T
+                for column in scores.T:
+                    best = _top_k(column, n_results)
+                    selected.append((best, column[best]))
+            else:
+                # Pre-filtered search only touches the candidate rows
+                scores = self._vectors[candidates] @ queries.T
+                for column in scores.T:
+                    best = _top_k(column, n_results)
+                    selected.append((candidates[best], column[best]))
+            records = self._records([int(row) for rows, _ in selected for row in rows])
+        return [
+            [
+                {"id": records[int(row)][0], "text": records[int(row)][1], "metadata": records[int(row)][2], "score": float(score)}
+                for row, score in zip(rows, scores)
+            ]
+            for rows, scores in selected
+        ]
@@ -1,9 +1,15 @@
+import hashlib
 import io
-from typing import List, Dict, Any
+import os
+import tempfile
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 # Import libraries for parsing
 try:
     import pdfplumber
+    from pdfminer.pdftypes import resolve1
 except ImportError:
     pdfplumber = None
 try:
@@ -14,6 +20,14 @@ import email
 from email import policy
 from email.parser import BytesParser
 
+from app.services.executor import parse_pool
+from app.services.chunker import chunk_document, chunk_pages
+from app.services.metrics import observe_stage, stage_timer
+
+# PDFs with at least this many pages are extracted across the parse process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
 
 def detect_file_type(filename: str) -> str:
     ext = filename.lower().split('.')[-1]
@@ -29,30 +43,111 @@ def detect_file_type(filename: str) -> str:
         raise ValueError(f"Unsupported file type: {ext}")
 
 
-def chunk_text(text: str, chunk_size: int = 512, overlap: int = 50) -> List[str]:
-    words = text.split()
-    chunks = []
-    i = 0
-    while i < len(words):
-        chunk = words[i:i+chunk_size]
-        chunks.append(' '.join(chunk))
-        i += chunk_size - overlap
-    return chunks
+def _open_pdf(source: Union[bytes, str]):
+    return pdfplumber.open(source if isinstance(source, str) else io.BytesIO(source))
 
 
-def parse_pdf(file_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
+def _extract_pdf_pages(path: str, first: int, last: int) -> List[Tuple[int, str, float]]:
+    # Runs in a parse worker process; pages are closed as soon as their text is out. Extraction times
+    # go back with the text since metrics recorded in the worker would stay there.
+    pages = []
+    with pdfplumber.open(path) as pdf:
+        for page_num in range(first, last + 1):
+            started = time.perf_counter()
+            page = pdf.pages[page_num - 1]
+            pages.append((page_num, page.extract_text() or "", time.perf_counter() - started))
+            page.close()
+    return pages
+
+
+def pdf_page_fingerprints(source: Union[bytes, str]) -> List[str]:
+    # Hash of each page's raw content streams and box: cheap next to text extraction, and equal for
+    # pages whose extracted text cannot differ
+    if not pdfplumber:
+        raise ImportError("pdfplumber is not installed.")
+    fingerprints = []
+    with stage_timer("parse.fingerprint"), _open_pdf(source) as pdf:
+        for page in pdf.pages:
+            digest = hashlib.sha256(repr(page.bbox).encode())
+            for stream in page.page_obj.contents:
+                digest.update(resolve1(stream).get_data())
+            fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+def iter_pdf_pages(source: Union[bytes, str], parallel: bool = True, known_pages: Optional[Dict[int, str]] = None) -> Iterator[Tuple[int, str]]:
+    # Pages in `known_pages` (page number -> text, e.g. unchanged pages of an earlier revision) are not extracted again
     if not pdfplumber:
         raise ImportError("pdfplumber is not installed.")
-    chunks = []
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-        for page_num, page in enumerate(pdf.pages, 1):
-            text = page.extract_text() or ""
-            for idx, chunk in enumerate(chunk_text(text)):
-                chunks.append({
-                    "text": chunk,
-                    "metadata": {"filename": filename, "page": page_num, "chunk_id": idx}
-                })
-    return chunks
+    known_pages = known_pages or {}
+    with _open_pdf(source) as pdf:
+        num_pages = len(pdf.pages)
+        missing = [page_num for page_num in range(1, num_pages + 1) if page_num not in known_pages]
+        if not parallel or parse_pool.max_workers < 2 or len(missing) < PDF_PARALLEL_MIN_PAGES:
+            for page_num, page in enumerate(pdf.pages, 1):
+                if page_num in known_pages:
+                    yield page_num, known_pages[page_num]
+                    continue
+                with stage_timer("parse.extract_page"):
+                    text = page.extract_text() or ""
+                yield page_num, text
+                page.close()
+            return
+
+    # Workers open the document from disk, so spill in-memory uploads to a temp file once
+    tmp_path = None
+    if isinstance(source, str):
+        path = source
+    else:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            tmp.write(source)
+            tmp_path = path = tmp.name
+    try:
+        # Runs of pages to extract, in order; at most two tasks per worker are in flight
+        executor = parse_pool.executor()
+        ranges = deque()
+        for page_num in missing:
+            if ranges and ranges[-1][1] == page_num - 1 and ranges[-1][1] - ranges[-1][0] + 1 < PDF_PAGES_PER_TASK:
+                ranges[-1] = (ranges[-1][0], page_num)
+            else:
+                ranges.append((page_num, page_num))
+        in_flight = deque()
+        extracted: Dict[int, str] = {}
+        for page_num in range(1, num_pages + 1):
+            if page_num in known_pages:
+                yield page_num, known_pages[page_num]
+                continue
+            while page_num not in extracted:
+                while ranges and len(in_flight) < parse_pool.max_workers * 2:
+                    first, last = ranges.popleft()
+                    in_flight.append(executor.submit(_extract_pdf_pages, path, first, last))
+                for extracted_num, text, seconds in in_flight.popleft().result():
+                    extracted[extracted_num] = text
+                    observe_stage("parse.extract_page", seconds)
+            yield page_num, extracted.pop(page_num)
+    finally:
+        for future in in_flight:
+            future.cancel()
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+def iter_parse_pdf(source: Union[bytes, str], filename: str, parallel: bool = True, known_pages: Optional[Dict[int, str]] = None, page_texts: Optional[Dict[int, str]] = None) -> Iterator[Dict[str, Any]]:
+    # `page_texts`, if given, collects the text of every page for reuse by the next revision
+    pages = iter_pdf_pages(source, parallel, known_pages)
+    if page_texts is not None:
+        pages = _record_pages(pages, page_texts)
+    yield from chunk_pages(pages, filename)
+
+
+def _record_pages(pages: Iterator[Tuple[int, str]], page_texts: Dict[int, str]) -> Iterator[Tuple[int, str]]:
+    for page_num, text in pages:
+        page_texts[page_num] = text
+        yield page_num, text
+
+
+def parse_pdf(file_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
+    return list(iter_parse_pdf(file_bytes, filename, parallel=False))
 
 
 def parse_docx(file_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
@@ -60,38 +155,43 @@ def parse_docx(file_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
         raise ImportError("python-docx is not installed.")
     doc = docx.Document(io.BytesIO(file_bytes))
     full_text = '\n'.join([para.text for para in doc.paragraphs])
-    return [
-        {"text": chunk, "metadata": {"filename": filename, "page": 1, "chunk_id": idx}}
-        for idx, chunk in enumerate(chunk_text(full_text))
-    ]
+    return chunk_document(full_text, filename)
 
 
 def parse_txt(file_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
     text = file_bytes.decode(errors='ignore')
-    return [
-        {"text": chunk, "metadata": {"filename": filename, "page": 1, "chunk_id": idx}}
-        for idx, chunk in enumerate(chunk_text(text))
-    ]
+    return chunk_document(text, filename)
 
 
 def parse_eml(file_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
     msg = BytesParser(policy=policy.default).parsebytes(file_bytes)
     text = msg.get_body(preferencelist=('plain')).get_content() if msg.get_body(preferencelist=('plain')) else ''
-    return [
-        {"text": chunk, "metadata": {"filename": filename, "page": 1, "chunk_id": idx}}
-        for idx, chunk in enumerate(chunk_text(text))
-    ]
+    return chunk_document(text, filename)
 
 
-def parse_file(file_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
+def iter_parse_file(source: Union[bytes, str], filename: str, parallel: bool = True, known_pages: Optional[Dict[int, str]] = None, page_texts: Optional[Dict[int, str]] = None) -> Iterator[Dict[str, Any]]:
+    # Yields chunks as they are extracted; `source` is the raw upload or a path to it.
+    # `known_pages` / `page_texts` only apply to PDFs (see iter_pdf_pages / iter_parse_pdf).
     file_type = detect_file_type(filename)
     if file_type == 'pdf':
-        return parse_pdf(file_bytes, filename)
-    elif file_type == 'docx':
-        return parse_docx(file_bytes, filename)
+        yield from iter_parse_pdf(source, filename, parallel, known_pages, page_texts)
+        return
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            source = f.read()
+    if file_type == 'docx':
+        yield from parse_docx(source, filename)
     elif file_type == 'txt':
-        return parse_txt(file_bytes, filename)
+        yield from parse_txt(source, filename)
     elif file_type == 'eml':
-        return parse_eml(file_bytes, filename)
+        yield from parse_eml(source, filename)
     else:
         raise ValueError(f"Unsupported file type: {file_type}")
+
+
+def parse_file(file_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
+    return list(iter_parse_file(file_bytes, filename, parallel=False))
+
+
+async def parse_file_async(file_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
+    return await parse_pool.run(parse_file, file_bytes, filename)
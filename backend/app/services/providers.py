@@ -0,0 +1,626 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+try:
+    import ollama
+except ImportError:
+    ollama = None
+
+try:
+    import openai
+except ImportError:
+    openai = None
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+
+from app.services.context_packer import count_tokens
+from app.services.executor import PoolSaturated, io_pool, iterate_in_thread
+from app.services.metrics import counter, observe_stage, register_callback
+
+# Providers in priority order
+LLM_PROVIDERS = [name.strip() for name in os.getenv("LLM_PROVIDERS", "openai,gemini,ollama").split(",") if name.strip()]
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-pro")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3:8b")
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")
+# Seconds before a provider call is abandoned, per provider (LLM_TIMEOUT_OPENAI, ...)
+LLM_TIMEOUTS = {
+    "openai": float(os.getenv("LLM_TIMEOUT_OPENAI", "30")),
+    "gemini": float(os.getenv("LLM_TIMEOUT_GEMINI", "30")),
+    "ollama": float(os.getenv("LLM_TIMEOUT_OLLAMA", "60")),
+}
+# Hedging: once a provider has been slower than its own p95, the next provider is started as well
+LLM_HEDGING = os.getenv("LLM_HEDGING", "1") != "0"
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+# Hedge delay used until a provider has LLM_HEDGE_MIN_SAMPLES latencies recorded
+LLM_HEDGE_INITIAL_DELAY = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "5.0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Consecutive failures that open a provider's circuit, and seconds before it is tried again
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+logger = logging.getLogger("llm_router")
+
+llm_calls = counter("llm_calls_total", "LLM provider calls by outcome (success, invalid, error, timeout, cancelled).", ("provider", "outcome"))
+llm_fallbacks = counter("llm_fallbacks_total", "Calls started on a provider because the one before it failed.", ("provider",))
+llm_hedges = counter("llm_hedges_total", "Calls started on a provider because the one before it was slow.", ("provider",))
+llm_tokens = counter("llm_tokens_total", "Prompt and completion tokens per provider, counted with the prompt tokenizer.", ("provider", "kind"))
+
+
+def _record_answer(provider_name: str, answer: str, outcome: str):
+    llm_calls.inc(provider=provider_name, outcome=outcome)
+    llm_tokens.inc(count_tokens(answer or ""), provider=provider_name, kind="completion")
+
+
+ALL_PROVIDERS_FAILED = "All LLM providers failed"
+
+# A prompt, or a function building one for a provider name (e.g. fitted to that provider's token budget)
+Prompt = Union[str, Callable[[str], str]]
+
+
+class ProviderError(RuntimeError):
+    pass
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    # HTTP 429 / quota errors as the OpenAI, Gemini and Ollama clients word them
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "ratelimit" in message or "resource exhausted" in message or "quota" in message
+
+
+class CircuitBreaker:
+    # closed -> open after `threshold` consecutive failures; open -> half_open after `reset_seconds`,
+    # when a single trial call is let through; its outcome closes or re-opens the circuit.
+    def __init__(self, threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        # Whether a call would be admitted now; only try_acquire admits one
+        with self._lock:
+            state = self.state
+            return state == "closed" or (state == "half_open" and not self._trial_in_flight)
+
+    def try_acquire(self) -> bool:
+        # Checks the state and, when half-open, claims the single trial call in one step
+        with self._lock:
+            state = self.state
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return state == "closed"
+
+    def cancel_call(self):
+        # A trial call abandoned by the router counts as neither success nor failure
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class Provider:
+    name = "base"
+
+    def __init__(self, timeout: float = 30.0):
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+        self.latencies: deque = deque(maxlen=200)
+        self.calls = 0
+        self.failures = 0
+
+    def complete(self, prompt: str) -> str:
+        # Blocking call, run on io_pool by the router
+        raise NotImplementedError
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        # Blocking generator of text deltas; providers without streaming yield the whole completion
+        yield self.complete(prompt)
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return min(LLM_HEDGE_INITIAL_DELAY, self.timeout)
+        ordered = sorted(self.latencies)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return min(max(p95, LLM_HEDGE_MIN_DELAY), self.timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "circuit": self.breaker.state,
+            "p50_seconds": round(ordered[len(ordered) // 2], 3) if ordered else None,
+            "hedge_delay_seconds": round(self.hedge_delay(), 3),
+        }
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+
+    def __init__(self, model: str = OPENAI_MODEL, timeout: float = LLM_TIMEOUTS["openai"]):
+        super().__init__(timeout)
+        self.model = model
+        self._client = None
+
+    def client(self):
+        # One client per process keeps its HTTP connection pool warm; retries are left to the router
+        if self._client is None:
+            if not openai:
+                raise ImportError("openai is not installed.")
+            self._client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=self.timeout, max_retries=0)
+        return self._client
+
+    def complete(self, prompt: str) -> str:
+        response = self.client().chat.completions.create(model=self.model, messages=[{"role": "user", "content": prompt}])
+        return response.choices[0].message.content.strip()
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        response = self.client().chat.completions.create(model=self.model, messages=[{"role": "user", "content": prompt}], stream=True)
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            response.close()
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+
+    def __init__(self, model: str = GEMINI_MODEL, timeout: float = LLM_TIMEOUTS["gemini"]):
+        super().__init__(timeout)
+        self.model = model
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            if not genai:
+                raise ImportError("google-generativeai is not installed.")
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            self._client = genai.GenerativeModel(self.model)
+        return self._client
+
+    def complete(self, prompt: str) -> str:
+        response = self.client().generate_content(prompt, request_options={"timeout": self.timeout})
+        return response.text.strip()
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self.client().generate_content(prompt, stream=True, request_options={"timeout": self.timeout}):
+            if chunk.text:
+                yield chunk.text
+
+
+class OllamaProvider(Provider):
+    name = "ollama"
+
+    def __init__(self, model: str = OLLAMA_MODEL, timeout: float = LLM_TIMEOUTS["ollama"], host: Optional[str] = OLLAMA_HOST):
+        super().__init__(timeout)
+        self.model = model
+        self.host = host
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            if not ollama:
+                raise ImportError("ollama is not installed.")
+            self._client = ollama.Client(host=self.host, timeout=self.timeout)
+        return self._client
+
+    def complete(self, prompt: str) -> str:
+        response = self.client().chat(model=self.model, messages=[{"role": "user", "content": prompt}])
+        return response["message"]["content"].strip()
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self.client().chat(model=self.model, messages=[{"role": "user", "content": prompt}], stream=True):
+            if chunk["message"]["content"]:
+                yield chunk["message"]["content"]
+
+
+class StubProvider(Provider):
+    # Local stand-in for tests and benchmarks: a latency in seconds (or a callable returning one),
+    # a canned response (or a callable of the prompt), and an optional error to raise. When streaming,
+    # the first `chunk_size` characters arrive after `first_token_latency` (default: the full latency)
+    # and the rest are spread over the remaining time.
+    def __init__(self, name: str = "stub", latency: float = 0.0, response: Any = "{}", error: Optional[Exception] = None,
+                 timeout: float = 30.0, first_token_latency: Optional[float] = None, chunk_size: int = 8):
+        super().__init__(timeout)
+        self.name = name
+        self.latency = latency
+        self.response = response
+        self.error = error
+        self.first_token_latency = first_token_latency
+        self.chunk_size = chunk_size
+
+    def complete(self, prompt: str) -> str:
+        time.sleep(self.latency() if callable(self.latency) else self.latency)
+        if self.error is not None:
+            raise self.error
+        return self.response(prompt) if callable(self.response) else self.response
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        latency = self.latency() if callable(self.latency) else self.latency
+        first = latency if self.first_token_latency is None else min(self.first_token_latency, latency)
+        time.sleep(first)
+        if self.error is not None:
+            raise self.error
+        text = self.response(prompt) if callable(self.response) else self.response
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        yield chunks[0]
+        for chunk in chunks[1:]:
+            time.sleep((latency - first) / max(1, len(chunks) - 1))
+            yield chunk
+
+
+def _non_empty(answer: str) -> bool:
+    return bool(answer and answer.strip())
+
+
+_closing: Set[asyncio.Future] = set()
+
+
+def _close_in_background(deltas: AsyncIterator[str]):
+    # Closing waits for the producer thread to notice, which the winning stream should not wait for
+    task = asyncio.ensure_future(deltas.aclose())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+def _prompt_builder(prompt: Prompt) -> Callable[[Provider], str]:
+    # Prompt factories are called at most once per provider and call
+    if isinstance(prompt, str):
+        return lambda provider: prompt
+    built: Dict[str, str] = {}
+
+    def build(provider: Provider) -> str:
+        if provider.name not in built:
+            built[provider.name] = prompt(provider.name)
+        return built[provider.name]
+    return build
+
+
+class ProviderRouter:
+    def __init__(self, providers: List[Provider], hedging: bool = LLM_HEDGING):
+        self.providers = providers
+        self.hedging = hedging
+        self.hedged_calls = 0
+
+    def _candidates(self) -> Tuple[List[Provider], bool]:
+        # Providers with an open circuit are skipped; if every circuit is open, all are tried anyway,
+        # bypassing their breakers (second value True)
+        allowed = [provider for provider in self.providers if provider.breaker.allow()]
+        return (allowed, False) if allowed else (list(self.providers), True)
+
+    def _acquire(self, candidates: List[Provider], start: int, forced: bool, errors: List[str]) -> Tuple[Optional[Provider], int]:
+        # The first candidate from `start` whose breaker admits a call, and the index after it. A half-open
+        # circuit admits one trial, which another request may have claimed since the candidates were listed.
+        for index in range(start, len(candidates)):
+            provider = candidates[index]
+            if forced or provider.breaker.try_acquire():
+                return provider, index + 1
+            errors.append(f"{provider.name}: circuit open")
+        return None, len(candidates)
+
+    async def _call(self, provider: Provider, prompt: str) -> str:
+        provider.calls += 1
+        llm_tokens.inc(count_tokens(prompt), provider=provider.name, kind="prompt")
+        started = time.perf_counter()
+        try:
+            answer = await asyncio.wait_for(io_pool.run(provider.complete, prompt), timeout=provider.timeout)
+        except asyncio.CancelledError:
+            provider.breaker.cancel_call()
+            llm_calls.inc(provider=provider.name, outcome="cancelled")
+            raise
+        except PoolSaturated:
+            provider.breaker.cancel_call()
+            raise
+        except asyncio.TimeoutError:
+            provider.failures += 1
+            provider.breaker.record_failure()
+            llm_calls.inc(provider=provider.name, outcome="timeout")
+            raise ProviderError(f"timed out after {provider.timeout}s")
+        except Exception:
+            provider.failures += 1
+            provider.breaker.record_failure()
+            llm_calls.inc(provider=provider.name, outcome="error")
+            raise
+        provider.latencies.append(time.perf_counter() - started)
+        observe_stage(f"llm.{provider.name}", time.perf_counter() - started)
+        return answer
+
+    async def complete(self, prompt: Prompt, validate: Optional[Callable[[str], bool]] = None) -> str:
+        # Providers are tried in priority order. The next one is started when the current one fails
+        # or, with hedging, once it has run past its p95 latency; the first valid answer wins and
+        # the calls still running are abandoned.
+        validate = validate or _non_empty
+        prompt_for = _prompt_builder(prompt)
+        candidates, forced = self._candidates()
+        pending: Dict[asyncio.Future, Provider] = {}
+        errors: List[str] = []
+        invalid_answer: Optional[str] = None
+        next_index = 0
+        last_launch = 0.0
+
+        def launch() -> Optional[Provider]:
+            nonlocal next_index, last_launch
+            provider, next_index = self._acquire(candidates, next_index, forced, errors)
+            if provider is not None:
+                try:
+                    text = prompt_for(provider)
+                except BaseException:
+                    provider.breaker.cancel_call()
+                    raise
+                last_launch = time.perf_counter()
+                pending[asyncio.ensure_future(self._call(provider, text))] = provider
+            return provider
+
+        try:
+            current = launch()
+            while pending:
+                timeout = None
+                if self.hedging and next_index < len(candidates):
+                    timeout = max(0.0, last_launch + current.hedge_delay() - time.perf_counter())
+                done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    slow, current = current, launch() or current
+                    if current is not slow:
+                        logger.info(f"Hedging: {slow.name} is slow, started {current.name}")
+                        self.hedged_calls += 1
+                        llm_hedges.inc(provider=current.name)
+                    continue
+                failed = False
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        answer = task.result()
+                    except PoolSaturated:
+                        raise
+                    except Exception as e:
+                        logger.warning(f"{provider.name} failed: {e}")
+                        errors.append(f"{provider.name}: {e}")
+                        failed = True
+                        continue
+                    if validate(answer):
+                        provider.breaker.record_success()
+                        _record_answer(provider.name, answer, "success")
+                        return answer
+                    provider.failures += 1
+                    provider.breaker.record_failure()
+                    _record_answer(provider.name, answer, "invalid")
+                    errors.append(f"{provider.name}: invalid response")
+                    invalid_answer = invalid_answer if invalid_answer is not None else answer
+                    failed = True
+                if (failed or not pending) and next_index < len(candidates):
+                    fallback = launch()
+                    if fallback is not None:
+                        current = fallback
+                        llm_fallbacks.inc(provider=fallback.name)
+        finally:
+            for task, provider in pending.items():
+                # A task cancelled before it started never reaches _call's own handler
+                task.cancel()
+                provider.breaker.cancel_call()
+        if invalid_answer is not None:
+            return invalid_answer
+        raise ProviderError(f"{ALL_PROVIDERS_FAILED}: " + "; ".join(errors))
+
+    async def stream(self, prompt: Prompt) -> AsyncIterator[str]:
+        # Streams text deltas from the first provider to produce one. Failover and hedging apply until
+        # the first delta arrives (a provider slower than its hedge delay is raced against the next);
+        # after that the winning stream is followed to the end and errors are raised as ProviderError.
+        # The time to the first delta is the provider's latency sample for hedging.
+        prompt_for = _prompt_builder(prompt)
+        candidates, forced = self._candidates()
+        racing: Dict[asyncio.Future, Any] = {}
+        losers: List[Any] = []
+        errors: List[str] = []
+        next_index = 0
+        last_launch = 0.0
+
+        def launch() -> Optional[Provider]:
+            nonlocal next_index, last_launch
+            provider, next_index = self._acquire(candidates, next_index, forced, errors)
+            if provider is None:
+                return None
+            try:
+                text = prompt_for(provider)
+            except BaseException:
+                provider.breaker.cancel_call()
+                raise
+            provider.calls += 1
+            llm_tokens.inc(count_tokens(text), provider=provider.name, kind="prompt")
+            last_launch = time.perf_counter()
+            deltas = iterate_in_thread(lambda: provider.stream(text), pool=io_pool)
+            racing[asyncio.ensure_future(deltas.__anext__())] = (provider, deltas, last_launch)
+            return provider
+
+        def fail(provider: Provider, error: str):
+            provider.failures += 1
+            provider.breaker.record_failure()
+            llm_calls.inc(provider=provider.name, outcome="error")
+            logger.warning(f"{provider.name} failed: {error}")
+            errors.append(f"{provider.name}: {error}")
+
+        winner = None
+        try:
+            current = launch()
+            while racing and winner is None:
+                now = time.perf_counter()
+                deadlines = [started + provider.timeout for provider, _, started in racing.values()]
+                if self.hedging and next_index < len(candidates):
+                    deadlines.append(last_launch + current.hedge_delay())
+                done, _ = await asyncio.wait(list(racing), timeout=max(0.0, min(deadlines) - now), return_when=asyncio.FIRST_COMPLETED)
+                failed = False
+                for task in done:
+                    provider, deltas, started = racing.pop(task)
+                    try:
+                        first = task.result()
+                    except PoolSaturated:
+                        provider.breaker.cancel_call()
+                        raise
+                    except StopAsyncIteration:
+                        fail(provider, "empty response")
+                        failed = True
+                        continue
+                    except Exception as e:
+                        fail(provider, str(e))
+                        failed = True
+                        continue
+                    if winner is None:
+                        provider.latencies.append(time.perf_counter() - started)
+                        winner = (provider, deltas, first, started)
+                    else:
+                        # Produced its first delta in the same round as the winner
+                        losers.append((provider, deltas))
+                if winner is not None:
+                    break
+                now = time.perf_counter()
+                for task, (provider, deltas, started) in list(racing.items()):
+                    if now >= started + provider.timeout:
+                        racing.pop(task)
+                        task.cancel()
+                        fail(provider, f"no response after {provider.timeout}s")
+                        failed = True
+                if failed or not racing:
+                    fallback = launch() if next_index < len(candidates) else None
+                    if fallback is not None:
+                        current = fallback
+                        llm_fallbacks.inc(provider=fallback.name)
+                elif not done and self.hedging and next_index < len(candidates):
+                    slow, current = current, launch() or current
+                    if current is not slow:
+                        logger.info(f"Hedging: {slow.name} is slow, started {current.name}")
+                        self.hedged_calls += 1
+                        llm_hedges.inc(provider=current.name)
+        finally:
+            # Losing streams are closed: the pending first read is cancelled (or, for a stream that lost a
+            # tie, the iterator is closed), which stops its producer thread and closes the provider's response
+            for task, (provider, _, _) in racing.items():
+                task.cancel()
+                losers.append((provider, None))
+            for provider, deltas in losers:
+                if deltas is not None:
+                    _close_in_background(deltas)
+                provider.breaker.cancel_call()
+                llm_calls.inc(provider=provider.name, outcome="cancelled")
+        if winner is None:
+            raise ProviderError(f"{ALL_PROVIDERS_FAILED}: " + "; ".join(errors))
+
+        provider, deltas, first, started = winner
+        answer = [first]
+        try:
+            yield first
+            async for delta in deltas:
+                answer.append(delta)
+                yield delta
+        except PoolSaturated:
+            raise
+        except Exception as e:
+            fail(provider, str(e))
+            raise ProviderError(f"{provider.name} failed mid-stream: {e}")
+        finally:
+            await deltas.aclose()
+        provider.breaker.record_success()
+        observe_stage(f"llm.{provider.name}", time.perf_counter() - started)
+        _record_answer(provider.name, "".join(answer), "success")
+
+    def complete_sync(self, prompt: Prompt, validate: Optional[Callable[[str], bool]] = None) -> str:
+        # Plain failover for callers outside the event loop; timeouts are enforced by the clients
+        validate = validate or _non_empty
+        prompt_for = _prompt_builder(prompt)
+        candidates, forced = self._candidates()
+        errors: List[str] = []
+        invalid_answer: Optional[str] = None
+        next_index = 0
+        while True:
+            provider, next_index = self._acquire(candidates, next_index, forced, errors)
+            if provider is None:
+                break
+            provider.calls += 1
+            started = time.perf_counter()
+            try:
+                text = prompt_for(provider)
+                llm_tokens.inc(count_tokens(text), provider=provider.name, kind="prompt")
+                answer = provider.complete(text)
+            except Exception as e:
+                provider.failures += 1
+                provider.breaker.record_failure()
+                llm_calls.inc(provider=provider.name, outcome="error")
+                logger.warning(f"{provider.name} failed: {e}")
+                errors.append(f"{provider.name}: {e}")
+                continue
+            provider.latencies.append(time.perf_counter() - started)
+            observe_stage(f"llm.{provider.name}", time.perf_counter() - started)
+            if validate(answer):
+                provider.breaker.record_success()
+                _record_answer(provider.name, answer, "success")
+                return answer
+            provider.failures += 1
+            provider.breaker.record_failure()
+            _record_answer(provider.name, answer, "invalid")
+            errors.append(f"{provider.name}: invalid response")
+            invalid_answer = invalid_answer if invalid_answer is not None else answer
+        if invalid_answer is not None:
+            return invalid_answer
+        raise ProviderError(f"{ALL_PROVIDERS_FAILED}: " + "; ".join(errors))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hedged_calls": self.hedged_calls, "providers": {provider.name: provider.stats() for provider in self.providers}}
+
+
+_PROVIDER_CLASSES = {"openai": OpenAIProvider, "gemini": GeminiProvider, "ollama": OllamaProvider}
+_router: Optional[ProviderRouter] = None
+
+
+def build_router(names: List[str] = LLM_PROVIDERS) -> ProviderRouter:
+    unknown = [name for name in names if name not in _PROVIDER_CLASSES]
+    if unknown:
+        raise ValueError(f"Unsupported LLM provider(s): {', '.join(unknown)}")
+    return ProviderRouter([_PROVIDER_CLASSES[name]() for name in names])
+
+
+def get_router() -> ProviderRouter:
+    global _router
+    if _router is None:
+        _router = build_router()
+    return _router
+
+
+register_callback(
+    "gauge", "llm_circuit_open", "1 while a provider's circuit breaker is open or half-open.", ("provider",),
+    lambda: {(provider.name,): int(provider.breaker.state != "closed") for provider in (_router.providers if _router else [])},
+)
+
+
+def set_router(router: Optional[ProviderRouter]):
+    # Swap the process-wide router, e.g. for one built from StubProviders; None rebuilds from LLM_PROVIDERS
+    global _router
+    _router = router
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from app.services.lexical_index import extract_policy_ids
+from app.services.llm import run_llm_with_priority_async
+from app.services.metrics import counter, observe_stage, stage_timer
+
+QUERY_FIELDS = ("age", "gender", "procedure", "location", "policy_duration_months", "policy_name", "policy_id")
+
+_UNIT = r"(months?|mths?|mos?|years?|yrs?)"
+# "3-month policy", "2 year old policy", "policy taken 6 months ago", "policy duration: 1 year"
+_DURATION_BEFORE = re.compile(rf"\b(\d{{1,3}})\s*-?\s*{_UNIT}\b(?:[\s-]*old)?\s+(?:\w+\s+)?(?:policy|plan|cover)", re.I)
+_DURATION_AFTER = re.compile(
+    rf"\b(?:policy|plan|cover)\s+(?:duration|tenure|age|term)?\s*:?\s*(?:is\s+|was\s+)?(?:taken\s+|bought\s+|purchased\s+|active\s+|held\s+)?"
+    rf"(?:for\s+|since\s+|of\s+)?(\d{{1,3}})\s*-?\s*{_UNIT}\b",
+    re.I,
+)
+# "46M", "46 M", "46-year-old male", "46 yo female", "female, 46", "age 46"
+_AGE_GENDER = re.compile(r"\b(\d{1,3})\s*(?:-?\s*(?:years?|yrs?|y/?o)\b(?:[\s-]*old)?)?\s*[,/-]?\s*(male|female|man|woman|m|f)\b", re.I)
+_GENDER_AGE = re.compile(r"\b(male|female|man|woman|m|f)\s*[,/-]?\s*(?:aged?\s*)?(\d{1,3})\b", re.I)
+_AGE = re.compile(r"\b(?:aged?\s*:?\s*(\d{1,3})|(\d{1,3})\s*-?\s*(?:years?|yrs?|y/?o)\b(?:[\s-]*old)?)", re.I)
+_GENDER = re.compile(r"\b(male|female|man|woman|boy|girl)\b", re.I)
+_PROCEDURE_TERMS = (
+    "surgery|surgeries|operation|transplant|replacement|treatment|therapy|procedure|implant|removal|repair|bypass|"
+    "angioplasty|dialysis|chemotherapy|radiotherapy|delivery|cataract|appendectomy|hysterectomy|maternity|fracture|"
+    "hospitali[sz]ation|ivf|physiotherapy|check-?up"
+)
+_PROCEDURE = re.compile(rf"\b((?:[a-z][\w'-]*\s+){{0,3}}?(?:{_PROCEDURE_TERMS})\b(?:\s+(?:{_PROCEDURE_TERMS})\b)*)", re.I)
+# Words that end the lead-in to a procedure: "needs knee surgery", "waiting period for cataract surgery",
+# "does this policy cover maternity"
+_FILLER = {"a", "an", "the", "for", "of", "my", "his", "her", "their", "needs", "need", "needed", "had", "has", "have",
+           "underwent", "undergo", "undergoing", "undergone", "wants", "want", "did", "do", "claim", "claims", "patient",
+           "with", "after", "and", "is", "was", "planned", "requires", "required", "male", "female", "man", "woman",
+           "does", "doesn't", "are", "will", "can", "what", "which", "how", "when", "why", "this", "that", "these",
+           "policy", "plan", "insurance", "cover", "covers", "covered", "coverage", "waiting", "period", "limit", "on",
+           "about", "any", "under", "to", "in", "at", "or"}
+KNOWN_CITIES = (
+    "Mumbai", "New Delhi", "Delhi", "Bengaluru", "Bangalore", "Chennai", "Kolkata", "Hyderabad", "Pune", "Ahmedabad",
+    "Jaipur", "Lucknow", "Surat", "Kanpur", "Nagpur", "Indore", "Bhopal", "Patna", "Vadodara", "Ludhiana", "Agra",
+    "Nashik", "Coimbatore", "Kochi", "Visakhapatnam", "Thane", "Noida", "Gurugram", "Gurgaon", "Chandigarh", "Mysuru",
+    "Mysore", "Madurai", "Guwahati", "Bhubaneswar", "Dehradun", "Ranchi", "Raipur", "Thiruvananthapuram", "Goa",
+)
+_CITY = re.compile(r"\b(" + "|".join(KNOWN_CITIES) + r")\b")
+# Any other place only after "in": "knee surgery in Nashik" (but not "in Apollo Hospital")
+_LOCATION = re.compile(r"\bin\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\b")
+_NOT_A_PLACE = re.compile(r"\b(?:Hospital|Clinic|Centre|Center|Nursing|Home|Institute)\b")
+_POLICY_NAME = re.compile(r"\b(?:under|with|on)\s+(?:the\s+|my\s+)?((?:[A-Z][\w&'-]*\s+){1,6}?)(?:policy|plan)\b")
+_GENDERS = {"m": "male", "man": "male", "boy": "male", "f": "female", "woman": "female", "girl": "female"}
+
+structured_queries = counter("structured_queries_total", "Queries structured, by source (rules fast path or LLM).", ("source",))
+
+
+def _months(amount: str, unit: str) -> int:
+    return int(amount) * (12 if unit.lower().startswith("y") else 1)
+
+
+def extract_query_fields(query: str) -> Optional[Dict[str, Any]]:
+    # Rule-based fast path for short claim descriptions ("46M, knee surgery, Pune, 3-month policy").
+    # Returns None unless the query reads as a claim (a procedure plus the patient's age or gender or the
+    # policy's duration), so questions and bare procedure names fall back to the LLM.
+    fields: Dict[str, Any] = dict.fromkeys(QUERY_FIELDS)
+    text = query
+
+    match = _DURATION_BEFORE.search(text) or _DURATION_AFTER.search(text)
+    if match:
+        fields["policy_duration_months"] = _months(match.group(1), match.group(2))
+        # Keep "2 years old policy" from being read as the patient's age
+        text = text[:match.start()] + " " + text[match.end():]
+
+    match = _AGE_GENDER.search(text)
+    if match:
+        fields["age"], fields["gender"] = int(match.group(1)), match.group(2).lower()
+    elif _GENDER_AGE.search(text):
+        match = _GENDER_AGE.search(text)
+        fields["gender"], fields["age"] = match.group(1).lower(), int(match.group(2))
+    else:
+        match = _AGE.search(text)
+        if match:
+            fields["age"] = int(match.group(1) or match.group(2))
+        match = _GENDER.search(text)
+        if match:
+            fields["gender"] = match.group(1).lower()
+    if fields["gender"]:
+        fields["gender"] = _GENDERS.get(fields["gender"], fields["gender"])
+
+    parts = re.split(r"[,;\n]", text)
+    for part in parts:
+        match = _PROCEDURE.search(part)
+        if match:
+            words = match.group(1).split()
+            # The procedure starts after the last lead-in word
+            while len(words) > 1 and any(word.lower() in _FILLER for word in words[:-1]):
+                words = words[1:]
+            fields["procedure"] = " ".join(words).lower()
+            break
+    if not fields["procedure"]:
+        return None
+    if fields["age"] is None and fields["gender"] is None and fields["policy_duration_months"] is None:
+        return None
+
+    match = _CITY.search(text)
+    if match:
+        fields["location"] = match.group(1)
+    else:
+        match = _LOCATION.search(text)
+        if match and not _NOT_A_PLACE.search(match.group(1)):
+            fields["location"] = match.group(1)
+    match = _POLICY_NAME.search(query)
+    if match:
+        fields["policy_name"] = match.group(1).strip()
+    policy_ids = extract_policy_ids(query)
+    if policy_ids:
+        fields["policy_id"] = policy_ids[0]
+    return fields
+
+
+async def structure_query(query: str) -> Tuple[Dict[str, Any], str]:
+    # (structured_query, source) where source is "rules" or "llm"
+    fields = extract_query_fields(query)
+    if fields is not None:
+        structured_queries.inc(source="rules")
+        return fields, "rules"
+    structured_queries.inc(source="llm")
+    parsing_prompt = (
+        "Extract the following fields from the query and return as JSON: age, gender, procedure, location, policy_duration_months, policy_name, policy_id. "
+        "If a field is missing, use null. Query: " + query + "\nRespond in JSON only."
+    )
+    with stage_timer("structure.llm"):
+        parsing_response = await run_llm_with_priority_async(parsing_prompt)
+    try:
+        parsed = json.loads(parsing_response)
+    except Exception:
+        parsed = None
+    # Later stages read the structured query as a dict (cache keys, context packing, the prompt)
+    if not isinstance(parsed, dict):
+        return {"raw_query": query, "llm_parse": parsing_response}, "llm"
+    return parsed, "llm"
+
+
+Stage = Tuple[Sequence[str], Callable[[Dict[str, Any]], Awaitable[Any]]]
+
+
+async def run_stages(stages: Dict[str, Stage]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    # Runs a dependency graph of async stages: {name: (dependencies, fn(results))}. Every stage starts
+    # as soon as its dependencies have finished; results holds the outputs of finished stages.
+    # Returns (results, timings) with the wall time of each stage and the whole graph in milliseconds.
+    results: Dict[str, Any] = {}
+    timings: Dict[str, float] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+    started = time.perf_counter()
+
+    async def run(name: str):
+        deps, fn = stages[name]
+        if deps:
+            await asyncio.gather(*(tasks[dep] for dep in deps))
+        stage_started = time.perf_counter()
+        results[name] = await fn(results)
+        elapsed = time.perf_counter() - stage_started
+        timings[f"{name}_ms"] = round(elapsed * 1000, 2)
+        observe_stage(name, elapsed)
+
+    for name in stages:
+        tasks[name] = asyncio.ensure_future(run(name))
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    timings["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return results, timings
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+REGISTRY_DB_PATH = os.getenv("REGISTRY_DB_PATH", "./registry.db")
+
+
+def file_fingerprint(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def metadata_fingerprint(metadata: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(metadata, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class DocumentRegistry:
+    # What is indexed for each file: the hash of the uploaded bytes and, per chunk, its content-addressed
+    # id (see chunk_vector_id) with a hash of its metadata. Re-ingestion diffs against this to skip
+    # unchanged files, embed only new chunks, update moved ones and delete removed ones.
+    def __init__(self, db_path: str = REGISTRY_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, file_hash TEXT NOT NULL,"
+                " chunks INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, filename TEXT NOT NULL, metadata_hash TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_filename ON chunks (filename)")
+            # Extracted text of each PDF page by page fingerprint (see pdf_page_fingerprints), so pages an
+            # amendment did not touch are not extracted again
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages (filename TEXT NOT NULL, page_hash TEXT NOT NULL, text TEXT NOT NULL,"
+                " PRIMARY KEY (filename, page_hash))"
+            )
+
+    def file_hash(self, filename: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT file_hash FROM files WHERE filename = ?", (filename,)).fetchone()
+        return row[0] if row else None
+
+    def chunks(self, filename: str) -> Dict[str, str]:
+        # {chunk id: metadata hash}
+        with self._lock:
+            rows = self._conn.execute("SELECT id, metadata_hash FROM chunks WHERE filename = ?", (filename,)).fetchall()
+        return dict(rows)
+
+    def page_texts(self, filename: str) -> Dict[str, str]:
+        # {page fingerprint: extracted text}
+        with self._lock:
+            rows = self._conn.execute("SELECT page_hash, text FROM pages WHERE filename = ?", (filename,)).fetchall()
+        return dict(rows)
+
+    def replace(self, filename: str, file_hash: str, chunks: Dict[str, str], pages: Optional[Dict[str, str]] = None):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE filename = ?", (filename,))
+            self._conn.execute("DELETE FROM pages WHERE filename = ?", (filename,))
+            if pages:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO pages (filename, page_hash, text) VALUES (?, ?, ?)",
+                    [(filename, page_hash, text) for page_hash, text in pages.items()],
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, filename, metadata_hash) VALUES (?, ?, ?)",
+                [(id_, filename, metadata_hash) for id_, metadata_hash in chunks.items()],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (filename, file_hash, chunks, updated_at) VALUES (?, ?, ?, ?)",
+                (filename, file_hash, len(chunks), time.time()),
+            )
+
+    def forget(self, filename: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE filename = ?", (filename,))
+            self._conn.execute("DELETE FROM pages WHERE filename = ?", (filename,))
+            self._conn.execute("DELETE FROM files WHERE filename = ?", (filename,))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> DocumentRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DocumentRegistry()
+    return _registry
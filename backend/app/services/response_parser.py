@@ -0,0 +1,495 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.providers import ALL_PROVIDERS_FAILED, ProviderError, get_router
+from app.services.metrics import register_callback, stage_timer
+
+# LLM repair calls allowed per minute for output the tolerant parser cannot fix (0 disables repair)
+LLM_REPAIR_PER_MINUTE = int(os.getenv("LLM_REPAIR_PER_MINUTE", "6"))
+
+logger = logging.getLogger("response_parser")
+
+REQUIRED_FIELDS = ("decision", "amount", "justification", "summary", "clauses_used", "confidence")
+
+FALLBACK_RESPONSE = {
+    "decision": "needs more info",
+    "amount": 0,
+    "justification": "The LLM response was incomplete or invalid. Manual review required.",
+    "clauses_used": [],
+    "summary": "Unable to determine decision automatically.",
+    "confidence": 0.0
+}
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, bool):
+        raise ValueError("expected a number")
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        cleaned = value.replace(",", "").replace("₹", "").replace("$", "").strip()
+        number = float(cleaned)
+        return int(number) if number.is_integer() else number
+    raise ValueError("expected a number")
+
+
+def validate_field(name: str, value: Any) -> Any:
+    # Normalized value of a reasoning-response field, or ValueError if it does not fit the schema
+    if name == "decision":
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError("decision must be a non-empty string")
+        return value.strip()
+    if name == "amount":
+        return _number(value)
+    if name in ("justification", "summary"):
+        if not isinstance(value, str):
+            raise ValueError(f"{name} must be a string")
+        return value
+    if name == "clauses_used":
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list) or not all(isinstance(item, (str, int, float)) for item in value):
+            raise ValueError("clauses_used must be a list of strings")
+        return [str(item) for item in value]
+    if name == "confidence":
+        return min(1.0, max(0.0, float(_number(value))))
+    return value
+
+
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_WORDS = {"true": True, "false": False, "null": None, "none": None, "undefined": None}
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "/": "/", "\\": "\\", '"': '"', "'": "'"}
+MAX_DEPTH = 64
+_STRING_STOPS = {'"': re.compile(r'["\\\\]'), "'": re.compile(r"['\\\\]")}
+_STRUCTURAL = re.compile(r"[\"'{}\[\],:=/]")
+
+
+class TolerantDecoder:
+    # Linear-time recursive-descent decoder for JSON as LLMs write it: single-quoted strings, bare keys
+    # and words, trailing or doubled commas, Python literals (True/None), raw newlines in strings, "..."
+    # placeholders, and input that ends early (open strings, objects and arrays are closed at EOF).
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+
+    def decode(self) -> Any:
+        return self.value(0)
+
+    def _skip(self):
+        text, pos = self.text, self.pos
+        while pos < len(text):
+            if text[pos].isspace():
+                pos += 1
+            elif text.startswith("//", pos):
+                end = text.find("\n", pos)
+                pos = len(text) if end < 0 else end + 1
+            elif text.startswith("/*", pos):
+                end = text.find("*/", pos + 2)
+                pos = len(text) if end < 0 else end + 2
+            else:
+                break
+        self.pos = pos
+
+    def value(self, depth: int) -> Any:
+        if depth > MAX_DEPTH:
+            raise ValueError("nesting too deep")
+        self._skip()
+        if self.pos >= len(self.text):
+            raise ValueError("unexpected end of input")
+        char = self.text[self.pos]
+        if char == "{":
+            return self._object(depth)
+        if char == "[":
+            return self._array(depth)
+        if char in "\"'":
+            return self._string()
+        match = _NUMBER.match(self.text, self.pos)
+        if match and (match.end() == len(self.text) or self.text[match.end()] in " \t\r\n,}]/"):
+            self.pos = match.end()
+            number = float(match.group())
+            return int(number) if number.is_integer() and not any(c in match.group() for c in ".eE") else number
+        return self._bare()
+
+    def _object(self, depth: int) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        self.pos += 1
+        while True:
+            self._skip()
+            if self.pos >= len(self.text):
+                return result
+            char = self.text[self.pos]
+            if char == "}":
+                self.pos += 1
+                return result
+            if char in ",;":
+                self.pos += 1
+                continue
+            if char in "]":
+                # Mismatched bracket: treat as the end of this object
+                self.pos += 1
+                return result
+            key = self._string() if char in "\"'" else self._bare(stop=":,}\n")
+            self._skip()
+            if self.pos < len(self.text) and self.text[self.pos] in ":=":
+                self.pos += 1
+                self._skip()
+            if self.pos >= len(self.text) or self.text[self.pos] in ",}":
+                result[str(key)] = None
+                continue
+            result[str(key)] = self.value(depth + 1)
+
+    def _array(self, depth: int) -> List[Any]:
+        result: List[Any] = []
+        self.pos += 1
+        while True:
+            self._skip()
+            if self.pos >= len(self.text):
+                return result
+            char = self.text[self.pos]
+            if char == "]":
+                self.pos += 1
+                return result
+            if char == "}":
+                self.pos += 1
+                return result
+            if char == ",":
+                self.pos += 1
+                continue
+            if self.text.startswith("...", self.pos) or char == "…":
+                self.pos += 3 if char == "." else 1
+                continue
+            result.append(self.value(depth + 1))
+
+    def _string(self) -> str:
+        text = self.text
+        quote = text[self.pos]
+        self.pos += 1
+        parts: List[str] = []
+        start = self.pos
+        stops = _STRING_STOPS[quote]
+        while True:
+            match = stops.search(text, self.pos)
+            if match is None:
+                break
+            self.pos = match.start()
+            char = text[self.pos]
+            if char == quote and (quote == '"' or self._closes_single_quote()):
+                parts.append(text[start:self.pos])
+                self.pos += 1
+                return "".join(parts)
+            if char == "\\" and self.pos + 1 < len(text):
+                parts.append(text[start:self.pos])
+                escaped = text[self.pos + 1]
+                if escaped == "u" and self.pos + 6 <= len(text):
+                    try:
+                        parts.append(chr(int(text[self.pos + 2:self.pos + 6], 16)))
+                        self.pos += 6
+                    except ValueError:
+                        parts.append(escaped)
+                        self.pos += 2
+                else:
+                    parts.append(_ESCAPES.get(escaped, escaped))
+                    self.pos += 2
+                start = self.pos
+                continue
+            self.pos += 1
+        self.pos = len(text)
+        parts.append(text[start:])
+        return "".join(parts)
+
+    def _closes_single_quote(self) -> bool:
+        # In 'single-quoted' strings an apostrophe ("it's") is only a closing quote before a delimiter
+        rest = self.text[self.pos + 1:self.pos + 64].lstrip()
+        return not rest or rest[0] in ",}]:"
+
+    def _bare(self, stop: str = ",}]\n") -> Any:
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos] not in stop:
+            self.pos += 1
+        word = self.text[start:self.pos].strip()
+        if self.pos == start:
+            # A stray delimiter: consume it so decoding always makes progress
+            self.pos += 1
+        return _WORDS[word.lower()] if word.lower() in _WORDS else word
+
+
+def decode_tolerant(text: str) -> Any:
+    # Decodes the first JSON object or array in `text`, skipping anything before it (prose, code fences)
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        raise ValueError("No JSON object found in LLM response")
+    decoder = TolerantDecoder(text)
+    decoder.pos = min(starts)
+    return decoder.decode()
+
+
+def _decode_key(text: str) -> str:
+    if text[0] == '"' and text[-1] == '"':
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    decoder = TolerantDecoder(text)
+    decoder._skip()
+    if decoder.pos < len(text) and text[decoder.pos] in "\"'":
+        return decoder._string()
+    return str(decoder._bare(stop=":="))
+
+
+def _decode_value(text: str) -> Any:
+    # Well-formed values (the common case) go through the C JSON decoder
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    return TolerantDecoder(text).value(0) if text.strip() else None
+
+
+class ResponseParser:
+    # Incremental, single-pass parser for the reasoning response. feed() takes text deltas as they
+    # stream in and returns the top-level fields whose values completed in that delta, already decoded
+    # (tolerantly, see TolerantDecoder) and validated; text before the opening brace (prose, code fences)
+    # is skipped. finish() closes an object the model never closed and returns the validated response,
+    # or FALLBACK_RESPONSE when required fields are missing or invalid.
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.errors: List[str] = []
+        self.valid = False
+        self.started = False
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._quote: Optional[str] = None
+        self._escape = False
+        # A single quote seen inside a single-quoted string: it only closes the string if the next
+        # significant character is a delimiter, so apostrophes ("it's") survive
+        self._maybe_closed = False
+        self._comment: Optional[int] = None
+        self._last = ""
+        self._closed = False
+        self._member_start = 0
+        self._value_start: Optional[int] = None
+
+    def feed(self, delta: str) -> List[Tuple[str, Any]]:
+        completed: List[Tuple[str, Any]] = []
+        if self._closed:
+            return completed
+        if not self.started:
+            brace = delta.find("{")
+            if brace < 0:
+                return completed
+            self.started = True
+            delta = delta[brace:]
+        self._text += delta
+        text = self._text
+        i = self._pos
+        while i < len(text):
+            if self._quote is not None and not self._maybe_closed and not self._escape:
+                # Jump to the next quote or backslash instead of stepping through the string
+                match = _STRING_STOPS[self._quote].search(text, i)
+                if match is None:
+                    break
+                i = match.start()
+            elif self._quote is None and self._comment is None:
+                match = _STRUCTURAL.search(text, i)
+                skipped = text[i:match.start() if match else len(text)].strip()
+                if skipped:
+                    self._last = skipped[-1]
+                if match is None:
+                    break
+                i = match.start()
+            char = text[i]
+            i += 1
+            if self._quote is not None:
+                if self._maybe_closed:
+                    if char.isspace():
+                        continue
+                    self._maybe_closed = False
+                    if char not in ",}]:":
+                        i -= 1
+                        continue
+                    self._quote = None
+                elif self._escape:
+                    self._escape = False
+                    continue
+                elif char == "\\":
+                    self._escape = True
+                    continue
+                else:
+                    if self._quote == "'":
+                        self._maybe_closed = True
+                    else:
+                        self._quote = None
+                        self._last = char
+                    continue
+            if self._comment is not None:
+                if char == "\n" and text[self._comment + 1] == "/" or char == "/" and text[i - 2] == "*" and i - 3 > self._comment:
+                    self._comment = None
+                continue
+            if char == "/":
+                if i == len(text):
+                    # Could open a comment; wait for the next delta
+                    self._pos = i - 1
+                    return completed
+                if text[i] in "/*":
+                    self._comment = i - 1
+                    continue
+            if char == '"' or (char == "'" and self._last in "{[,:="):
+                self._quote = char
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = i
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_member(i - 1, completed)
+                    self._closed = True
+                    self._pos = i
+                    return completed
+            elif self._depth == 1 and char in ":=" and self._value_start is None:
+                self._value_start = i
+            elif self._depth == 1 and char == ",":
+                self._complete_member(i - 1, completed)
+                self._member_start = i
+            self._last = char
+        self._pos = len(text)
+        return completed
+
+    def _complete_member(self, end: int, completed: List[Tuple[str, Any]]):
+        key_text = self._text[self._member_start:self._value_start - 1 if self._value_start else end].strip()
+        value_start = self._value_start
+        self._value_start = None
+        if not key_text:
+            return
+        try:
+            if value_start is None:
+                raise ValueError("missing value")
+            key = _decode_key(key_text)
+            value_text = self._text[value_start:end]
+            value = validate_field(key, _decode_value(value_text))
+        except (ValueError, TypeError) as e:
+            self.errors.append(f"{key_text}: {e}")
+            return
+        self.fields[key] = value
+        completed.append((key, value))
+
+    def finish(self) -> Dict[str, Any]:
+        if self.started and not self._closed:
+            # Output cut off mid-object: decode what arrived, closing open strings and brackets
+            if self._depth == 1:
+                self._complete_member(len(self._text), [])
+            elif self._depth > 1 and self._value_start is not None:
+                self._complete_member(len(self._text), [])
+            self._closed = True
+        missing = [field for field in REQUIRED_FIELDS if field not in self.fields]
+        if missing:
+            self.errors.append(f"missing fields: {', '.join(missing)}")
+        self.valid = self.started and not missing
+        return dict(self.fields) if self.valid else dict(FALLBACK_RESPONSE)
+
+
+def parse_llm_response(response: str) -> Dict[str, Any]:
+    parser = ResponseParser()
+    parser.feed(response)
+    return parser.finish()
+
+
+class RepairMeter:
+    # Token bucket limiting LLM repair calls to `per_minute`; 0 disables repair
+    def __init__(self, per_minute: int = LLM_REPAIR_PER_MINUTE):
+        self.per_minute = per_minute
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.repaired = 0
+        self.skipped = 0
+
+    def acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.per_minute, self._tokens + (now - self._updated) * self.per_minute / 60)
+            self._updated = now
+            if self._tokens < 1:
+                self.skipped += 1
+                return False
+            self._tokens -= 1
+            self.attempts += 1
+            return True
+
+    def record_repaired(self):
+        with self._lock:
+            self.repaired += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"per_minute": self.per_minute, "attempts": self.attempts, "repaired": self.repaired, "skipped": self.skipped}
+
+
+repair_meter = RepairMeter()
+register_callback(
+    "counter", "llm_repairs_total", "LLM repair calls for unparseable answers: attempted, repaired, or skipped by the rate limit.", ("outcome",),
+    lambda: {(outcome,): repair_meter.stats()[key] for outcome, key in (("attempted", "attempts"), ("repaired", "repaired"), ("skipped", "skipped"))},
+)
+
+REPAIR_PROMPT = (
+    "Convert the following text into one valid JSON object with the keys decision, amount, justification, "
+    "clauses_used, summary and confidence. Use double quotes, no trailing commas, no code fences, and no text "
+    "before or after the JSON. Do not change the meaning.\nText: "
+)
+
+
+def _should_repair(raw: str) -> bool:
+    return bool(raw and raw.strip()) and not raw.startswith(ALL_PROVIDERS_FAILED)
+
+
+def _finish_repair(answer: str) -> Optional[Dict[str, Any]]:
+    parser = ResponseParser()
+    parser.feed(answer)
+    result = parser.finish()
+    if parser.valid:
+        repair_meter.record_repaired()
+        return result
+    return None
+
+
+async def parse_or_repair(raw: str) -> Tuple[Dict[str, Any], bool]:
+    # (response, valid). The tolerant parser handles almost everything; an LLM repair call is the
+    # last resort and is rate limited by repair_meter.
+    with stage_timer("reason.parse"):
+        parser = ResponseParser()
+        parser.feed(raw)
+        result = parser.finish()
+    if parser.valid or not _should_repair(raw) or not repair_meter.acquire():
+        return result, parser.valid
+    logger.info(f"Escalating unparseable LLM output to an LLM repair ({'; '.join(parser.errors)})")
+    try:
+        with stage_timer("reason.repair"):
+            repaired = _finish_repair(await get_router().complete(REPAIR_PROMPT + raw))
+    except ProviderError as e:
+        logger.warning(f"LLM repair failed: {e}")
+        repaired = None
+    return (repaired, True) if repaired is not None else (result, False)
+
+
+def parse_or_repair_sync(raw: str) -> Tuple[Dict[str, Any], bool]:
+    with stage_timer("reason.parse"):
+        parser = ResponseParser()
+        parser.feed(raw)
+        result = parser.finish()
+    if parser.valid or not _should_repair(raw) or not repair_meter.acquire():
+        return result, parser.valid
+    logger.info(f"Escalating unparseable LLM output to an LLM repair ({'; '.join(parser.errors)})")
+    try:
+        with stage_timer("reason.repair"):
+            repaired = _finish_repair(get_router().complete_sync(REPAIR_PROMPT + raw))
+    except ProviderError as e:
+        logger.warning(f"LLM repair failed: {e}")
+        repaired = None
+    return (repaired, True) if repaired is not None else (result, False)
@@ -0,0 +1,209 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.executor import io_pool
+from app.services.metrics import counter, stage_timer
+from app.services.lexical_index import get_lexical_index, tokenize
+from app.services.vectorstore import get_vector_store, chunk_vector_id, store_chunks
+
+# Candidates taken from each ranking before fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+# Reciprocal rank fusion constant; larger values flatten the gap between ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_FILENAME_SEPARATORS = re.compile(r"[\s_.,()\[\]]+")
+
+retrieved_chunks = counter("retrieved_chunks_total", "Chunks returned by hybrid retrieval, by the rankings that found them (dense, lexical, both).", ("source",))
+
+# Policy lookup derived from the BM25 index's file list, rebuilt when the index returns a new list
+_lookup: Optional[Dict[str, Any]] = None
+
+
+def _normalize(value: str) -> str:
+    return _NON_ALNUM.sub("", value.lower())
+
+
+def _filename_ids(filename: str) -> set:
+    # Whole parts of the filename that could be a policy id (they contain a digit): "HDF-001_terms.pdf"
+    # yields "hdf001". Parts between dashes and slashes count too when they are long enough not to be a
+    # year or a version: "bajaj-BAJHLIP23020V012223.pdf" yields "bajhlip23020v012223", "hdf-001" not "001".
+    parts = _FILENAME_SEPARATORS.split(filename) + [part for part in _NON_ALNUM.split(filename.lower()) if len(part) >= 6]
+    return {_normalize(part) for part in parts if any(c.isdigit() for c in part)}
+
+
+def _policy_lookup() -> Dict[str, Any]:
+    global _lookup
+    files = get_lexical_index().files()
+    lookup = _lookup
+    if lookup is None or lookup["files"] is not files:
+        by_id: Dict[str, List[str]] = {}
+        for filename, info in files.items():
+            for policy_id in _filename_ids(filename) | {_normalize(known) for known in info["policy_ids"]}:
+                by_id.setdefault(policy_id, []).append(filename)
+        lookup = {
+            "files": files,
+            "ids": by_id,
+            "names": [(filename, set(tokenize(f"{filename} {info['title']}"))) for filename, info in files.items()],
+        }
+        _lookup = lookup
+    return lookup
+
+
+def resolve_filenames(structured_query: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    # Documents matching the policy the query names: policy_id exactly against ids found in the text or
+    # parts of the filename, then policy_name against filename and title. None means no filter.
+    if not isinstance(structured_query, dict):
+        return None
+    lookup = _policy_lookup()
+    policy_id = _normalize(str(structured_query.get("policy_id") or ""))
+    if policy_id in lookup["ids"]:
+        return list(lookup["ids"][policy_id])
+    policy_name = str(structured_query.get("policy_name") or "")
+    name_terms = set(tokenize(policy_name)) - {"policy", "insurance", "plan"}
+    if name_terms:
+        matches = [filename for filename, terms in lookup["names"] if name_terms <= terms]
+        if matches:
+            return matches
+    return None
+
+
+def index_chunks(chunks: List[Dict[str, Any]], embeddings: np.ndarray) -> int:
+    # Vectors and BM25 postings are written together so both rankings see the same corpus
+    with stage_timer("index.vector"):
+        store_chunks(chunks, embeddings)
+    with stage_timer("index.lexical"):
+        get_lexical_index().add(
+            [chunk_vector_id(chunk) for chunk in chunks],
+            [chunk["text"] for chunk in chunks],
+            [chunk["metadata"] for chunk in chunks],
+        )
+    return len(chunks)
+
+
+def delete_chunks(ids: List[str]):
+    get_vector_store().delete(ids)
+    get_lexical_index().delete(ids)
+
+
+def update_chunk_metadata(chunks: List[Dict[str, Any]]) -> int:
+    # Chunks whose text is already indexed but moved (page, position); nothing is re-embedded
+    get_vector_store().update_metadata([chunk_vector_id(chunk) for chunk in chunks], [chunk["metadata"] for chunk in chunks])
+    return len(chunks)
+
+
+def delete_file(filename: str):
+    get_vector_store().delete_file(filename)
+    get_lexical_index().delete_file(filename)
+
+
+def is_indexed(filename: str, ids: List[str]) -> bool:
+    # Whether the vector store and the BM25 index both hold exactly these chunks of the file. The document
+    # registry is stored apart from them and can outlive an in-memory, wiped or switched vector backend.
+    info = get_lexical_index().files().get(filename)
+    if (info["chunks"] if info else 0) != len(ids):
+        return False
+    return not ids or len(get_vector_store().get(ids)) == len(ids)
+
+
+def _fuse(dense: List[Dict[str, Any]], lexical: List[Tuple[str, float]], n_results: int) -> List[Dict[str, Any]]:
+    hits: Dict[str, Dict[str, Any]] = {}
+    for rank, hit in enumerate(dense):
+        hits[hit["id"]] = {**hit, "score": 1 / (RRF_K + rank + 1), "dense_rank": rank + 1, "lexical_rank": None}
+    for rank, (id_, _) in enumerate(lexical):
+        hit = hits.setdefault(id_, {"id": id_, "score": 0.0, "dense_rank": None})
+        hit["score"] += 1 / (RRF_K + rank + 1)
+        hit["lexical_rank"] = rank + 1
+    return sorted(hits.values(), key=lambda hit: hit["score"], reverse=True)[:n_results]
+
+
+def retrieve_batch(
+    query_texts: List[str],
+    query_embeddings: np.ndarray,
+    n_results: int = 5,
+    structured_queries: Optional[List[Optional[Dict[str, Any]]]] = None,
+    filenames: Optional[List[str]] = None,
+) -> List[List[Dict[str, Any]]]:
+    # Hybrid search: dense and BM25 rankings over the same pre-filtered set of documents, merged
+    # with reciprocal rank fusion. Each hit carries its fused score and per-ranking ranks.
+    # Queries sharing a document filter go to the vector store as one multi-vector query, and
+    # identical (query, filter) pairs are searched once.
+    structured_queries = structured_queries or [None] * len(query_texts)
+    scopes = [filenames if filenames is not None else resolve_filenames(sq) for sq in structured_queries]
+    candidates = max(RETRIEVAL_CANDIDATES, n_results)
+    store = get_vector_store()
+
+    unique: Dict[Tuple[str, Optional[Tuple[str, ...]]], int] = {}
+    groups: Dict[Optional[Tuple[str, ...]], List[int]] = {}
+    for i, (text, scope) in enumerate(zip(query_texts, scopes)):
+        scope_key = tuple(sorted(scope)) if scope else None
+        if (text, scope_key) not in unique:
+            unique[(text, scope_key)] = i
+            groups.setdefault(scope_key, []).append(i)
+
+    rankings: Dict[int, List[Dict[str, Any]]] = {}
+    for scope_key, indexes in groups.items():
+        where = {"filename": {"$in": list(scope_key)}} if scope_key else None
+        with stage_timer("retrieve.dense"):
+            dense = store.query(query_embeddings[indexes], candidates, where)
+        for i, dense_hits in zip(indexes, dense):
+            with stage_timer("retrieve.lexical"):
+                lexical = get_lexical_index().search(query_texts[i], candidates, list(scope_key) if scope_key else None)
+            rankings[i] = _fuse(dense_hits, lexical, n_results)
+            for hit in rankings[i]:
+                source = "both" if hit["dense_rank"] and hit["lexical_rank"] else "dense" if hit["dense_rank"] else "lexical"
+                retrieved_chunks.inc(source=source)
+
+    # Lexical-only hits still need their text and metadata
+    missing = {hit["id"] for ranked in rankings.values() for hit in ranked if "text" not in hit}
+    if missing:
+        with stage_timer("retrieve.fetch"):
+            found = {record["id"]: record for record in store.get(sorted(missing))}
+        for i, ranked in rankings.items():
+            for hit in ranked:
+                if "text" not in hit and hit["id"] in found:
+                    hit.update(text=found[hit["id"]]["text"], metadata=found[hit["id"]]["metadata"])
+            rankings[i] = [hit for hit in ranked if "text" in hit]
+
+    results = []
+    for text, scope in zip(query_texts, scopes):
+        ranked = rankings[unique[(text, tuple(sorted(scope)) if scope else None)]]
+        results.append([dict(hit) for hit in ranked])
+    return results
+
+
+def retrieve(
+    query_text: str,
+    query_embedding: np.ndarray,
+    n_results: int = 5,
+    structured_query: Optional[Dict[str, Any]] = None,
+    filenames: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    return retrieve_batch([query_text], np.asarray(query_embedding, dtype=np.float32).reshape(1, -1), n_results, [structured_query], filenames)[0]
+
+
+async def index_chunks_async(chunks: List[Dict[str, Any]], embeddings: np.ndarray) -> int:
+    return await io_pool.run(index_chunks, chunks, embeddings)
+
+
+async def retrieve_async(
+    query_text: str,
+    query_embedding: np.ndarray,
+    n_results: int = 5,
+    structured_query: Optional[Dict[str, Any]] = None,
+    filenames: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    return await io_pool.run(retrieve, query_text, query_embedding, n_results, structured_query, filenames)
+
+
+async def retrieve_batch_async(
+    query_texts: List[str],
+    query_embeddings: np.ndarray,
+    n_results: int = 5,
+    structured_queries: Optional[List[Optional[Dict[str, Any]]]] = None,
+    filenames: Optional[List[str]] = None,
+) -> List[List[Dict[str, Any]]]:
+    return await io_pool.run(retrieve_batch, query_texts, query_embeddings, n_results, structured_queries, filenames)
@@ -1,27 +1,227 @@
-from typing import List, Dict, Any
+import hashlib
+import os
+import threading
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
 try:
     import chromadb
-    from chromadb.config import Settings
 except ImportError:
     chromadb = None
 
-_collection = None
+from app.services.executor import io_pool
 
-def get_chroma_collection(collection_name: str = "documents"):
-    global _collection
-    if _collection is None:
+# "chroma" or "numpy" (in-process memory-mapped index, see numpy_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# "persistent" keeps the corpus on disk across restarts, "memory" is process-local, "http" talks to a Chroma server
+CHROMA_MODE = os.getenv("CHROMA_MODE", "persistent")
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+# Chunks written per upsert call (capped by the client's own max batch size)
+CHROMA_BATCH_SIZE = int(os.getenv("CHROMA_BATCH_SIZE", "512"))
+
+_client = None
+_collections: Dict[str, Any] = {}
+# Ingestion jobs reach the store from several io_pool threads; the client must be created once
+_chroma_lock = threading.RLock()
+
+def get_chroma_client():
+    global _client
+    with _chroma_lock:
+        if _client is not None:
+            return _client
         if not chromadb:
             raise ImportError("chromadb is not installed.")
-        client = chromadb.Client(Settings(persist_directory="./chroma_db"))
-        _collection = client.get_or_create_collection(collection_name)
-    return _collection
-
-def store_in_chroma(chunks_with_embeddings: List[Dict[str, Any]], collection_name: str = "documents"):
-    collection = get_chroma_collection(collection_name)
-    for idx, chunk in enumerate(chunks_with_embeddings):
-        collection.add(
-            embeddings=[chunk["embedding"]],
-            documents=[chunk["text"]],
-            metadatas=[chunk["metadata"]],
-            ids=[f"{chunk['metadata']['filename']}_{chunk['metadata']['page']}_{chunk['metadata']['chunk_id']}"]
+        if CHROMA_MODE == "persistent":
+            _client = chromadb.PersistentClient(path=CHROMA_PATH)
+        elif CHROMA_MODE == "memory":
+            _client = chromadb.EphemeralClient()
+        elif CHROMA_MODE == "http":
+            _client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+        else:
+            raise ValueError(f"Unsupported CHROMA_MODE: {CHROMA_MODE}")
+        return _client
+
+def get_chroma_collection(collection_name: str = "documents"):
+    collection = _collections.get(collection_name)
+    if collection is None:
+        with _chroma_lock:
+            if collection_name not in _collections:
+                _collections[collection_name] = get_chroma_client().get_or_create_collection(collection_name)
+            collection = _collections[collection_name]
+    return collection
+
+
+class VectorStore:
+    # Backend interface. Query results are one list of hits per query embedding, best first;
+    # each hit is {"id", "text", "metadata", "score"} with higher scores meaning closer matches.
+    # `where` filters follow Chroma's syntax, e.g. {"filename": {"$in": [...]}}.
+    name = "base"
+
+    def load(self) -> int:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def query(self, query_embeddings: np.ndarray, n_results: int = 5, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def get(self, ids: List[str]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def delete_file(self, filename: str):
+        raise NotImplementedError
+
+
+class ChromaStore(VectorStore):
+    name = "chroma"
+
+    def __init__(self, collection_name: str = "documents"):
+        self.collection_name = collection_name
+
+    @property
+    def collection(self):
+        return get_chroma_collection(self.collection_name)
+
+    def load(self) -> int:
+        # Runs one query so the on-disk index is loaded before the first request
+        collection = self.collection
+        count = collection.count()
+        if count:
+            sample = collection.peek(1)
+            collection.query(query_embeddings=np.asarray(sample["embeddings"], dtype=np.float32), n_results=1, include=[])
+        return count
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def batch_size(self) -> int:
+        client = get_chroma_client()
+        max_batch_size = client.get_max_batch_size() if hasattr(client, "get_max_batch_size") else CHROMA_BATCH_SIZE
+        return max(1, min(CHROMA_BATCH_SIZE, max_batch_size))
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]):
+        collection = self.collection
+        batch_size = self.batch_size()
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            collection.upsert(
+                embeddings=embeddings[start:end],
+                documents=documents[start:end],
+                metadatas=metadatas[start:end],
+                ids=ids[start:end]
+            )
+
+    def query(self, query_embeddings: np.ndarray, n_results: int = 5, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances"]
         )
+        return [
+            [
+                {"id": id_, "text": doc, "metadata": meta, "score": -distance}
+                for id_, doc, meta, distance in zip(ids, docs, metas, distances)
+            ]
+            for ids, docs, metas, distances in zip(results["ids"], results["documents"], results["metadatas"], results["distances"])
+        ]
+
+    def get(self, ids: List[str]) -> List[Dict[str, Any]]:
+        if not ids:
+            return []
+        results = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return [
+            {"id": id_, "text": doc, "metadata": meta}
+            for id_, doc, meta in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        # Chroma merges updated metadata into the stored one; keys the new metadata drops (a chunk that moved
+        # out of a section) are sent as None, which removes them, so the result replaces like the other backends
+        collection = self.collection
+        batch_size = self.batch_size()
+        for start in range(0, len(ids), batch_size):
+            batch_ids = ids[start:start + batch_size]
+            stored = collection.get(ids=batch_ids, include=["metadatas"])
+            previous = dict(zip(stored["ids"], stored["metadatas"]))
+            batch = [
+                {**{key: None for key in (previous.get(id_) or {}) if key not in meta}, **meta}
+                for id_, meta in zip(batch_ids, metadatas[start:start + batch_size])
+            ]
+            collection.update(ids=batch_ids, metadatas=batch)
+
+    def delete_file(self, filename: str):
+        self.collection.delete(where={"filename": filename})
+
+
+_stores: Dict[str, VectorStore] = {}
+_stores_lock = threading.Lock()
+
+def get_vector_store(backend: Optional[str] = None) -> VectorStore:
+    backend = backend or VECTOR_BACKEND
+    with _stores_lock:
+        if backend not in _stores:
+            if backend == "chroma":
+                _stores[backend] = ChromaStore()
+            elif backend == "numpy":
+                from app.services.numpy_index import NumpyVectorStore
+                _stores[backend] = NumpyVectorStore()
+            else:
+                raise ValueError(f"Unsupported VECTOR_BACKEND: {backend}")
+    return _stores[backend]
+
+def load_vector_store() -> int:
+    return get_vector_store().load()
+
+def chunk_vector_id(chunk: Dict[str, Any]) -> str:
+    # Content-addressed: a chunk keeps its id when a revision only moves it to another page or position
+    digest = hashlib.sha256(chunk["text"].encode()).hexdigest()[:16]
+    return f"{chunk['metadata']['filename']}_{digest}"
+
+def store_chunks(chunks: List[Dict[str, Any]], embeddings: np.ndarray) -> int:
+    # `embeddings` is the (len(chunks), dim) float32 matrix from embedder.encode, handed to the backend as-is.
+    # Upserts keyed by deterministic ids make re-uploading the same document idempotent.
+    get_vector_store().upsert(
+        [chunk_vector_id(chunk) for chunk in chunks],
+        embeddings,
+        [chunk["text"] for chunk in chunks],
+        [chunk["metadata"] for chunk in chunks],
+    )
+    return len(chunks)
+
+def store_in_chroma(chunks_with_embeddings: List[Dict[str, Any]]):
+    embeddings = np.asarray([chunk["embedding"] for chunk in chunks_with_embeddings], dtype=np.float32)
+    store_chunks(chunks_with_embeddings, embeddings)
+
+
+def query_vectors(query_embeddings: np.ndarray, n_results: int = 5, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+    return get_vector_store().query(query_embeddings, n_results, where)
+
+
+async def store_chunks_async(chunks: List[Dict[str, Any]], embeddings: np.ndarray):
+    return await io_pool.run(store_chunks, chunks, embeddings)
+
+
+async def store_in_chroma_async(chunks_with_embeddings: List[Dict[str, Any]]):
+    return await io_pool.run(store_in_chroma, chunks_with_embeddings)
+
+
+async def query_vectors_async(query_embeddings: np.ndarray, n_results: int = 5, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+    return await io_pool.run(query_vectors, query_embeddings, n_results, where)
@@ -0,0 +1,112 @@
+# Claims per minute for a claim backlog: one /query call at a time (today's overnight job), concurrent
+# /query clients, and a single /query/batch request. Runs offline: a hashing stub stands in for the
+# encoder (with a fixed per-call cost), a StubProvider for the LLM, and the numpy vector backend in a
+# temporary directory holds a synthetic policy. The answer cache is off so every claim reaches the LLM.
+#
+#   cd backend && python -m benchmarks.bench_batch_query --claims 200 --llm-seconds 0.5
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import zlib
+
+_workdir = tempfile.mkdtemp(prefix="bench_batch_")
+os.environ.update(
+    VECTOR_BACKEND="numpy",
+    VECTOR_INDEX_PATH=os.path.join(_workdir, "vector_index"),
+    LEXICAL_INDEX_PATH=os.path.join(_workdir, "lexical_index.db"),
+    JOBS_DB_PATH=os.path.join(_workdir, "jobs.db"),
+    JOBS_SPOOL_DIR=os.path.join(_workdir, "spool"),
+    WARMUP_ON_STARTUP="0",
+    EMBEDDING_CACHE_ENABLED="0",
+    ANSWER_CACHE_ENABLED="0",
+)
+
+import httpx
+import numpy as np
+
+import app.main as main
+from app.services import embedder, providers, retriever
+from app.services.chunker import chunk_document
+from benchmarks.bench_context_packer import PROCEDURES, synthetic_policy
+
+ENCODE_CALL_SECONDS = 0.02
+ENCODE_TEXT_SECONDS = 0.001
+CITIES = ["Pune", "Mumbai", "Delhi", "Chennai", "Kolkata", "Jaipur"]
+
+
+def stub_encode(texts):
+    time.sleep(ENCODE_CALL_SECONDS + ENCODE_TEXT_SECONDS * len(texts))
+    out = np.zeros((len(texts), 384), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for word in text.lower().replace(",", " ").split():
+            out[i, zlib.crc32(word.encode()) % 384] += 1
+    return out
+
+
+def stub_llm_response(prompt: str) -> str:
+    return json.dumps({"decision": "approved", "amount": 10000, "justification": "Clause 1.1", "summary": "Covered.", "clauses_used": ["Clause 1.1"], "confidence": 0.9})
+
+
+def claims(count: int, duplicate_rate: float, rng: random.Random):
+    queries = []
+    for _ in range(count):
+        if queries and rng.random() < duplicate_rate:
+            queries.append(rng.choice(queries))
+        else:
+            queries.append(f"{rng.randint(18, 80)}{rng.choice('MF')}, {rng.choice(PROCEDURES)} in {rng.choice(CITIES)}, {rng.randint(1, 36)}-month-old policy")
+    return queries
+
+
+async def sequential(client, queries, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query):
+        async with semaphore:
+            response = await client.post("/query", json={"query": query})
+            assert response.status_code == 200, response.text
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    return time.perf_counter() - start
+
+
+async def batch(client, queries) -> tuple:
+    start = time.perf_counter()
+    response = await client.post("/query/batch", json={"queries": queries}, timeout=None)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return time.perf_counter() - start, lines[-1]
+
+
+async def run(count: int, llm_seconds: float, concurrency: int, duplicate_rate: float) -> dict:
+    rng = random.Random(0)
+    embedder.encode = stub_encode
+    providers.set_router(providers.ProviderRouter([providers.StubProvider("stub", latency=llm_seconds, response=stub_llm_response)]))
+    main.batch_limiter = main.RateLimiter(concurrency)
+    chunks = chunk_document(synthetic_policy(rng, 60), "policy.pdf")
+    retriever.index_chunks(chunks, stub_encode([chunk["text"] for chunk in chunks]))
+    queries = claims(count, duplicate_rate, rng)
+
+    results = {"claims": count, "llm_seconds": llm_seconds, "llm_concurrency": concurrency, "duplicate_rate": duplicate_rate}
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None) as client:
+            seconds = await sequential(client, queries, 1)
+            results["query_sequential"] = {"seconds": round(seconds, 2), "claims_per_minute": round(count / seconds * 60, 1)}
+            seconds = await sequential(client, queries, concurrency)
+            results[f"query_{concurrency}_clients"] = {"seconds": round(seconds, 2), "claims_per_minute": round(count / seconds * 60, 1)}
+            seconds, summary = await batch(client, queries)
+            results["query_batch"] = {"seconds": round(seconds, 2), "claims_per_minute": round(count / seconds * 60, 1), "llm_calls": summary["llm_calls"], "errors": summary["errors"]}
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--claims", type=int, default=200)
+    ap.add_argument("--llm-seconds", type=float, default=0.5)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duplicate-rate", type=float, default=0.1)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(run(args.claims, args.llm_seconds, args.concurrency, args.duplicate_rate)), indent=2))
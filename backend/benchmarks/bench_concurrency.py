@@ -0,0 +1,158 @@
+# Load test for /upload and /query: blocking handlers vs the pooled async pipeline.
+# Service calls are replaced by stubs with fixed CPU / I/O costs so the run is offline.
+#
+#   cd backend && python -m benchmarks.bench_concurrency --requests 32 --concurrency 16
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+_workdir = tempfile.mkdtemp(prefix="bench_concurrency_")
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(_workdir, "jobs.db"))
+os.environ.setdefault("JOBS_SPOOL_DIR", os.path.join(_workdir, "spool"))
+os.environ.setdefault("CHROMA_PATH", os.path.join(_workdir, "chroma_db"))
+os.environ.setdefault("LEXICAL_INDEX_PATH", os.path.join(_workdir, "lexical_index.db"))
+os.environ.setdefault("REGISTRY_DB_PATH", os.path.join(_workdir, "registry.db"))
+os.environ.setdefault("WARMUP_ON_STARTUP", "0")
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, File, UploadFile
+from pydantic import BaseModel
+
+import app.main as main
+from app.services import embedder, jobs, parser, providers, retriever
+
+PARSE_CPU_SECONDS = 0.05
+EMBED_SECONDS = 0.03
+STORE_SECONDS = 0.01
+LLM_SECONDS = 0.2
+
+
+def stub_parse_file(file_bytes: bytes, filename: str):
+    deadline = time.perf_counter() + PARSE_CPU_SECONDS
+    while time.perf_counter() < deadline:
+        pass
+    return [{"text": "clause text", "metadata": {"filename": filename, "page": 1, "chunk_id": i}} for i in range(8)]
+
+
+def stub_iter_parse_file(source, filename: str, parallel: bool = True, **kwargs):
+    yield from stub_parse_file(b"", filename)
+
+
+def stub_encode(texts):
+    time.sleep(EMBED_SECONDS)
+    return np.zeros((len(texts), 384), dtype=np.float32)
+
+
+def stub_index_chunks(chunks, embeddings):
+    time.sleep(STORE_SECONDS)
+    return len(chunks)
+
+
+def stub_retrieve(query_text, query_embedding, n_results=5, structured_query=None, filenames=None):
+    time.sleep(STORE_SECONDS)
+    hit = {"id": "stub.txt_1_0", "text": "clause text", "metadata": {"filename": "stub.txt", "page": 1, "chunk_id": 0}, "score": 1.0}
+    return [hit] * n_results
+
+
+def stub_llm_response(prompt: str) -> str:
+    return json.dumps({"decision": "approved", "amount": 0, "justification": "", "summary": "", "clauses_used": [], "confidence": 1.0})
+
+
+def install_stubs():
+    parser.parse_file = stub_parse_file
+    jobs.iter_parse_file = stub_iter_parse_file
+    embedder.encode = stub_encode
+    retriever.index_chunks = stub_index_chunks
+    retriever.retrieve = stub_retrieve
+    providers.set_router(providers.ProviderRouter([providers.StubProvider("stub", latency=LLM_SECONDS, response=stub_llm_response)]))
+
+
+class QueryRequest(BaseModel):
+    query: str
+
+
+def build_blocking_app() -> FastAPI:
+    # Mirrors the original handlers: every service call runs on the event loop
+    blocking = FastAPI()
+
+    @blocking.post("/upload")
+    async def upload_file(file: UploadFile = File(...)):
+        file_bytes = await file.read()
+        chunks = stub_parse_file(file_bytes, file.filename)
+        embeddings = stub_encode([c["text"] for c in chunks])
+        stub_index_chunks(chunks, embeddings)
+        return {"num_chunks": len(chunks)}
+
+    @blocking.post("/query")
+    async def process_query(request: QueryRequest):
+        time.sleep(LLM_SECONDS)
+        stub_retrieve(request.query, stub_encode([request.query]))
+        time.sleep(LLM_SECONDS)
+        return {"ok": True}
+
+    return blocking
+
+
+async def drive(app: FastAPI, endpoint: str, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i: int):
+            async with semaphore:
+                start = time.perf_counter()
+                if endpoint == "/upload":
+                    response = await client.post("/upload", files={"file": (f"doc{i}.txt", b"policy text", "text/plain")})
+                    response.raise_for_status()
+                    job_id = response.json().get("job_id")
+                    # Queued uploads count as done once their ingestion job completes
+                    while job_id:
+                        job = (await client.get(f"/jobs/{job_id}")).json()
+                        if job["status"] == "failed":
+                            raise RuntimeError(f"Ingestion job failed: {job['error']}")
+                        if job["status"] == "completed":
+                            break
+                        await asyncio.sleep(0.01)
+                else:
+                    response = await client.post("/query", json={"query": f"knee surgery {i}"})
+                    response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "req_per_sec": round(total / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+
+async def run(total: int, concurrency: int) -> dict:
+    install_stubs()
+    blocking = build_blocking_app()
+    results = {}
+    async with main.lifespan(main.app):
+        for endpoint in ("/upload", "/query"):
+            results[endpoint] = {
+                "blocking": await drive(blocking, endpoint, total, concurrency),
+                "pooled": await drive(main.app, endpoint, total, concurrency),
+            }
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=32)
+    ap.add_argument("--concurrency", type=int, default=16)
+    args = ap.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    print(json.dumps(asyncio.run(run(args.requests, args.concurrency)), indent=2))
@@ -0,0 +1,97 @@
+# Prompt size of the reasoning prompt before and after context packing (overlap dedup, relevance
+# trimming, token budget) on a synthetic policy chunked by the real chunker. Retrieval is simulated by
+# taking the chunks around a randomly picked clause, which is where the top 5 hits usually come from.
+#
+#   cd backend && python -m benchmarks.bench_context_packer --queries 200 --budget 1500
+import argparse
+import json
+import random
+import statistics
+import time
+
+from app.services.chunker import chunk_document
+from app.services.context_packer import count_tokens, pack_context, query_terms
+from app.services.llm import build_reasoning_prompt
+
+PROCEDURES = ["knee surgery", "cataract surgery", "angioplasty", "hip replacement", "dialysis", "appendectomy", "chemotherapy", "maternity care"]
+FILLER = [
+    "The insured person must notify the company within {n} hours of admission",
+    "Claims above Rs {n}000 are settled on a cashless basis at network hospitals and by reimbursement elsewhere",
+    "Pre-existing conditions are covered after {n} months of continuous coverage",
+    "Room rent is limited to {n} percent of the sum insured per day",
+    "Payments under this section are subject to a deductible of Rs {n}00",
+    "Treatment must be medically necessary and prescribed by a practitioner registered for at least {n} years",
+    "Documents must be submitted within {n} days of discharge",
+    "The company may appoint a medical practitioner to examine the insured person within {n} days",
+]
+
+
+def synthetic_policy(rng: random.Random, clauses: int) -> str:
+    lines = []
+    for number in range(1, clauses + 1):
+        procedure = rng.choice(PROCEDURES)
+        lines.append(f"Clause {number // 10 + 1}.{number % 10} {procedure.title()}")
+        sentences = [f"Expenses for {procedure} are covered up to Rs {rng.randint(1, 20) * 10000} after a waiting period of {rng.choice([3, 12, 24])} months."]
+        sentences += [rng.choice(FILLER).format(n=rng.randint(2, 999)) + "." for _ in range(rng.randint(8, 16))]
+        lines.append(" ".join(sentences))
+    return "\n".join(lines)
+
+
+def legacy_prompt(structured_query: dict, retrieved_chunks: list) -> str:
+    # build_reasoning_prompt before context packing: full chunks and an indented JSON dump
+    return (
+        "You are a strict insurance claim evaluator. Your task is to determine if a treatment is covered under a specific insurance policy based ONLY on the structured query and the exact clauses provided below.\n"
+        "You must only make decisions that can be supported by specific text in the provided clauses. If a decision cannot be made definitively, mark it as 'pending_info'.\n"
+        "Always mention the exact Clause number(s) you used in justification. Never invent or generalize clause numbers.\n"
+        "\nStructured Query:\n"
+        f"{json.dumps(structured_query, indent=2)}\n"
+        "\nRelevant Clauses:\n"
+        + "\n".join(f"Clause {chunk['metadata'].get('clause_number', i+1)}: {chunk['text']}" for i, chunk in enumerate(retrieved_chunks))
+        + "\n\nOutput ONLY valid JSON with no markdown. Format:\n"
+        '{\n  "decision": "approved | denied | pending_info | excluded",\n  "amount": 0,\n'
+        '  "justification": "Reason for decision, referencing specific clause numbers if applicable.",\n'
+        '  "clauses_used": ["Clause 4.2", "Clause 6.1"],\n  "summary": "Plain-language user-facing output",\n  "confidence": 0.0\n}\n'
+        "Also include a confidence score between 0.0 and 1.0 based on your certainty from the provided clauses. Use 0.95+ only for clear approvals/denials. Use <0.5 for vague cases.\n"
+        "Do NOT include code fences, markdown, or any explanation outside the JSON."
+    )
+
+
+def run(queries: int, budget: int, clauses: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    chunks = chunk_document(synthetic_policy(rng, clauses), "policy.pdf")
+    legacy, dedup_only, packed, pack_ms, duplicates = [], [], [], [], []
+    for _ in range(queries):
+        start = rng.randrange(max(1, len(chunks) - 5))
+        hits = chunks[start:start + 5]
+        procedure = rng.choice(PROCEDURES)
+        query = f"46M, {procedure} in Pune, 3-month-old policy"
+        structured_query = {"age": 46, "gender": "male", "procedure": procedure, "location": "Pune", "policy_duration_months": 3, "policy_name": None, "policy_id": None}
+        legacy.append(count_tokens(legacy_prompt(structured_query, hits)))
+        dedup_only.append(count_tokens(build_reasoning_prompt(structured_query, hits, query=query, token_budget=10 ** 9)))
+        began = time.perf_counter()
+        prompt = build_reasoning_prompt(structured_query, hits, query=query, token_budget=budget)
+        pack_ms.append((time.perf_counter() - began) * 1000)
+        packed.append(count_tokens(prompt))
+        _, stats = pack_context(hits, query_terms(query, structured_query), 10 ** 9)
+        duplicates.append(stats["duplicate_sentences"])
+    return {
+        "chunks": len(chunks),
+        "queries": queries,
+        "budget": budget,
+        "legacy_prompt_tokens_mean": round(statistics.mean(legacy), 1),
+        "dedup_only_prompt_tokens_mean": round(statistics.mean(dedup_only), 1),
+        "packed_prompt_tokens_mean": round(statistics.mean(packed), 1),
+        "packed_prompt_tokens_max": max(packed),
+        "duplicate_sentences_mean": round(statistics.mean(duplicates), 1),
+        "pack_ms_p50": round(statistics.median(pack_ms), 3),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--budget", type=int, default=1500)
+    ap.add_argument("--clauses", type=int, default=60)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    print(json.dumps(run(args.queries, args.budget, args.clauses, args.seed), indent=2))
@@ -0,0 +1,117 @@
+# Embedding backends compared on our own chunk corpus: the chunker's output for a synthetic policy is
+# encoded by each EMBEDDING_BACKEND in a fresh process, reporting cold start (import + model load + first
+# encode), texts/sec, peak RSS, and retrieval quality against the first backend listed: mean cosine
+# between the two backends' vectors of the same chunk, and overlap of each query's top-k chunks.
+#
+#   cd backend && python -m benchmarks.bench_embedding_backends --pages 200 --queries 100
+#   EMBEDDING_ONNX_PATH=./onnx_models/all-MiniLM-L6-v2 python -m benchmarks.bench_embedding_backends --threads 4
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKENDS = "sentence-transformers,onnx,onnx-int8"
+
+
+def build_corpus(pages: int, queries: int, seed: int) -> dict:
+    from app.services.chunker import chunk_pages
+    from benchmarks.synthetic_docs import PROCEDURES, policy_pages
+
+    rng = random.Random(seed)
+    chunks = [chunk["text"] for chunk in chunk_pages(enumerate(policy_pages(rng, pages), 1), "policy.pdf")]
+    cities = ["Pune", "Mumbai", "Delhi", "Chennai"]
+    query_texts = [
+        f"{rng.randint(20, 70)}{rng.choice('MF')}, {rng.choice(PROCEDURES)} in {rng.choice(cities)}, {rng.choice([3, 12, 24])}-month-old policy"
+        for _ in range(queries)
+    ]
+    return {"chunks": chunks, "queries": query_texts}
+
+
+def worker(corpus_path: str, out_path: str):
+    # Runs in its own process so cold start and RSS are those of one backend alone
+    with open(corpus_path) as f:
+        corpus = json.load(f)
+    start = time.perf_counter()
+    from app.services import embedder
+    embedder.warm_up()
+    cold_start = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunk_vectors = embedder.encode(corpus["chunks"])
+    encode_seconds = time.perf_counter() - start
+    query_vectors = embedder.encode(corpus["queries"])
+    np.savez(out_path, chunks=chunk_vectors, queries=query_vectors)
+    print(json.dumps({
+        "cold_start_seconds": round(cold_start, 2),
+        "texts_per_second": round(len(corpus["chunks"]) / encode_seconds, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "torch_loaded": "torch" in sys.modules,
+    }))
+
+
+def run_backend(backend: str, corpus_path: str, out_path: str, batch_size: int, threads: int) -> dict:
+    env = dict(os.environ, EMBEDDING_BACKEND=backend, EMBEDDING_BATCH_SIZE=str(batch_size), EMBEDDING_THREADS=str(threads), EMBEDDING_CACHE_ENABLED="0")
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_embedding_backends", "--worker", corpus_path, out_path],
+        env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["exit code %d" % proc.returncode])[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def top_k(chunks: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(queries @ chunks.T), axis=1)[:, :k]
+
+
+def run(backends: list, pages: int, queries: int, batch_size: int, threads: int, k: int, seed: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_embedding_")
+    corpus = build_corpus(pages, queries, seed)
+    corpus_path = os.path.join(workdir, "corpus.json")
+    with open(corpus_path, "w") as f:
+        json.dump(corpus, f)
+
+    results = {"chunks": len(corpus["chunks"]), "queries": queries, "batch_size": batch_size, "threads": threads, "backends": {}}
+    reference = None
+    for backend in backends:
+        out_path = os.path.join(workdir, f"{backend}.npz")
+        result = run_backend(backend, corpus_path, out_path, batch_size, threads)
+        results["backends"][backend] = result
+        if "error" in result:
+            continue
+        vectors = np.load(out_path)
+        if reference is None:
+            reference = (backend, vectors["chunks"], top_k(vectors["chunks"], vectors["queries"], k))
+            continue
+        name, reference_chunks, reference_top = reference
+        top = top_k(vectors["chunks"], vectors["queries"], k)
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, reference_top)])
+        result[f"vs_{name}"] = {
+            "mean_chunk_cosine": round(float(np.mean(np.sum(vectors["chunks"] * reference_chunks, axis=1))), 4),
+            f"top{k}_overlap": round(float(overlap), 3),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backends", default=BACKENDS)
+    ap.add_argument("--pages", type=int, default=200)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--batch-size", type=int, default=32)
+    ap.add_argument("--threads", type=int, default=0)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--worker", nargs=2, metavar=("CORPUS", "OUT"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.worker:
+        worker(*args.worker)
+    else:
+        print(json.dumps(run(args.backends.split(","), args.pages, args.queries, args.batch_size, args.threads, args.k, args.seed), indent=2))
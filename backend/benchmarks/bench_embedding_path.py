@@ -0,0 +1,101 @@
+# Memory and time per 1,000 chunks: list-of-floats embeddings + copied chunk dicts (old path)
+# vs one float32 matrix handed straight to the store (embedder.encode / vectorstore.store_chunks).
+# Encoder output is simulated with random vectors; pass --chroma to include an on-disk Chroma add.
+#
+#   cd backend && python -m benchmarks.bench_embedding_path --chunks 1000 --repeat 5
+import argparse
+import gc
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+DIM = 384
+
+
+def make_chunks(n: int):
+    return [
+        {"text": f"Clause {i} text " * 20, "metadata": {"filename": "bench.pdf", "page": i // 10 + 1, "chunk_id": i % 10}}
+        for i in range(n)
+    ]
+
+
+def list_path(chunks, encoded: np.ndarray, sink):
+    embeddings = encoded.tolist()
+    chunks_with_embeddings = []
+    for chunk, embedding in zip(chunks, embeddings):
+        chunk_with_embedding = chunk.copy()
+        chunk_with_embedding["embedding"] = embedding
+        chunks_with_embeddings.append(chunk_with_embedding)
+    sink(
+        [c["embedding"] for c in chunks_with_embeddings],
+        [c["text"] for c in chunks_with_embeddings],
+        [c["metadata"] for c in chunks_with_embeddings],
+    )
+
+
+def array_path(chunks, encoded: np.ndarray, sink):
+    embeddings = np.ascontiguousarray(encoded, dtype=np.float32)
+    sink(embeddings, [c["text"] for c in chunks], [c["metadata"] for c in chunks])
+
+
+def measure(path, chunks, encoded, sink, repeat: int) -> dict:
+    timings, peaks = [], []
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        path(chunks, encoded, sink)
+        timings.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {"ms": round(min(timings) * 1000, 2), "peak_mb": round(min(peaks) / 2 ** 20, 2)}
+
+
+def run(n_chunks: int, repeat: int, use_chroma: bool) -> dict:
+    chunks = make_chunks(n_chunks)
+    # sentence-transformers returns float32 by default
+    encoded = np.random.default_rng(0).standard_normal((n_chunks, DIM)).astype(np.float32)
+    sinks = {"no_store": lambda embeddings, documents, metadatas: None}
+    tmp_dir = None
+    if use_chroma:
+        import chromadb
+        tmp_dir = tempfile.mkdtemp(prefix="bench_embedding_path_")
+        client = chromadb.PersistentClient(path=tmp_dir)
+        counter = iter(range(10 ** 9))
+
+        def chroma_sink(embeddings, documents, metadatas):
+            collection = client.get_or_create_collection("bench")
+            offset = next(counter) * len(documents)
+            collection.add(embeddings=embeddings, documents=documents, metadatas=metadatas,
+                           ids=[str(offset + i) for i in range(len(documents))])
+
+        sinks["chroma"] = chroma_sink
+    results = {}
+    try:
+        for sink_name, sink in sinks.items():
+            old = measure(list_path, chunks, encoded, sink, repeat)
+            new = measure(array_path, chunks, encoded, sink, repeat)
+            scale = 1000 / n_chunks
+            results[sink_name] = {
+                "list_path": old,
+                "array_path": new,
+                "saved_ms_per_1k_chunks": round((old["ms"] - new["ms"]) * scale, 2),
+                "saved_mb_per_1k_chunks": round((old["peak_mb"] - new["peak_mb"]) * scale, 2),
+            }
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=1000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--chroma", action="store_true")
+    args = ap.parse_args()
+    print(json.dumps(run(args.chunks, args.repeat, args.chroma), indent=2))
@@ -0,0 +1,440 @@
+# End-to-end regression benchmark: a synthetic policy corpus in every supported format (PDF, DOCX, TXT, EML)
+# is parsed with parse_file, uploaded through /upload and the ingestion queue, and queried through /query,
+# /query/stream and /query/batch. Each phase reports throughput, p50/p95/p99 latency, the same percentiles for
+# every pipeline stage it ran (the stage names of GET /metrics) and peak memory. Runs offline: deterministic
+# local stand-ins replace OpenAI, Gemini and Ollama (latency and failures are a function of the prompt) and, by
+# default, the embedding model (a hashed bag of words with a fixed cost per call and per text).
+#
+# Everything else is the configured service, so backends are compared by rerunning with other settings:
+#
+#   cd backend && python -m benchmarks.bench_end_to_end --out results/numpy.json
+#   VECTOR_BACKEND=chroma python -m benchmarks.bench_end_to_end --out results/chroma.json --baseline results/numpy.json
+#   EMBEDDING_BACKEND=onnx-int8 EMBEDDING_ONNX_PATH=./onnx_models/all-MiniLM-L6-v2 python -m benchmarks.bench_end_to_end --embedder model
+import argparse
+import asyncio
+import email.message
+import io
+import json
+import logging
+import os
+import platform
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+_workdir = tempfile.mkdtemp(prefix="bench_end_to_end_")
+for _name, _value in {
+    "VECTOR_BACKEND": "numpy",
+    "VECTOR_INDEX_PATH": os.path.join(_workdir, "vector_index"),
+    "CHROMA_PATH": os.path.join(_workdir, "chroma_db"),
+    "LEXICAL_INDEX_PATH": os.path.join(_workdir, "lexical_index.db"),
+    "REGISTRY_DB_PATH": os.path.join(_workdir, "registry.db"),
+    "JOBS_DB_PATH": os.path.join(_workdir, "jobs.db"),
+    "JOBS_SPOOL_DIR": os.path.join(_workdir, "spool"),
+    "EMBEDDING_CACHE_PATH": os.path.join(_workdir, "embedding_cache.db"),
+    "WARMUP_ON_STARTUP": "0",
+    # Off unless asked for, so every query pays for retrieval and an LLM call
+    "EMBEDDING_CACHE_ENABLED": "0",
+    "ANSWER_CACHE_ENABLED": "0",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+import httpx
+import numpy as np
+
+try:
+    import docx
+except ImportError:
+    docx = None
+
+import app.main as main
+from app.services import embedder, parser, providers
+from app.services.metrics import collect_stage_samples
+from benchmarks.synthetic_docs import PROCEDURES, make_pdf, policy_pages
+
+CITIES = ["Pune", "Mumbai", "Delhi", "Chennai", "Kolkata", "Jaipur"]
+# Questions without a procedure miss the rules fast path and are structured by the LLM
+QUESTIONS = [
+    "What is the waiting period for pre-existing conditions?",
+    "How soon must the insurer be told about an admission?",
+    "Is room rent capped, and by how much?",
+    "Which documents are needed after discharge and by when?",
+]
+# Mean latency of each provider relative to --llm-seconds
+PROVIDER_SPEED = {"openai": 1.0, "gemini": 1.5, "ollama": 3.0}
+CONFIG_ENV = (
+    "VECTOR_BACKEND", "CHROMA_MODE", "EMBEDDING_BACKEND", "EMBEDDING_BATCH_SIZE", "EMBEDDING_THREADS", "EMBEDDING_CACHE_ENABLED",
+    "ANSWER_CACHE_ENABLED", "LLM_PROVIDERS", "LLM_HEDGING", "RETRIEVAL_CANDIDATES", "CHUNK_MAX_TOKENS", "BATCH_LLM_CONCURRENCY",
+)
+_PIECE = re.compile(r"\w{1,7}|[^\w\s]")
+
+
+def _unit(key: str) -> float:
+    # Uniform in [0, 1), fixed by the key
+    return zlib.crc32(key.encode()) / 2 ** 32
+
+
+class StubTokenizer:
+    # Word-piece-like ids (long words split every 7 characters) for the chunker's token counts
+    def __call__(self, texts, add_special_tokens: bool = True):
+        cls, sep = ([101], [102]) if add_special_tokens else ([], [])
+        return {"input_ids": [cls + [zlib.crc32(piece.encode()) % 30000 for piece in _PIECE.findall(text)] + sep for text in texts]}
+
+
+class StubEncoder:
+    # Stands in for embedder's model: deterministic unit vectors from hashed words, costing a fixed time per
+    # call and per text (sleeping, like the real runtimes, releases the GIL)
+    max_seq_length = embedder.MODEL_MAX_TOKENS
+
+    def __init__(self, call_seconds: float, text_seconds: float, dim: int = 384):
+        self.call_seconds = call_seconds
+        self.text_seconds = text_seconds
+        self.dim = dim
+        self.tokenizer = StubTokenizer()
+
+    def encode(self, texts, batch_size: int = 32, convert_to_numpy: bool = True):
+        time.sleep(self.call_seconds + self.text_seconds * len(texts))
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                out[i, zlib.crc32(word.encode()) % self.dim] += 1
+        out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+
+def stub_answer(prompt: str) -> str:
+    if prompt.startswith("Extract the following fields"):
+        return json.dumps({"age": None, "gender": None, "procedure": None, "location": None, "policy_duration_months": None, "policy_name": None, "policy_id": None})
+    clauses = re.findall(r"\b\d+\.\d+\b", prompt)[:2]
+    decision = "approved" if _unit(prompt) < 0.7 else "rejected"
+    return json.dumps({
+        "decision": decision,
+        "amount": 50000 if decision == "approved" else 0,
+        "justification": f"Decided under clause {clauses[0]}." if clauses else "No matching clause.",
+        "summary": f"Claim {decision}.",
+        "clauses_used": [f"Clause {clause}" for clause in clauses],
+        "confidence": 0.8,
+    })
+
+
+class LocalProvider(providers.StubProvider):
+    # Deterministic stand-in for a hosted provider: latency (mean +-40%) and failures depend only on the prompt
+    def __init__(self, name: str, seconds: float, error_rate: float):
+        super().__init__(name, latency=seconds, response=stub_answer, timeout=providers.LLM_TIMEOUTS.get(name, 30.0))
+        self.error_rate = error_rate
+
+    def _call(self, prompt: str) -> float:
+        latency = self.latency * (0.6 + 0.8 * _unit(f"{self.name}:latency:{prompt}"))
+        if _unit(f"{self.name}:error:{prompt}") < self.error_rate:
+            time.sleep(latency / 4)
+            raise ConnectionError(f"{self.name} stub: 503 Service Unavailable")
+        return latency
+
+    def complete(self, prompt: str) -> str:
+        time.sleep(self._call(prompt))
+        return self.response(prompt)
+
+    def stream(self, prompt: str):
+        latency = self._call(prompt)
+        time.sleep(latency / 2)
+        text = self.response(prompt)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        for chunk in chunks:
+            yield chunk
+            time.sleep(latency / 2 / len(chunks))
+
+
+def build_router(llm_seconds: float, error_rate: float) -> providers.ProviderRouter:
+    # Same providers and order as LLM_PROVIDERS; only the first one fails, so fallbacks are exercised
+    return providers.ProviderRouter([
+        LocalProvider(name, llm_seconds * PROVIDER_SPEED.get(name, 1.0), error_rate if i == 0 else 0.0)
+        for i, name in enumerate(providers.LLM_PROVIDERS)
+    ])
+
+
+def make_docx(pages) -> bytes:
+    document = docx.Document()
+    for text in pages:
+        for line in text.split("\n"):
+            document.add_paragraph(line)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def make_eml(pages, subject: str) -> bytes:
+    message = email.message.EmailMessage()
+    message["From"] = "underwriting@insurer.example"
+    message["To"] = "claims@insurer.example"
+    message["Subject"] = subject
+    message.set_content("\n\n".join(pages))
+    return bytes(message)
+
+
+def build_corpus(formats, docs: int, pages: int, rng: random.Random) -> list:
+    # [(filename, format, pages, bytes)]
+    corpus = []
+    for fmt in formats:
+        for i in range(docs):
+            texts = policy_pages(rng, pages)
+            name = f"policy_{fmt}_{i}.{fmt}"
+            if fmt == "pdf":
+                data = make_pdf(texts)
+            elif fmt == "docx":
+                data = make_docx(texts)
+            elif fmt == "eml":
+                data = make_eml(texts, f"Policy wording {i}")
+            else:
+                data = "\n\n".join(texts).encode()
+            corpus.append((name, fmt, pages, data))
+    return corpus
+
+
+def claims(count: int, rng: random.Random) -> list:
+    queries = []
+    for _ in range(count):
+        if rng.random() < 0.2:
+            queries.append(rng.choice(QUESTIONS))
+        else:
+            queries.append(f"{rng.randint(18, 80)}{rng.choice('MF')}, {rng.choice(PROCEDURES)} in {rng.choice(CITIES)}, {rng.randint(1, 36)}-month-old policy")
+    return queries
+
+
+def reset_peak_memory():
+    # Writing 5 to clear_refs resets the kernel's RSS high-water mark (VmHWM), so each phase gets its own peak
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+
+def peak_memory() -> dict:
+    try:
+        with open("/proc/self/status") as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    out = {"peak_rss_mb": round(rss_kb / 1024, 1)}
+    if tracemalloc.is_tracing():
+        out["peak_python_heap_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    return out
+
+
+def percentiles(seconds) -> dict:
+    if not seconds:
+        return {}
+    p50, p95, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2), "max_ms": round(max(seconds) * 1000, 2)}
+
+
+async def measure(name: str, work) -> dict:
+    # Runs `work()` -> (latencies in seconds, errors, extra fields) and summarises it with the stage samples
+    # and peak memory recorded meanwhile
+    reset_peak_memory()
+    with collect_stage_samples() as samples:
+        started = time.perf_counter()
+        latencies, errors, extra = await work()
+        seconds = time.perf_counter() - started
+    result = {
+        "count": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "per_second": round(len(latencies) / seconds, 2) if seconds else None,
+        "latency": percentiles(latencies),
+        **extra,
+        "stages": {stage: {"count": len(values), **percentiles(values)} for stage, values in sorted(samples.items())},
+        **peak_memory(),
+    }
+    print(f"{name}: {result['count']} in {result['seconds']}s, p95 {result['latency'].get('p95_ms')} ms, {errors} errors", file=sys.stderr)
+    return result
+
+
+def parse_phase(corpus, fmt: str):
+    async def work():
+        latencies, chunks = [], 0
+        for filename, doc_format, _, data in corpus:
+            if doc_format != fmt:
+                continue
+            started = time.perf_counter()
+            chunks += len(parser.parse_file(data, filename))
+            latencies.append(time.perf_counter() - started)
+        return latencies, 0, {"chunks": chunks}
+    return work
+
+
+async def bounded(concurrency: int, items, fn) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(item):
+        async with semaphore:
+            return await fn(item)
+
+    return await asyncio.gather(*(one(item) for item in items))
+
+
+def ingest_phase(client, corpus, concurrency: int):
+    async def upload(doc):
+        filename, _, _, data = doc
+        started = time.perf_counter()
+        response = await client.post("/upload", files={"file": (filename, data, "application/octet-stream")})
+        if response.status_code != 202:
+            return time.perf_counter() - started, None
+        job_id = response.json()["job_id"]
+        while True:
+            job = (await client.get(f"/jobs/{job_id}")).json()
+            if job["status"] in ("completed", "failed"):
+                return time.perf_counter() - started, job
+            await asyncio.sleep(0.01)
+
+    async def work():
+        done = await bounded(concurrency, corpus, upload)
+        jobs = [job for _, job in done]
+        return [latency for latency, _ in done], sum(job is None or job["status"] != "completed" for job in jobs), {
+            "pages": sum(doc[2] for doc in corpus),
+            "chunks": sum(job.get("num_chunks") or 0 for job in jobs if job),
+        }
+    return work
+
+
+def query_phase(client, queries, concurrency: int):
+    async def ask(query):
+        started = time.perf_counter()
+        response = await client.post("/query", json={"query": query})
+        return time.perf_counter() - started, response.status_code == 200 and "error" not in response.json()
+
+    async def work():
+        done = await bounded(concurrency, queries, ask)
+        return [latency for latency, _ in done], sum(not ok for _, ok in done), {"concurrency": concurrency}
+    return work
+
+
+def stream_phase(client, queries, concurrency: int):
+    # The in-process transport delivers the body at once, so time to first token comes from the result event
+    async def ask(query):
+        started = time.perf_counter()
+        response = await client.post("/query/stream", json={"query": query})
+        latency = time.perf_counter() - started
+        events = dict(re.findall(r"event: (\w+)\ndata: (.*)\n", response.text))
+        if "result" not in events:
+            return latency, None
+        return latency, json.loads(events["result"])["timings"].get("first_token_ms")
+
+    async def work():
+        done = await bounded(concurrency, queries, ask)
+        first_tokens = [ms / 1000 for _, ms in done if ms is not None]
+        return [latency for latency, _ in done], sum(ms is None for _, ms in done), {"concurrency": concurrency, "first_token": percentiles(first_tokens)}
+    return work
+
+
+def batch_phase(client, queries):
+    # One /query/batch request; a claim's latency is the shared retrieval plus its own reasoning, as reported
+    # on its line, and throughput is claims per second of the whole batch
+    async def work():
+        response = await client.post("/query/batch", json={"queries": queries})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        summary = lines[-1] if lines and lines[-1].get("done") else {}
+        answered = [line for line in lines if "index" in line and "error" not in line]
+        latencies = [(line["timings"]["retrieval_ms"] + line["timings"]["reason_ms"]) / 1000 for line in answered]
+        return latencies, len(queries) - len(answered), {"llm_calls": summary.get("llm_calls")}
+    return work
+
+
+def compare(results: dict, baseline: dict) -> dict:
+    # Ratios against an earlier results file: throughput (higher is better) and p95 latency (lower is better)
+    out = {}
+    for phase, result in results["phases"].items():
+        before = baseline.get("phases", {}).get(phase)
+        if not before:
+            continue
+        entry = {}
+        if result.get("per_second") and before.get("per_second"):
+            entry["throughput_ratio"] = round(result["per_second"] / before["per_second"], 3)
+        if result["latency"].get("p95_ms") and before["latency"].get("p95_ms"):
+            entry["p95_ratio"] = round(result["latency"]["p95_ms"] / before["latency"]["p95_ms"], 3)
+        entry["stages_p95_ratio"] = {
+            stage: round(stats["p95_ms"] / before["stages"][stage]["p95_ms"], 3)
+            for stage, stats in result["stages"].items()
+            if stats.get("p95_ms") and before.get("stages", {}).get(stage, {}).get("p95_ms")
+        }
+        out[phase] = entry
+    return out
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    if args.embedder == "stub":
+        embedder._model = StubEncoder(args.encode_call_ms / 1000, args.encode_text_ms / 1000)
+    providers.set_router(build_router(args.llm_seconds, args.llm_error_rate))
+    formats = [fmt for fmt in args.formats.split(",") if fmt != "docx" or docx]
+    corpus = build_corpus(formats, args.docs, args.pages, rng)
+    queries = claims(args.queries, rng)
+
+    results = {
+        "config": {
+            "seed": args.seed, "formats": formats, "docs_per_format": args.docs, "pages_per_doc": args.pages, "queries": args.queries,
+            "concurrency": args.concurrency, "ingest_concurrency": args.ingest_concurrency, "embedder": args.embedder,
+            "encode_call_ms": args.encode_call_ms, "encode_text_ms": args.encode_text_ms, "llm_seconds": args.llm_seconds,
+            "llm_error_rate": args.llm_error_rate, "tracemalloc": args.tracemalloc,
+            "env": {name: os.environ[name] for name in CONFIG_ENV if name in os.environ},
+        },
+        "system": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "phases": {},
+    }
+    if args.tracemalloc:
+        tracemalloc.start()
+    phases = results["phases"]
+    for fmt in formats:
+        phases[f"parse.{fmt}"] = await measure(f"parse.{fmt}", parse_phase(corpus, fmt))
+
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None) as client:
+            phases["ingest"] = await measure("ingest", ingest_phase(client, corpus, args.ingest_concurrency))
+            phases["query"] = await measure("query", query_phase(client, queries, args.concurrency))
+            if args.stream_queries:
+                phases["query_stream"] = await measure("query_stream", stream_phase(client, queries[:args.stream_queries], args.concurrency))
+            phases["query_batch"] = await measure("query_batch", batch_phase(client, queries))
+            results["llm"] = providers.get_router().stats()
+    if args.tracemalloc:
+        tracemalloc.stop()
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--formats", default="pdf,docx,txt,eml")
+    ap.add_argument("--docs", type=int, default=3, help="documents per format")
+    ap.add_argument("--pages", type=int, default=20, help="pages (sections for non-PDF formats) per document")
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--stream-queries", type=int, default=25)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--ingest-concurrency", type=int, default=2)
+    ap.add_argument("--embedder", choices=("stub", "model"), default="stub", help="'model' loads EMBEDDING_BACKEND for real")
+    ap.add_argument("--encode-call-ms", type=float, default=5.0)
+    ap.add_argument("--encode-text-ms", type=float, default=2.0)
+    ap.add_argument("--llm-seconds", type=float, default=0.25, help="mean latency of the first provider")
+    ap.add_argument("--llm-error-rate", type=float, default=0.05, help="share of prompts the first provider fails")
+    ap.add_argument("--tracemalloc", action="store_true", help="also report peak Python heap per phase (slows the run)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="write the results JSON here as well as to stdout")
+    ap.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    args = ap.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["vs_baseline"] = compare(results, json.load(f))
+    output = json.dumps(results, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    print(output)
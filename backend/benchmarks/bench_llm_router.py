@@ -0,0 +1,76 @@
+# Tail latency of the LLM provider router against local stub providers:
+# strict failover (no hedging) vs hedged requests, with a primary that stalls on a few calls,
+# and the circuit breaker with a primary that is down.
+#
+#   cd backend && python -m benchmarks.bench_llm_router --requests 200 --concurrency 8
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from app.services.providers import ProviderRouter, StubProvider
+import app.services.providers as providers
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def degraded_primary(stall_rate: float, timeout: float, seed: int):
+    rng = random.Random(seed)
+    # Usually 50-150 ms, but a few calls stall until the provider timeout
+    return StubProvider("primary", latency=lambda: timeout * 2 if rng.random() < stall_rate else rng.uniform(0.05, 0.15), response="ok", timeout=timeout)
+
+
+def secondary():
+    rng = random.Random(1)
+    return StubProvider("secondary", latency=lambda: rng.uniform(0.2, 0.3), response="ok")
+
+
+async def drive(router: ProviderRouter, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await router.complete("prompt")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return {
+        "seconds": round(time.perf_counter() - start, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "hedged_calls": router.hedged_calls,
+        "providers": {name: {"calls": s["calls"], "failures": s["failures"], "circuit": s["circuit"]} for name, s in router.stats()["providers"].items()},
+    }
+
+
+async def run(total: int, concurrency: int, stall_rate: float, timeout: float) -> dict:
+    providers.LLM_HEDGE_MIN_SAMPLES = 10
+    providers.LLM_HEDGE_MIN_DELAY = 0.05
+    results = {}
+    for name, hedging in (("failover", False), ("hedged", True)):
+        router = ProviderRouter([degraded_primary(stall_rate, timeout, seed=0), secondary()], hedging=hedging)
+        await drive(router, 20, 1)  # latency history for the p95 hedge delay
+        router.hedged_calls = 0
+        results[name] = await drive(router, total, concurrency)
+    down = StubProvider("primary", latency=0.01, error=ConnectionError("connection refused"))
+    results["primary_down_circuit_breaker"] = await drive(ProviderRouter([down, secondary()]), total, concurrency)
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--stall-rate", type=float, default=0.03)
+    ap.add_argument("--timeout", type=float, default=2.0)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.concurrency, args.stall_rate, args.timeout)), indent=2))
@@ -0,0 +1,94 @@
+# Re-ingesting a revised policy: first upload, identical re-upload, a revision with one amended clause,
+# and the same revision ingested from scratch (registry entry dropped, i.e. the old behaviour of
+# re-embedding every chunk). Runs offline through /upload and the ingestion queue; a stub encoder
+# with a fixed per-chunk cost (15 ms, roughly MiniLM on CPU at 256 tokens) stands in for the model and the numpy vector backend holds the index.
+#
+#   cd backend && python -m benchmarks.bench_reingest --pages 500
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+_workdir = tempfile.mkdtemp(prefix="bench_reingest_")
+os.environ.update(
+    VECTOR_BACKEND="numpy",
+    VECTOR_INDEX_PATH=os.path.join(_workdir, "vector_index"),
+    LEXICAL_INDEX_PATH=os.path.join(_workdir, "lexical_index.db"),
+    REGISTRY_DB_PATH=os.path.join(_workdir, "registry.db"),
+    JOBS_DB_PATH=os.path.join(_workdir, "jobs.db"),
+    JOBS_SPOOL_DIR=os.path.join(_workdir, "spool"),
+    WARMUP_ON_STARTUP="0",
+    EMBEDDING_CACHE_ENABLED="0",
+)
+
+import httpx
+import numpy as np
+
+import app.main as main
+from app.services import embedder
+from app.services.lexical_index import get_lexical_index
+from app.services.registry import get_registry
+from app.services.vectorstore import get_vector_store
+from benchmarks.synthetic_docs import make_pdf, policy_pages
+
+ENCODE_CALL_SECONDS = 0.01
+ENCODE_CHUNK_SECONDS = 0.015
+embedded = 0
+
+
+def stub_encode(texts):
+    global embedded
+    embedded += len(texts)
+    time.sleep(ENCODE_CALL_SECONDS + ENCODE_CHUNK_SECONDS * len(texts))
+    rng = np.random.default_rng(len(texts))
+    return rng.standard_normal((len(texts), 384)).astype(np.float32)
+
+
+async def ingest(client, pdf: bytes, filename: str) -> dict:
+    global embedded
+    embedded = 0
+    start = time.perf_counter()
+    job_id = (await client.post("/upload", files={"file": (filename, pdf, "application/pdf")})).json()["job_id"]
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("completed", "failed"):
+            break
+        await asyncio.sleep(0.02)
+    assert job["status"] == "completed", job["error"]
+    return {"seconds": round(time.perf_counter() - start, 2), "chunks_embedded": embedded, "changes": job["changes"]}
+
+
+async def run(pages: int) -> dict:
+    embedder.encode = stub_encode
+    rng = random.Random(0)
+    original = policy_pages(rng, pages)
+    revised = list(original)
+    page = pages // 2
+    revised[page] = revised[page].replace(revised[page].split("\n")[1], "Expenses for this procedure are covered up to Rs 500000 after a waiting period of 6 months.", 1)
+    filename = "policy.pdf"
+
+    results = {"pages": pages}
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None) as client:
+            results["first_upload"] = await ingest(client, make_pdf(original), filename)
+            results["identical_reupload"] = await ingest(client, make_pdf(original), filename)
+            results["one_clause_amended"] = await ingest(client, make_pdf(revised), filename)
+            get_registry().forget(filename)
+            results["amended_full_reingest"] = await ingest(client, make_pdf(revised), filename)
+    store = get_vector_store()
+    results["indexed_chunks"] = {
+        "registry": len(get_registry().chunks(filename)),
+        "vector_store": store.count(),
+        "lexical_index": get_lexical_index().files()[filename]["chunks"],
+    }
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=500)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(run(args.pages)), indent=2))
@@ -0,0 +1,109 @@
+# Parse rate and cost of the tolerant response parser vs the old regex + json.loads cascade on a corpus of
+# malformed LLM outputs (benchmarks/data/malformed_outputs.jsonl: fences, prose, trailing commas, single
+# quotes, comments, truncated objects, nested objects). Every output a parser cannot turn into a valid
+# response would have been escalated to an LLM repair call.
+#
+#   cd backend && python -m benchmarks.bench_response_parser --repeat 200
+import argparse
+import json
+import os
+import re
+import time
+
+from app.services.response_parser import REQUIRED_FIELDS, ResponseParser, validate_field
+
+try:
+    import demjson3
+except ImportError:
+    demjson3 = None
+
+try:
+    import rapidjson
+except ImportError:
+    rapidjson = None
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "malformed_outputs.jsonl")
+
+
+def legacy_extract(content: str) -> dict:
+    # extract_json_from_response before the tolerant decoder
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`\n")
+    cleaned_lines = []
+    for line in content.splitlines():
+        line = line.strip()
+        if line in {"...", "…", ""}:
+            continue
+        if line.startswith("#") or line.lower().startswith("note") or line.lower().startswith("explanation"):
+            continue
+        cleaned_lines.append(line)
+    match = re.search(r"\{[\s\S]*?\}", "\n".join(cleaned_lines))
+    if match:
+        return json.loads(match.group(0))
+    raise ValueError("No JSON object found in LLM response")
+
+
+def legacy_parse(content: str):
+    for decode in (legacy_extract, demjson3 and demjson3.decode, rapidjson and rapidjson.loads):
+        if decode is None:
+            continue
+        try:
+            return decode(content)
+        except Exception:
+            continue
+    return None
+
+
+def schema_valid(result) -> bool:
+    if not isinstance(result, dict):
+        return False
+    try:
+        for field in REQUIRED_FIELDS:
+            validate_field(field, result[field])
+    except (KeyError, ValueError, TypeError):
+        return False
+    return True
+
+
+def tolerant_parse(content: str):
+    parser = ResponseParser()
+    parser.feed(content)
+    result = parser.finish()
+    return result if parser.valid else None
+
+
+def measure(parse, cases, repeat: int) -> dict:
+    valid = [schema_valid(parse(case["text"])) for case in cases]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for case in cases:
+            parse(case["text"])
+    elapsed = time.perf_counter() - start
+    expected_valid = [case["valid"] for case in cases]
+    return {
+        "schema_valid": sum(valid),
+        "correct": sum(v == e for v, e in zip(valid, expected_valid)),
+        "llm_repairs_needed": sum(e and not v for v, e in zip(valid, expected_valid)),
+        "failed_cases": [case["name"] for case, v, e in zip(cases, valid, expected_valid) if e and not v],
+        "us_per_doc": round(elapsed / (repeat * len(cases)) * 1e6, 1),
+    }
+
+
+def run(repeat: int) -> dict:
+    with open(CORPUS, encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    legacy_name = "legacy_regex_json" + ("+demjson3" if demjson3 else "") + ("+rapidjson" if rapidjson else "")
+    return {
+        "documents": len(cases),
+        "recoverable": sum(case["valid"] for case in cases),
+        legacy_name: measure(legacy_parse, cases, repeat),
+        "tolerant_parser": measure(tolerant_parse, cases, repeat),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+    print(json.dumps(run(args.repeat), indent=2))
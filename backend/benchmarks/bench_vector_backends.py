@@ -0,0 +1,93 @@
+# recall@k and single-query latency of the vector store backends on a synthetic clustered corpus:
+# numpy brute force, numpy IVF, and Chroma (on-disk PersistentClient, when installed).
+# Ground truth is exact cosine top-k.
+#
+#   cd backend && python -m benchmarks.bench_vector_backends --corpus 20000 --queries 200 --k 5
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.numpy_index import NumpyVectorStore
+from app.services.vectorstore import ChromaStore, chromadb
+import app.services.vectorstore as vectorstore
+
+DIM = 384
+
+
+def make_corpus(n: int, n_queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 100), DIM)).astype(np.float32)
+    corpus = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.standard_normal((n, DIM)).astype(np.float32)
+    queries = corpus[rng.integers(0, n, n_queries)] + 0.3 * rng.standard_normal((n_queries, DIM)).astype(np.float32)
+    return corpus.astype(np.float32), queries.astype(np.float32)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    c = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(q @ c.T), axis=1)[:, :k]
+
+
+def evaluate(store, corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    ids = [str(i) for i in range(len(corpus))]
+    metadatas = [{"filename": f"policy_{i % 50}.pdf", "page": 1, "chunk_id": i} for i in range(len(corpus))]
+    start = time.perf_counter()
+    for offset in range(0, len(corpus), 2048):
+        end = offset + 2048
+        store.upsert(ids[offset:end], corpus[offset:end], [f"chunk {i}" for i in range(offset, min(end, len(corpus)))], metadatas[offset:end])
+    build_seconds = time.perf_counter() - start
+    store.query(queries[:1], k)
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = store.query(query[None, :], k)[0]
+        latencies.append(time.perf_counter() - start)
+        hits += len({int(hit["id"]) for hit in result} & set(expected.tolist()))
+    latencies.sort()
+    return {
+        f"recall@{k}": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3),
+        "build_seconds": round(build_seconds, 2),
+    }
+
+
+def run(corpus_size: int, n_queries: int, k: int, nprobe: int) -> dict:
+    corpus, queries = make_corpus(corpus_size, n_queries)
+    truth = exact_top_k(corpus, queries, k)
+    results = {}
+    tmp_dirs = []
+    try:
+        backends = {
+            "numpy_flat": lambda path: NumpyVectorStore(path, ivf_min_rows=0),
+            "numpy_ivf": lambda path: NumpyVectorStore(path, ivf_min_rows=1000, nprobe=nprobe),
+        }
+        if chromadb:
+            def chroma(path):
+                vectorstore.CHROMA_MODE, vectorstore.CHROMA_PATH = "persistent", path
+                vectorstore._client = None
+                vectorstore._collections.clear()
+                return ChromaStore()
+            backends["chroma"] = chroma
+        for name, make_store in backends.items():
+            tmp_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+            tmp_dirs.append(tmp_dir)
+            results[name] = evaluate(make_store(tmp_dir), corpus, queries, truth, k)
+    finally:
+        for tmp_dir in tmp_dirs:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", type=int, default=20000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--nprobe", type=int, default=16)
+    args = ap.parse_args()
+    print(json.dumps(run(args.corpus, args.queries, args.k, args.nprobe), indent=2))
@@ -0,0 +1,87 @@
+# Chroma write throughput (chunks/sec) against an on-disk PersistentClient:
+# one add() per chunk (old store_in_chroma) vs batched upserts at several batch sizes.
+#
+#   cd backend && python -m benchmarks.bench_vectorstore_writes --chunks 2000 --batch-sizes 64,256,1024
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import chromadb
+except ImportError:
+    chromadb = None
+
+DIM = 384
+
+
+def make_chunks(n: int):
+    return [
+        {"text": f"Clause {i} covers procedure {i % 97} after a waiting period.", "metadata": {"filename": "bench.pdf", "page": i // 10 + 1, "chunk_id": i % 10}}
+        for i in range(n)
+    ]
+
+
+def vector_id(metadata) -> str:
+    return f"{metadata['filename']}_{metadata['page']}_{metadata['chunk_id']}"
+
+
+def per_chunk_add(collection, chunks, embeddings):
+    for chunk, embedding in zip(chunks, embeddings.tolist()):
+        collection.add(embeddings=[embedding], documents=[chunk["text"]], metadatas=[chunk["metadata"]], ids=[vector_id(chunk["metadata"])])
+
+
+def batched_upsert(batch_size: int):
+    def write(collection, chunks, embeddings):
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            collection.upsert(
+                embeddings=embeddings[start:start + batch_size],
+                documents=[chunk["text"] for chunk in batch],
+                metadatas=[chunk["metadata"] for chunk in batch],
+                ids=[vector_id(chunk["metadata"]) for chunk in batch],
+            )
+    return write
+
+
+def timed(write, chunks, embeddings) -> dict:
+    tmp_dir = tempfile.mkdtemp(prefix="bench_vectorstore_writes_")
+    try:
+        client = chromadb.PersistentClient(path=tmp_dir)
+        collection = client.get_or_create_collection("documents")
+        start = time.perf_counter()
+        write(collection, chunks, embeddings)
+        elapsed = time.perf_counter() - start
+        assert collection.count() == len(chunks)
+        # A second identical write must not fail or duplicate (idempotent re-upload)
+        rewrite = None
+        if write is not per_chunk_add:
+            start = time.perf_counter()
+            write(collection, chunks, embeddings)
+            rewrite = round(time.perf_counter() - start, 3)
+            assert collection.count() == len(chunks)
+        return {"seconds": round(elapsed, 3), "chunks_per_sec": round(len(chunks) / elapsed, 1), "reupload_seconds": rewrite}
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def run(n_chunks: int, batch_sizes) -> dict:
+    if not chromadb:
+        raise ImportError("chromadb is not installed.")
+    chunks = make_chunks(n_chunks)
+    embeddings = np.random.default_rng(0).standard_normal((n_chunks, DIM)).astype(np.float32)
+    results = {"per_chunk_add": timed(per_chunk_add, chunks, embeddings)}
+    for batch_size in batch_sizes:
+        results[f"upsert_batch_{batch_size}"] = timed(batched_upsert(batch_size), chunks, embeddings)
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=2000)
+    ap.add_argument("--batch-sizes", default="64,256,1024")
+    args = ap.parse_args()
+    print(json.dumps(run(args.chunks, [int(b) for b in args.batch_sizes.split(",")]), indent=2))
@@ -0,0 +1,60 @@
+# Synthetic policy documents for offline benchmarks.
+import random
+from typing import List
+
+PROCEDURES = ["knee surgery", "cataract surgery", "angioplasty", "hip replacement", "dialysis", "appendectomy", "chemotherapy", "maternity care"]
+CLAUSE_SENTENCES = [
+    "Expenses for {procedure} are covered up to Rs {amount} after a waiting period of {months} months.",
+    "The insured person must notify the company within {n} hours of admission for {procedure}.",
+    "Claims above Rs {n}000 are settled on a cashless basis at network hospitals and by reimbursement elsewhere.",
+    "Pre-existing conditions are covered after {n} months of continuous coverage.",
+    "Room rent is limited to {n} percent of the sum insured per day.",
+    "Payments under this section are subject to a deductible of Rs {n}00.",
+    "Documents must be submitted within {n} days of discharge.",
+]
+
+
+def policy_pages(rng: random.Random, pages: int, clauses_per_page: int = 3) -> List[str]:
+    # One text per page, each made of numbered clauses
+    texts = []
+    for page in range(1, pages + 1):
+        lines = []
+        for clause in range(1, clauses_per_page + 1):
+            procedure = rng.choice(PROCEDURES)
+            lines.append(f"{page}.{clause} {procedure.title()}")
+            for template in rng.sample(CLAUSE_SENTENCES, 4):
+                lines.append(template.format(procedure=procedure, amount=rng.randint(1, 20) * 10000, months=rng.choice([3, 12, 24]), n=rng.randint(2, 999)))
+        texts.append("\n".join(lines))
+    return texts
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    # Minimal single-font PDF with one text page per entry; enough for pdfplumber's text extraction
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = len(objects) + 1 + 2 * len(pages)
+    page_ids = []
+    for text in pages:
+        lines = [line.replace("\\", "").replace("(", "").replace(")", "") for line in text.split("\n")]
+        stream = ("BT /F1 9 Tf 30 810 Td 11 TL " + " ".join(f"({line}) '" for line in lines) + " ET").encode("latin-1", "replace")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R /Resources << /Font << /F1 %d 0 R >> >> >>"
+            % (pages_id, content, font)
+        ))
+    assert add(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % i for i in page_ids) + b"] /Count %d >>" % len(page_ids)) == pages_id
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1) + b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return out
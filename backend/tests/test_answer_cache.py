@@ -0,0 +1,91 @@
+import numpy as np
+
+from app.services import answer_cache
+from app.services.answer_cache import AnswerCache
+
+QUERY = {"procedure": "Knee Surgery", "age": 46, "gender": "male", "location": "Pune", "policy_duration_months": 3}
+CHUNKS = ["policy.pdf_aaa", "policy.pdf_bbb"]
+APPROVED = {"decision": "approved"}
+
+
+def embedding(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_exact_tier_ignores_case_spacing_empty_fields_and_chunk_order():
+    cache = AnswerCache()
+    cache.store(QUERY, CHUNKS, ["policy.pdf"], APPROVED)
+
+    reworded = {**QUERY, "procedure": "  knee   SURGERY ", "policy_id": None, "policy_name": ""}
+    assert cache.lookup(reworded, list(reversed(CHUNKS))) == (APPROVED, "exact")
+    assert cache.lookup({**QUERY, "procedure": "hip surgery"}, CHUNKS) == (None, None)
+    assert cache.lookup(QUERY, CHUNKS[:1]) == (None, None)
+    assert cache.stats()["exact_hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_semantic_tier_needs_similarity_same_chunks_and_strict_fields():
+    cache = AnswerCache(similarity=0.95)
+    cache.store(QUERY, CHUNKS, ["policy.pdf"], APPROVED, embedding(1.0, 0.0))
+    reworded = {**QUERY, "procedure": "knee operation", "location": "Mumbai"}
+
+    assert cache.lookup(reworded, CHUNKS, embedding(0.99, 0.1)) == (APPROVED, "semantic")
+    # Below the threshold
+    assert cache.lookup(reworded, CHUNKS, embedding(0.8, 0.6)) == (None, None)
+    # Same wording, but other clauses were retrieved
+    assert cache.lookup(reworded, ["policy.pdf_aaa", "policy.pdf_ccc"], embedding(1.0, 0.0)) == (None, None)
+    # A different age or gender can change the decision
+    assert cache.lookup({**reworded, "age": 64}, CHUNKS, embedding(1.0, 0.0)) == (None, None)
+    assert cache.lookup({**reworded, "gender": "female"}, CHUNKS, embedding(1.0, 0.0)) == (None, None)
+    # Without an embedding only the exact tier applies
+    assert cache.lookup(reworded, CHUNKS) == (None, None)
+
+
+def test_semantic_tier_returns_the_closest_entry():
+    cache = AnswerCache(similarity=0.9)
+    cache.store({**QUERY, "procedure": "knee surgery"}, CHUNKS, ["policy.pdf"], APPROVED, embedding(1.0, 0.0))
+    cache.store({**QUERY, "procedure": "knee replacement"}, CHUNKS, ["policy.pdf"], {"decision": "denied"}, embedding(0.9, 0.43589))
+
+    assert cache.lookup({**QUERY, "procedure": "knee op"}, CHUNKS, embedding(0.92, 0.39))[0] == {"decision": "denied"}
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = AnswerCache(ttl_seconds=60)
+    cache.store(QUERY, CHUNKS, ["policy.pdf"], APPROVED, embedding(1.0, 0.0))
+
+    now[0] += 59
+    assert cache.lookup(QUERY, CHUNKS)[1] == "exact"
+    now[0] += 2
+    assert cache.lookup({**QUERY, "procedure": "knee op"}, CHUNKS, embedding(1.0, 0.0)) == (None, None)
+    assert cache.lookup(QUERY, CHUNKS) == (None, None)
+    assert cache.stats()["entries"] == 0 and cache.stats()["evictions"] == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = AnswerCache(max_entries=2)
+    queries = [{**QUERY, "procedure": name} for name in ("knee surgery", "cataract surgery", "dialysis")]
+    cache.store(queries[0], CHUNKS, ["policy.pdf"], {"decision": "first"})
+    cache.store(queries[1], CHUNKS, ["policy.pdf"], {"decision": "second"})
+    # Reading the first entry makes the second the least recently used
+    assert cache.lookup(queries[0], CHUNKS)[1] == "exact"
+    cache.store(queries[2], CHUNKS, ["policy.pdf"], {"decision": "third"})
+
+    assert cache.lookup(queries[1], CHUNKS) == (None, None)
+    assert cache.lookup(queries[0], CHUNKS)[0] == {"decision": "first"}
+    assert cache.lookup(queries[2], CHUNKS)[0] == {"decision": "third"}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_files_drops_the_answers_citing_them():
+    cache = AnswerCache()
+    other = {**QUERY, "procedure": "dialysis"}
+    cache.store(QUERY, CHUNKS, ["policy.pdf"], APPROVED, embedding(1.0, 0.0))
+    cache.store(other, ["other.pdf_ccc"], ["other.pdf"], {"decision": "denied"}, embedding(0.0, 1.0))
+
+    assert cache.invalidate_files(["policy.pdf"]) == 1
+    assert cache.lookup(QUERY, CHUNKS) == (None, None)
+    assert cache.lookup({**QUERY, "procedure": "knee op"}, CHUNKS, embedding(1.0, 0.0)) == (None, None)
+    assert cache.lookup(other, ["other.pdf_ccc"])[1] == "exact"
+    assert cache.invalidate_files(["missing.pdf"]) == 0
+    assert cache.stats()["invalidations"] == 1
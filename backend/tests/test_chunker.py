@@ -0,0 +1,99 @@
+import pytest
+
+from app.services import chunker
+from app.services.chunker import chunk_document, chunk_pages, match_heading
+
+
+@pytest.fixture(autouse=True)
+def approximate_tokens(monkeypatch):
+    # Keeps the tests independent of whichever tokenizer the embedding backend would load
+    monkeypatch.setattr(chunker, "count_tokens", lambda texts: [chunker._approx_count(text) for text in texts])
+
+
+def labels(chunks):
+    return [(chunk["metadata"].get("clause_number"), chunk["metadata"].get("section")) for chunk in chunks]
+
+
+def test_match_heading():
+    assert match_heading("4.2 Knee Surgery") == {"clause_number": "4.2", "section": "Knee Surgery"}
+    assert match_heading("Clause 7: Exclusions") == {"clause_number": "7", "section": "Exclusions"}
+    assert match_heading("4. Exclusions") == {"clause_number": "4", "section": "Exclusions"}
+    assert match_heading("4.1 Knee surgery is covered after 24 months.") == {"clause_number": "4.1"}
+    assert match_heading("1. The insured must notify the company within 48 hours.") == {}
+    assert match_heading("The policy covers knee surgery.") == {}
+    assert match_heading("12.5 Lakhs is the sum insured under this plan.") == {}
+    assert match_heading("2.5 Percent of the sum insured is payable per day.") == {}
+
+
+def test_amount_lines_stay_in_their_clause():
+    text = "\n".join([
+        "3.1 Sum Insured",
+        "The sum insured is stated in the schedule.",
+        "12.5 Lakhs is the sum insured for the family floater.",
+        "3.2 Room Rent",
+        "Room rent is limited to 1 percent of the sum insured.",
+    ])
+    chunks = chunk_document(text, "policy.txt")
+    assert labels(chunks) == [("3.1", "Sum Insured"), ("3.2", "Room Rent")]
+    assert "12.5 Lakhs" in chunks[0]["text"]
+
+
+def test_single_line_clauses_are_separate_chunks():
+    text = "\n".join([
+        "Section 4 Waiting Periods",
+        "4.1 Knee surgery is covered after 24 months.",
+        "4.2 Cataract surgery is covered after 12 months.",
+        "4.3 Hernia repair is covered after 24 months.",
+        "4.4 Dialysis",
+        "Dialysis is covered from day one.",
+    ])
+    chunks = chunk_document(text, "policy.txt")
+    assert labels(chunks) == [("4.1", None), ("4.2", None), ("4.3", None), ("4.4", "Dialysis")]
+    # The section title has no text of its own and is folded into the first clause
+    assert chunks[0]["text"] == "Section 4 Waiting Periods 4.1 Knee surgery is covered after 24 months."
+    assert chunks[3]["text"] == "4.4 Dialysis Dialysis is covered from day one."
+
+
+def test_numbered_list_inside_a_clause_is_body_text():
+    text = "\n".join([
+        "4.2 Claim Notification",
+        "The insured must follow these steps:",
+        "1. The insured must notify the company within 48 hours.",
+        "2. Original bills must be submitted within 30 days.",
+        "3. Discharge Summary",
+        "4.3 Room Rent",
+        "Room rent is limited to 1 percent of the sum insured.",
+        "5. Exclusions",
+        "Cosmetic surgery is not covered.",
+    ])
+    chunks = chunk_document(text, "policy.txt")
+    assert labels(chunks) == [("4.2", "Claim Notification"), ("4.3", "Room Rent"), ("5", "Exclusions")]
+    assert "2. Original bills" in chunks[0]["text"] and "3. Discharge Summary" in chunks[0]["text"]
+
+
+def test_heading_carries_over_page_breaks():
+    pages = [(1, "3.1 Maternity\nMaternity expenses are covered."), (2, "Newborn care is covered for 90 days.")]
+    chunks = list(chunk_pages(pages, "policy.pdf"))
+    assert [chunk["metadata"]["page"] for chunk in chunks] == [1, 2]
+    assert labels(chunks) == [("3.1", "Maternity"), ("3.1", "Maternity")]
+
+
+def test_windows_respect_budget_and_overlap():
+    sentences = [f"Sentence number {i} describes a covered benefit in some detail." for i in range(20)]
+    chunks = chunk_document("2.1 Benefits\n" + " ".join(sentences), "policy.txt")
+    assert len(chunks) > 1
+    assert all(chunk["metadata"]["token_count"] <= chunker.CHUNK_MAX_TOKENS for chunk in chunks)
+    # Each window starts with the trailing sentences of the one before it, up to the overlap budget
+    windows = [[s for s in sentences if s in chunk["text"]] for chunk in chunks]
+    for previous, current in zip(windows, windows[1:]):
+        overlap = [s for s in current if s in previous]
+        assert overlap and overlap == previous[-len(overlap):] == current[:len(overlap)]
+        assert sum(chunker._approx_count(s) for s in overlap) <= chunker.CHUNK_OVERLAP_TOKENS
+    assert [chunk["metadata"]["chunk_id"] for chunk in chunks] == list(range(len(chunks)))
+
+
+def test_oversized_sentence_is_split():
+    sentence = " ".join(["word"] * 50)
+    chunks = list(chunk_pages([(1, sentence)], "policy.txt", max_tokens=20, overlap_tokens=0))
+    assert [chunk["metadata"]["token_count"] for chunk in chunks] == [20, 20, 10]
+    assert " ".join(chunk["text"] for chunk in chunks) == sentence
@@ -0,0 +1,135 @@
+import numpy as np
+
+from app.services.numpy_index import NumpyVectorStore
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def add_clauses(store):
+    store.upsert(
+        ["a_1", "a_2", "b_1"],
+        np.stack([unit(1, 0, 0, 0), unit(0, 1, 0, 0), unit(1, 1, 0, 0)]),
+        ["knee surgery", "cataract surgery", "knee replacement"],
+        [
+            {"filename": "a.pdf", "page": 1, "section": "Benefits"},
+            {"filename": "a.pdf", "page": 2},
+            {"filename": "b.pdf", "page": 1},
+        ],
+    )
+
+
+def ids(hits):
+    return [hit["id"] for hit in hits]
+
+
+def test_upsert_query_and_get(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "index"))
+    add_clauses(store)
+    assert store.count() == 3
+
+    [hits] = store.query(unit(1, 0.1, 0, 0).reshape(1, -1), n_results=2)
+    assert ids(hits) == ["a_1", "b_1"]
+    assert hits[0]["text"] == "knee surgery" and hits[0]["metadata"]["section"] == "Benefits"
+    assert hits[0]["score"] > hits[1]["score"]
+
+    # One result list per query embedding
+    first, second = store.query(np.stack([unit(0, 1, 0, 0), unit(1, 1, 0, 0)]), n_results=1)
+    assert ids(first) == ["a_2"] and ids(second) == ["b_1"]
+
+    for where in ({"filename": "b.pdf"}, {"filename": {"$eq": "b.pdf"}}, {"filename": {"$in": ["b.pdf", "missing.pdf"]}}):
+        assert ids(store.query(unit(1, 0, 0, 0).reshape(1, -1), 5, where)[0]) == ["b_1"]
+
+    assert [record["id"] for record in store.get(["b_1", "missing", "a_1"])] == ["b_1", "a_1"]
+
+    # Upserting an existing id replaces it in place
+    store.upsert(["a_1"], unit(0, 0, 1, 0).reshape(1, -1), ["knee surgery (amended)"], [{"filename": "a.pdf", "page": 1}])
+    assert store.count() == 3
+    assert ids(store.query(unit(0, 0, 1, 0).reshape(1, -1), 1)[0]) == ["a_1"]
+    assert store.get(["a_1"])[0]["text"] == "knee surgery (amended)"
+
+
+def test_delete_leaves_tombstones(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "index"))
+    add_clauses(store)
+
+    store.delete(["a_1", "missing"])
+    assert store.count() == 2
+    assert "a_1" not in ids(store.query(unit(1, 0, 0, 0).reshape(1, -1), 5)[0])
+    assert store.get(["a_1"]) == []
+
+    # Re-adding a deleted id revives its row
+    store.upsert(["a_1"], unit(1, 0, 0, 0).reshape(1, -1), ["knee surgery"], [{"filename": "a.pdf", "page": 1}])
+    assert store.count() == 3
+    assert ids(store.query(unit(1, 0, 0, 0).reshape(1, -1), 1)[0]) == ["a_1"]
+
+
+def test_delete_file(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "index"))
+    add_clauses(store)
+
+    store.delete_file("a.pdf")
+    assert store.count() == 1
+    assert ids(store.query(unit(1, 0, 0, 0).reshape(1, -1), 5)[0]) == ["b_1"]
+    assert store.query(unit(1, 0, 0, 0).reshape(1, -1), 5, {"filename": "a.pdf"}) == [[]]
+    store.delete_file("missing.pdf")
+    assert store.count() == 1
+
+
+def test_update_metadata_replaces_it(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "index"))
+    add_clauses(store)
+
+    store.update_metadata(["a_1", "missing"], [{"filename": "b.pdf", "page": 3}, {"filename": "b.pdf"}])
+    assert store.get(["a_1"])[0]["metadata"] == {"filename": "b.pdf", "page": 3}
+    assert store.count() == 3
+    # Filename filters follow the new metadata
+    assert ids(store.query(unit(1, 0, 0, 0).reshape(1, -1), 5, {"filename": "a.pdf"})[0]) == ["a_2"]
+    assert ids(store.query(unit(1, 0, 0, 0).reshape(1, -1), 5, {"filename": "b.pdf"})[0]) == ["a_1", "b_1"]
+
+
+def test_reopening_from_disk(tmp_path):
+    path = str(tmp_path / "index")
+    store = NumpyVectorStore(path)
+    rng = np.random.default_rng(0)
+    # More rows than the initial capacity, so the memory-mapped matrix is grown once
+    vectors = rng.normal(size=(1500, 8)).astype(np.float32)
+    store.upsert([f"c_{i}" for i in range(1500)], vectors, [f"chunk {i}" for i in range(1500)], [{"filename": f"{i % 3}.pdf"} for i in range(1500)])
+    store.delete(["c_0"])
+    store.delete_file("2.pdf")
+    store.update_metadata(["c_1"], [{"filename": "0.pdf", "moved": True}])
+    expected = store.query(vectors[:5], 10)
+
+    reopened = NumpyVectorStore(path)
+    assert reopened.load() == store.count() == 999
+    assert reopened.query(vectors[:5], 10) == expected
+    assert reopened.get(["c_0", "c_2"]) == []
+    assert reopened.get(["c_1"])[0]["metadata"] == {"filename": "0.pdf", "moved": True}
+    assert ids(reopened.query(vectors[1:2], 1, {"filename": "0.pdf"})[0]) == ["c_1"]
+
+
+def test_ivf_recall_against_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(40, 32))
+    vectors = (centers[rng.integers(0, 40, size=4000)] + 0.3 * rng.normal(size=(4000, 32))).astype(np.float32)
+    queries = (centers[rng.integers(0, 40, size=50)] + 0.3 * rng.normal(size=(50, 32))).astype(np.float32)
+    args = ([f"c_{i}" for i in range(4000)], vectors, [f"chunk {i}" for i in range(4000)], [{"filename": f"{i % 4}.pdf"} for i in range(4000)])
+
+    ivf = NumpyVectorStore(str(tmp_path / "ivf"), ivf_min_rows=1000, nprobe=8)
+    ivf.upsert(*args)
+    brute = NumpyVectorStore(str(tmp_path / "brute"), ivf_min_rows=0)
+    brute.upsert(*args)
+    assert ivf._centroids is not None and brute._centroids is None
+
+    found = [set(ids(hits)) for hits in ivf.query(queries, 10)]
+    exact = [set(ids(hits)) for hits in brute.query(queries, 10)]
+    recall = np.mean([len(a & b) / len(b) for a, b in zip(found, exact)])
+    assert recall >= 0.9
+
+    # The trained centroids are reused after a restart
+    reopened = NumpyVectorStore(str(tmp_path / "ivf"), ivf_min_rows=1000, nprobe=8)
+    reopened.load()
+    assert np.array_equal(reopened._centroids, ivf._centroids)
+    assert [set(ids(hits)) for hits in reopened.query(queries, 10)] == found
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services import context_packer, providers
+from app.services.llm import build_reasoning_prompt
+from app.services.providers import CircuitBreaker, ProviderError, ProviderRouter, StubProvider
+
+CHUNKS = [
+    {"text": f"Clause {i} covers treatment number {i} up to Rs {i}000 after a waiting period of {i} months.", "metadata": {"clause_number": str(i)}}
+    for i in range(1, 41)
+]
+
+
+def test_each_provider_gets_a_prompt_packed_to_its_budget(monkeypatch):
+    monkeypatch.setattr(context_packer, "PROMPT_TOKEN_BUDGETS", {"openai": 1500, "ollama": 600})
+    sent = {}
+
+    def answer(name):
+        def respond(prompt):
+            sent[name] = context_packer.count_tokens(prompt)
+            return '{"decision": "approved"}'
+        return respond
+
+    router = ProviderRouter([
+        StubProvider("openai", response=answer("openai"), error=RuntimeError("unavailable")),
+        StubProvider("ollama", response=answer("ollama")),
+    ], hedging=False)
+    built = []
+
+    def prompt(provider):
+        built.append(provider)
+        return build_reasoning_prompt({"procedure": "knee surgery"}, CHUNKS, query="knee surgery", provider=provider)
+
+    assert asyncio.run(router.complete(prompt)) == '{"decision": "approved"}'
+    assert built == ["openai", "ollama"]
+    assert sent["ollama"] <= 600
+    assert 600 < context_packer.count_tokens(prompt("openai")) <= 1500
+
+
+def test_a_slow_provider_is_hedged_after_its_delay(monkeypatch):
+    monkeypatch.setattr(providers, "LLM_HEDGE_INITIAL_DELAY", 0.1)
+    slow, fast = StubProvider("slow", latency=1.0, response="slow"), StubProvider("fast", response="fast")
+    router = ProviderRouter([slow, fast])
+
+    started = time.perf_counter()
+    assert asyncio.run(router.complete("prompt")) == "fast"
+    assert 0.1 <= time.perf_counter() - started < 0.5
+    assert router.hedged_calls == 1
+    assert slow.breaker.state == "closed"
+
+
+def test_a_hedged_stream_follows_the_first_to_answer(monkeypatch):
+    monkeypatch.setattr(providers, "LLM_HEDGE_INITIAL_DELAY", 0.1)
+    slow = StubProvider("slow", latency=1.0, response="slow answer")
+    fast = StubProvider("fast", latency=0.2, first_token_latency=0.05, response='{"decision": "approved"}')
+    router = ProviderRouter([slow, fast])
+
+    async def collect():
+        return [delta async for delta in router.stream("prompt")]
+
+    started = time.perf_counter()
+    assert "".join(asyncio.run(collect())) == '{"decision": "approved"}'
+    assert time.perf_counter() - started < 0.8
+    assert router.hedged_calls == 1
+    # The latency sample is the time to the first delta, not to the end of the stream
+    assert len(fast.latencies) == 1 and fast.latencies[0] < 0.15
+    assert not slow.latencies
+
+
+def test_failover_when_a_provider_raises():
+    down, up = StubProvider("down", error=RuntimeError("connection refused")), StubProvider("up", response="ok")
+    down.breaker = CircuitBreaker(threshold=10)
+    router = ProviderRouter([down, up], hedging=False)
+
+    async def collect():
+        return [delta async for delta in router.stream("prompt")]
+
+    assert asyncio.run(router.complete("prompt")) == "ok"
+    assert router.complete_sync("prompt") == "ok"
+    assert "".join(asyncio.run(collect())) == "ok"
+    assert (down.failures, up.calls) == (3, 3)
+
+    up.error = RuntimeError("timed out")
+    with pytest.raises(ProviderError, match="down: connection refused; up: timed out"):
+        asyncio.run(router.complete("prompt"))
+
+
+def test_breaker_opens_after_consecutive_failures():
+    down, up = StubProvider("down", error=RuntimeError("unavailable")), StubProvider("up", response="ok")
+    down.breaker = CircuitBreaker(threshold=2, reset_seconds=60)
+    router = ProviderRouter([down, up], hedging=False)
+
+    assert asyncio.run(router.complete("prompt")) == "ok"
+    assert down.breaker.state == "closed"
+    assert asyncio.run(router.complete("prompt")) == "ok"
+    assert down.breaker.state == "open"
+    # An open circuit is skipped
+    assert asyncio.run(router.complete("prompt")) == "ok"
+    assert down.calls == 2
+
+
+def test_half_open_trial_closes_or_reopens_the_circuit():
+    flaky, backup = StubProvider("flaky", error=RuntimeError("unavailable")), StubProvider("backup", response="backup")
+    flaky.breaker = CircuitBreaker(threshold=1, reset_seconds=0.05)
+    router = ProviderRouter([flaky, backup], hedging=False)
+
+    asyncio.run(router.complete("prompt"))
+    assert flaky.breaker.state == "open"
+    time.sleep(0.06)
+    assert flaky.breaker.state == "half_open"
+    # A failed trial re-opens the circuit at once
+    assert asyncio.run(router.complete("prompt")) == "backup"
+    assert flaky.breaker.state == "open"
+
+    time.sleep(0.06)
+    flaky.error = None
+    flaky.response = "flaky"
+    assert asyncio.run(router.complete("prompt")) == "flaky"
+    assert flaky.breaker.state == "closed"
+    assert flaky.calls == 3
+
+
+def test_half_open_circuit_admits_a_single_trial():
+    breaker = CircuitBreaker(threshold=1, reset_seconds=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    barrier = threading.Barrier(16)
+    admitted = []
+
+    def acquire():
+        barrier.wait()
+        admitted.append(breaker.try_acquire())
+
+    threads = [threading.Thread(target=acquire) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert admitted.count(True) == 1
+    breaker.cancel_call()
+    assert breaker.try_acquire()
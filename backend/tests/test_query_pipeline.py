@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services import query_pipeline
+from app.services.query_pipeline import extract_query_fields, structure_query
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("46M, knee surgery, Pune, 3-month policy",
+     {"age": 46, "gender": "male", "procedure": "knee surgery", "location": "Pune", "policy_duration_months": 3}),
+    ("46-year-old male, knee surgery in Pune, 3-month-old insurance policy",
+     {"age": 46, "gender": "male", "procedure": "knee surgery", "location": "Pune", "policy_duration_months": 3}),
+    ("female 32 needs cataract surgery under the Arogya Sanjeevani policy",
+     {"age": 32, "gender": "female", "procedure": "cataract surgery", "location": None, "policy_name": "Arogya Sanjeevani"}),
+    ("Claim for hip replacement, 2 year old policy",
+     {"age": None, "procedure": "hip replacement", "policy_duration_months": 24}),
+    ("46M, knee surgery at Apollo hospital in Chennai, 3-month policy",
+     {"procedure": "knee surgery", "location": "Chennai"}),
+    ("F 60, angioplasty in Nashik Road, policy taken 6 months ago",
+     {"age": 60, "gender": "female", "procedure": "angioplasty", "location": "Nashik", "policy_duration_months": 6}),
+    ("58 year old man, dialysis at Apollo Hospital",
+     {"age": 58, "gender": "male", "procedure": "dialysis", "location": None}),
+])
+def test_claims_use_the_fast_path(query, expected):
+    fields = extract_query_fields(query)
+    assert fields is not None
+    assert {name: fields[name] for name in expected} == expected
+
+
+@pytest.mark.parametrize("query", [
+    "What is the waiting period for cataract surgery?",
+    "Does this policy cover maternity expenses?",
+    "knee surgery",
+    "Is room rent capped?",
+])
+def test_questions_and_bare_procedures_fall_back_to_the_llm(query):
+    assert extract_query_fields(query) is None
+
+
+def test_procedure_stops_at_lead_in_words():
+    fields = extract_query_fields("32F, is the waiting period for cataract surgery over?")
+    assert fields["procedure"] == "cataract surgery"
+
+
+@pytest.mark.parametrize("response", ["null", "[1, 2]", '"knee surgery"', "not json"])
+def test_llm_structuring_always_returns_a_dict(monkeypatch, response):
+    async def fake_llm(prompt):
+        return response
+
+    monkeypatch.setattr(query_pipeline, "run_llm_with_priority_async", fake_llm)
+    structured, source = asyncio.run(structure_query("Does this policy cover maternity expenses?"))
+    assert source == "llm"
+    assert structured == {"raw_query": "Does this policy cover maternity expenses?", "llm_parse": response}
+
+
+def test_llm_structuring_returns_the_parsed_object(monkeypatch):
+    async def fake_llm(prompt):
+        return json.dumps({"procedure": "maternity", "age": None})
+
+    monkeypatch.setattr(query_pipeline, "run_llm_with_priority_async", fake_llm)
+    structured, _ = asyncio.run(structure_query("Does this policy cover maternity expenses?"))
+    assert structured == {"procedure": "maternity", "age": None}
@@ -0,0 +1,134 @@
+import asyncio
+import gc
+import io
+
+import pytest
+
+from app.services import chunker, jobs
+from app.services.jobs import IngestionQueue, JobStore
+from app.services.registry import DocumentRegistry
+from app.services.vectorstore import chunk_vector_id
+
+CLAUSES = [
+    "1.1 Knee Surgery\nKnee surgery is covered up to Rs 200000 after 24 months.",
+    "1.2 Cataract Surgery\nCataract surgery is covered up to Rs 40000 after 12 months.",
+    "1.3 Dialysis\nDialysis is covered from the first day of the policy.",
+]
+
+
+def test_registry_replace_and_forget(tmp_path):
+    registry = DocumentRegistry(str(tmp_path / "registry.db"))
+    assert registry.file_hash("policy.pdf") is None
+    registry.replace("policy.pdf", "hash-1", {"a": "m1", "b": "m2"}, {"page-1": "text of page one"})
+    assert registry.file_hash("policy.pdf") == "hash-1"
+    assert registry.chunks("policy.pdf") == {"a": "m1", "b": "m2"}
+    assert registry.page_texts("policy.pdf") == {"page-1": "text of page one"}
+
+    registry.replace("policy.pdf", "hash-2", {"b": "m3"})
+    assert registry.chunks("policy.pdf") == {"b": "m3"}
+    assert registry.page_texts("policy.pdf") == {}
+
+    registry.forget("policy.pdf")
+    assert registry.file_hash("policy.pdf") is None
+    assert registry.chunks("policy.pdf") == {}
+
+
+@pytest.fixture
+def ingestion(tmp_path, monkeypatch):
+    # A queue over temporary job and registry databases; embedding and indexing only record what they were given
+    calls = {"embedded": [], "deleted": [], "updated": []}
+    indexed = {}
+
+    async def encode_async(texts):
+        calls["embedded"].extend(texts)
+        return [[0.0]] * len(texts)
+
+    async def index_chunks_async(chunks, embeddings):
+        indexed.update((chunk_vector_id(chunk), chunk["metadata"]["filename"]) for chunk in chunks)
+        return len(chunks)
+
+    def delete_chunks(ids):
+        calls["deleted"].extend(ids)
+        for id_ in ids:
+            indexed.pop(id_, None)
+
+    def delete_file(filename):
+        for id_ in [id_ for id_, name in indexed.items() if name == filename]:
+            del indexed[id_]
+
+    def is_indexed(filename, ids):
+        return sorted(ids) == sorted(id_ for id_, name in indexed.items() if name == filename)
+
+    registry = DocumentRegistry(str(tmp_path / "registry.db"))
+    monkeypatch.setattr(chunker, "count_tokens", lambda texts: [chunker._approx_count(text) for text in texts])
+    monkeypatch.setattr(jobs, "get_registry", lambda: registry)
+    monkeypatch.setattr(jobs, "encode_async", encode_async)
+    monkeypatch.setattr(jobs, "index_chunks_async", index_chunks_async)
+    monkeypatch.setattr(jobs, "delete_file", delete_file)
+    monkeypatch.setattr(jobs, "delete_chunks", delete_chunks)
+    monkeypatch.setattr(jobs, "is_indexed", is_indexed)
+    monkeypatch.setattr(jobs, "update_chunk_metadata", lambda chunks: calls["updated"].extend(chunks))
+    monkeypatch.setattr(jobs, "invalidate_answers", lambda filenames: 0)
+    queue = IngestionQueue(store=JobStore(str(tmp_path / "jobs.db")), workers=2, spool_dir=str(tmp_path / "spool"))
+
+    async def ingest(*uploads):
+        # Uploads (filename, text) are submitted together; returns their finished jobs in order
+        await queue.start()
+        try:
+            job_ids = [await queue.submit(io.BytesIO(text.encode()), filename) for filename, text in uploads]
+            while any(queue.store.get(job_id)["status"] not in ("completed", "failed") for job_id in job_ids):
+                await asyncio.sleep(0.01)
+            return [queue.store.get(job_id) for job_id in job_ids]
+        finally:
+            await queue.stop()
+
+    return queue, ingest, calls, indexed
+
+
+def test_reingestion_diffs_against_the_registry(ingestion):
+    queue, ingest, calls, _ = ingestion
+    text = "\n".join(CLAUSES)
+
+    [job] = asyncio.run(ingest(("policy.txt", text)))
+    assert job["status"] == "completed"
+    assert job["changes"]["added"] == 3
+    assert len(calls["embedded"]) == 3
+
+    [job] = asyncio.run(ingest(("policy.txt", text)))
+    assert job["changes"]["file_unchanged"] is True
+    assert len(calls["embedded"]) == 3
+
+    amended = text.replace("Rs 40000", "Rs 50000")
+    [job] = asyncio.run(ingest(("policy.txt", amended)))
+    assert {name: job["changes"][name] for name in ("added", "moved", "unchanged", "removed")} == {"added": 1, "moved": 0, "unchanged": 2, "removed": 1}
+    assert calls["embedded"][-1] == "1.2 Cataract Surgery Cataract surgery is covered up to Rs 50000 after 12 months."
+    assert len(calls["deleted"]) == 1
+
+    # Same clauses in another order: nothing is embedded again, the moved chunks get new metadata
+    reordered = "\n".join([CLAUSES[2], CLAUSES[0], CLAUSES[1].replace("Rs 40000", "Rs 50000")])
+    [job] = asyncio.run(ingest(("policy.txt", reordered)))
+    assert job["changes"]["added"] == 0 and job["changes"]["moved"] == 3
+    assert len(calls["embedded"]) == 4
+
+
+def test_file_locks_are_released(ingestion):
+    queue, ingest, _, _ = ingestion
+    finished = asyncio.run(ingest(("a.txt", CLAUSES[0]), ("a.txt", CLAUSES[1]), ("b.txt", CLAUSES[2])))
+    assert [job["status"] for job in finished] == ["completed"] * 3
+    gc.collect()
+    assert len(queue._file_locks) == 0
+
+
+def test_reupload_after_the_indexes_were_lost(ingestion):
+    # An in-memory vector store starts empty after a restart while the registry on disk still lists the file
+    _, ingest, calls, indexed = ingestion
+    text = "\n".join(CLAUSES)
+    asyncio.run(ingest(("policy.txt", text)))
+    indexed.clear()
+
+    [job] = asyncio.run(ingest(("policy.txt", text)))
+    assert job["status"] == "completed"
+    assert not job["changes"].get("file_unchanged")
+    assert job["changes"]["added"] == 3
+    assert len(calls["embedded"]) == 6
+    assert len(indexed) == 3
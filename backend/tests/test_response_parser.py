@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from app.services.response_parser import FALLBACK_RESPONSE, ResponseParser, decode_tolerant, parse_llm_response
+
+ANSWER = {
+    "decision": "approved",
+    "amount": 50000,
+    "justification": "Clause 4.1 covers knee surgery after 24 months.",
+    "summary": "Covered.",
+    "clauses_used": ["Clause 4.1"],
+    "confidence": 0.9,
+}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1, "b": [1, 2]}', {"a": 1, "b": [1, 2]}),
+    ("Here you go:\n```json\n{'a': 'it's fine', b: True,}\n```", {"a": "it's fine", "b": True}),
+    ('{"a": 1, // comment\n "b": null}', {"a": 1, "b": None}),
+    ('{"a": "cut off', {"a": "cut off"}),
+    ('{"a": [1, {"b": 2', {"a": [1, {"b": 2}]}),
+])
+def test_decode_tolerant(text, expected):
+    assert decode_tolerant(text) == expected
+
+
+def test_decode_tolerant_without_json():
+    with pytest.raises(ValueError):
+        decode_tolerant("I cannot answer that.")
+
+
+def test_well_formed_answer():
+    assert parse_llm_response(json.dumps(ANSWER)) == ANSWER
+
+
+def test_fields_are_normalised():
+    raw = '{"decision": " approved ", "amount": "₹1,50,000", "justification": "x", "summary": "y", "clauses_used": "Clause 2", "confidence": "1.5"}'
+    parsed = parse_llm_response(raw)
+    assert parsed["decision"] == "approved"
+    assert parsed["amount"] == 150000
+    assert parsed["clauses_used"] == ["Clause 2"]
+    assert parsed["confidence"] == 1.0
+
+
+def test_missing_fields_fall_back():
+    assert parse_llm_response('{"decision": "approved"}') == FALLBACK_RESPONSE
+    assert parse_llm_response("no json here") == FALLBACK_RESPONSE
+
+
+def test_streamed_fields_complete_as_they_arrive():
+    raw = json.dumps(ANSWER)
+    parser = ResponseParser()
+    completed = []
+    for i in range(0, len(raw), 5):
+        completed.extend(parser.feed(raw[i:i + 5]))
+    assert [name for name, _ in completed] == list(ANSWER)
+    assert parser.finish() == ANSWER
+    assert parser.valid
+
+
+def test_truncated_stream_keeps_completed_fields():
+    raw = json.dumps(ANSWER)
+    parser = ResponseParser()
+    parser.feed(raw[:raw.index('"confidence"') + len('"confidence": 0.9')])
+    assert parser.finish() == ANSWER
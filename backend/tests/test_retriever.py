@@ -0,0 +1,54 @@
+import pytest
+
+from app.services import retriever
+from app.services.lexical_index import LexicalIndex
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = LexicalIndex(str(tmp_path / "lexical.db"))
+    monkeypatch.setattr(retriever, "get_lexical_index", lambda: index)
+    monkeypatch.setattr(retriever, "_lookup", None)
+    return index
+
+
+def add_document(index, filename, text):
+    index.add([f"{filename}_0"], [text], [{"filename": filename, "page": 1, "chunk_id": 0}])
+
+
+def test_policy_ids_match_exactly(index):
+    add_document(index, "HDF-001_terms.pdf", "HDFC Optima Secure terms and conditions.")
+    add_document(index, "bajaj-BAJHLIP23020V012223.pdf", "Global Health Care policy wording.")
+    add_document(index, "star.pdf", "Star Comprehensive Insurance Policy. UIN: SHAHLIP22028V072122")
+
+    assert retriever.resolve_filenames({"policy_id": "HDF-001"}) == ["HDF-001_terms.pdf"]
+    assert retriever.resolve_filenames({"policy_id": "hdf 001"}) == ["HDF-001_terms.pdf"]
+    assert retriever.resolve_filenames({"policy_id": "BAJHLIP23020V012223"}) == ["bajaj-BAJHLIP23020V012223.pdf"]
+    assert retriever.resolve_filenames({"policy_id": "SHAHLIP22028V072122"}) == ["star.pdf"]
+    # Part of an id is not the id
+    assert retriever.resolve_filenames({"policy_id": "001"}) is None
+    assert retriever.resolve_filenames({"policy_id": "23020"}) is None
+    assert retriever.resolve_filenames({"policy_id": "pdf"}) is None
+
+
+def test_policy_names_match_filename_and_title(index):
+    add_document(index, "optima.pdf", "HDFC Optima Secure terms and conditions.")
+    add_document(index, "global-health.pdf", "Bajaj Allianz policy wording.")
+
+    assert retriever.resolve_filenames({"policy_name": "Optima Secure Policy"}) == ["optima.pdf"]
+    assert retriever.resolve_filenames({"policy_name": "Global Health Plan"}) == ["global-health.pdf"]
+    assert retriever.resolve_filenames({"policy_name": "Optima Restore"}) is None
+    assert retriever.resolve_filenames(None) is None
+
+
+def test_policy_lookup_is_rebuilt_only_after_the_index_changes(index):
+    add_document(index, "HDF-001_terms.pdf", "HDFC Optima Secure terms and conditions.")
+    lookup = retriever._policy_lookup()
+    assert retriever._policy_lookup() is lookup
+
+    add_document(index, "HDF-002_terms.pdf", "HDFC Optima Restore terms and conditions.")
+    assert retriever.resolve_filenames({"policy_id": "HDF-002"}) == ["HDF-002_terms.pdf"]
+    assert retriever._policy_lookup() is not lookup
+
+    index.delete_file("HDF-001_terms.pdf")
+    assert retriever.resolve_filenames({"policy_id": "HDF-001"}) is None
@@ -0,0 +1,36 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from app.services import vectorstore
+from app.services.vectorstore import ChromaStore
+
+chromadb = pytest.importorskip("chromadb")
+
+
+@pytest.fixture
+def chroma_store(monkeypatch):
+    # A fresh collection on an in-memory client
+    monkeypatch.setattr(vectorstore, "_client", chromadb.EphemeralClient())
+    monkeypatch.setattr(vectorstore, "_collections", {})
+    store = ChromaStore(f"test-{uuid.uuid4().hex}")
+    yield store
+    vectorstore.get_chroma_client().delete_collection(store.collection_name)
+
+
+def test_chroma_update_metadata_replaces_it(chroma_store):
+    chroma_store.upsert(
+        ["a", "b"],
+        np.eye(2, dtype=np.float32),
+        ["first clause", "second clause"],
+        [
+            {"filename": "policy.pdf", "page": 1, "section": "Exclusions", "clause_number": "4.1"},
+            {"filename": "policy.pdf", "page": 1, "section": "Benefits"},
+        ],
+    )
+    chroma_store.update_metadata(["a", "b"], [{"filename": "policy.pdf", "page": 2}, {"filename": "policy.pdf", "page": 3, "section": "Waiting Periods"}])
+
+    found = {record["id"]: record["metadata"] for record in chroma_store.get(["a", "b"])}
+    assert found["a"] == {"filename": "policy.pdf", "page": 2}
+    assert found["b"] == {"filename": "policy.pdf", "page": 3, "section": "Waiting Periods"}